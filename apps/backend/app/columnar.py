@@ -0,0 +1,204 @@
+import json
+import zipfile
+from pathlib import Path
+from typing import Iterator
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from app.table_ops import write_xlsx_rows
+
+try:  # Optional: installed with the "columnar" extra.
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.json as pa_json
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+TABLE_FORMATS = {"csv", "xlsx", "jsonl", "parquet", "arrow"}
+TABLE_FORMAT_ALIASES = {"ndjson": "jsonl", "feather": "arrow", "ipc": "arrow"}
+TABLE_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+# Rows per record batch read from XLSX; the other readers use their own blocks.
+XLSX_BATCH_ROWS = 10_000
+ARROW_FILE_MAGIC = b"ARROW1"
+
+
+class TableConversionError(ValueError):
+    pass
+
+
+def table_format(value: str | None) -> str | None:
+    key = (value or "").strip().lower().lstrip(".")
+    key = TABLE_FORMAT_ALIASES.get(key, key)
+    return key if key in TABLE_FORMATS else None
+
+
+def _xlsx_column(values: tuple, field_type: "pa.DataType | None") -> "pa.Array":
+    """Build one column; mixed or later-changing cells fall back to text."""
+    if field_type is not None and not pa.types.is_string(field_type):
+        try:
+            return pa.array(values, type=field_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as exc:
+            raise TableConversionError(
+                f"column type changes after the first {XLSX_BATCH_ROWS} rows"
+            ) from exc
+    if field_type is None:
+        try:
+            array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = None
+        if array is not None and not pa.types.is_null(array.type):
+            return array
+    return pa.array(
+        [None if value is None else str(value) for value in values], type=pa.string()
+    )
+
+
+def _xlsx_batches(path: Path) -> tuple["pa.Schema", Iterator["pa.RecordBatch"]]:
+    """Read the first sheet row by row; the first batch fixes the schema."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    header = next(rows, ())
+    names: list[str] = []
+    for index, value in enumerate(header):
+        name = str(value) if value is not None else f"column_{index + 1}"
+        while name in names:
+            name = f"{name}_{index + 1}"
+        names.append(name)
+
+    def chunks() -> Iterator[list[tuple]]:
+        chunk = []
+        for row in rows:
+            chunk.append(tuple(row[: len(names)]) + (None,) * (len(names) - len(row)))
+            if len(chunk) == XLSX_BATCH_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    pending = chunks()
+    first = next(pending, [])
+    columns = list(zip(*first)) if first else [()] * len(names)
+    arrays = [_xlsx_column(column, None) for column in columns]
+    schema = pa.schema(
+        [pa.field(name, array.type) for name, array in zip(names, arrays)]
+    )
+
+    def batches() -> Iterator["pa.RecordBatch"]:
+        try:
+            if first:
+                yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+            for chunk in pending:
+                yield pa.RecordBatch.from_arrays(
+                    [
+                        _xlsx_column(column, field.type)
+                        for column, field in zip(zip(*chunk), schema)
+                    ],
+                    schema=schema,
+                )
+        finally:
+            workbook.close()
+
+    return schema, batches()
+
+
+def _read_batches(
+    path: Path, source: str
+) -> tuple["pa.Schema", Iterator["pa.RecordBatch"]]:
+    if source == "csv":
+        reader = pa_csv.open_csv(path)
+        return reader.schema, iter(reader)
+    if source == "jsonl":
+        reader = pa_json.open_json(path)
+        return reader.schema, iter(reader)
+    if source == "parquet":
+        parquet = pq.ParquetFile(path)
+        return parquet.schema_arrow, parquet.iter_batches()
+    if source == "arrow":
+        with path.open("rb") as handle:
+            is_file = handle.read(len(ARROW_FILE_MAGIC)) == ARROW_FILE_MAGIC
+        if is_file:
+            reader = pa_ipc.open_file(path)
+            return reader.schema, (
+                reader.get_batch(index) for index in range(reader.num_record_batches)
+            )
+        reader = pa_ipc.open_stream(path)
+        return reader.schema, iter(reader)
+    return _xlsx_batches(path)
+
+
+def _write_batches(
+    path: Path,
+    target: str,
+    schema: "pa.Schema",
+    batches: Iterator["pa.RecordBatch"],
+) -> int:
+    rows = 0
+    if target == "xlsx":
+
+        def cells() -> Iterator[tuple]:
+            nonlocal rows
+            for batch in batches:
+                rows += batch.num_rows
+                columns = [column.to_pylist() for column in batch.columns]
+                yield from zip(*columns)
+
+        write_xlsx_rows(schema.names, cells(), path)
+        return rows
+    if target == "jsonl":
+        with path.open("w", encoding="utf-8") as output:
+            for batch in batches:
+                rows += batch.num_rows
+                output.writelines(
+                    json.dumps(record, default=str, ensure_ascii=False) + "\n"
+                    for record in batch.to_pylist()
+                )
+        return rows
+
+    if target == "csv":
+        writer = pa_csv.CSVWriter(path, schema)
+    elif target == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    else:
+        writer = pa_ipc.new_file(path, schema)
+    with writer:
+        for batch in batches:
+            rows += batch.num_rows
+            writer.write_batch(batch)
+    return rows
+
+
+def convert_table(input_path: Path, output_path: Path, source: str, target: str) -> int:
+    """Convert between table formats one record batch at a time.
+
+    Nothing holds more than a batch: CSV and JSON Lines are parsed block by
+    block, Parquet by row group, Arrow IPC by record batch, XLSX through
+    openpyxl's read-only and write-only modes. Column types come from the
+    first block; a later block that doesn't fit them raises
+    TableConversionError, as do values the target format can't hold (e.g.
+    nested lists in CSV). Returns the row count. Runs in the process pool.
+    """
+    try:
+        schema, batches = _read_batches(input_path, source)
+        return _write_batches(output_path, target, schema, batches)
+    except TableConversionError:
+        raise
+    except (
+        pa.ArrowException,
+        InvalidFileException,
+        zipfile.BadZipFile,
+        ValueError,
+        TypeError,
+        KeyError,
+        OSError,
+    ) as exc:
+        # Pool results are pickled; keep only the message, not the pyarrow type.
+        raise TableConversionError(f"{type(exc).__name__}: {exc}") from None
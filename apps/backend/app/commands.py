@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+from pathlib import Path
+from typing import Callable
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger("localforge")
+
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_CONCURRENCY = 4
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Upper bound on simultaneous processes per binary; CPU-heavy tools get less.
+TOOL_CONCURRENCY = {
+    "ffmpeg": max(1, (os.cpu_count() or 2) // 2),
+    "ffprobe": 8,
+    "gs": max(1, (os.cpu_count() or 2) // 2),
+    "pandoc": 2,
+    "ping": 8,
+}
+
+TOOL_TIMEOUTS = {
+    "ping": 20.0,
+    "ffprobe": 30.0,
+}
+
+_semaphores: dict[str, asyncio.Semaphore] = {}
+
+LineCallback = Callable[[str], None]
+
+
+def _tool_name(executable: str) -> str:
+    return Path(executable).name
+
+
+def tool_limit(tool: str) -> int:
+    """How many processes of a tool may run at once, across all requests."""
+    env_name = f"{tool.upper()}_CONCURRENCY"
+    limit = TOOL_CONCURRENCY.get(tool, DEFAULT_CONCURRENCY)
+    try:
+        limit = max(1, int(os.getenv(env_name, limit)))
+    except ValueError:
+        logger.warning("config.invalid name=%s", env_name)
+    return limit
+
+
+def _semaphore_for(tool: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(tool)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(tool_limit(tool))
+        _semaphores[tool] = semaphore
+    return semaphore
+
+
+def _kill_process_group(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def _read_lines(
+    stream: asyncio.StreamReader, callback: LineCallback | None
+) -> bytes:
+    chunks = []
+    while line := await stream.readline():
+        chunks.append(line)
+        if callback is not None:
+            callback(line.decode(errors="replace"))
+    return b"".join(chunks)
+
+
+async def _communicate(
+    process: asyncio.subprocess.Process,
+    on_stdout_line: LineCallback | None,
+    on_stderr_line: LineCallback | None,
+) -> tuple[bytes, bytes]:
+    if on_stdout_line is None and on_stderr_line is None:
+        return await process.communicate()
+    assert process.stdout is not None and process.stderr is not None
+    stdout, stderr = await asyncio.gather(
+        _read_lines(process.stdout, on_stdout_line),
+        _read_lines(process.stderr, on_stderr_line),
+    )
+    await process.wait()
+    return stdout, stderr
+
+
+async def run_command(
+    args: list[str],
+    *,
+    request: Request | None = None,
+    timeout: float | None = None,
+    on_stdout_line: LineCallback | None = None,
+    on_stderr_line: LineCallback | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """Run an external tool without blocking the event loop.
+
+    The process gets its own session so a timeout, a client disconnect, or
+    task cancellation kills the whole process group (LibreOffice and pandoc
+    both spawn helpers). The caller decides what a non-zero exit means.
+    Line callbacks see output as it is produced, e.g. ffmpeg -progress.
+    """
+    tool = _tool_name(args[0])
+    if timeout is None:
+        timeout = TOOL_TIMEOUTS.get(tool, DEFAULT_TIMEOUT)
+
+    async with _semaphore_for(tool):
+        logger.info("command.run tool=%s", tool)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+            )
+        except FileNotFoundError as exc:
+            logger.error("dependency.missing name=%s", tool)
+            raise HTTPException(
+                status_code=501,
+                detail="Required system dependency is not available.",
+            ) from exc
+
+        communicate = asyncio.ensure_future(
+            _communicate(process, on_stdout_line, on_stderr_line)
+        )
+        waiters: set[asyncio.Future] = {communicate}
+        disconnect = None
+        if request is not None:
+            disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+            waiters.add(disconnect)
+
+        try:
+            done, _ = await asyncio.wait(
+                waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if communicate not in done:
+                _kill_process_group(process)
+                await communicate
+                if disconnect is not None and disconnect in done:
+                    logger.warning("command.cancelled tool=%s reason=disconnect", tool)
+                    raise HTTPException(
+                        status_code=499, detail="Client closed request."
+                    )
+                logger.error("command.timeout tool=%s timeout=%s", tool, timeout)
+                raise HTTPException(status_code=504, detail="Processing timed out.")
+        except asyncio.CancelledError:
+            _kill_process_group(process)
+            raise
+        finally:
+            if disconnect is not None:
+                disconnect.cancel()
+
+        stdout, stderr = communicate.result()
+        returncode = await process.wait()
+        return subprocess.CompletedProcess(
+            args,
+            returncode,
+            stdout.decode(errors="replace"),
+            stderr.decode(errors="replace"),
+        )
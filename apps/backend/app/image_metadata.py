@@ -0,0 +1,193 @@
+import io
+import struct
+
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Ancillary PNG chunks that carry metadata rather than rendering hints.
+PNG_METADATA_CHUNKS = {
+    b"eXIf": "exif",
+    b"iCCP": "icc",
+    b"tEXt": "text",
+    b"zTXt": "text",
+    b"iTXt": "text",
+    b"tIME": "time",
+}
+
+WEBP_METADATA_CHUNKS = {b"EXIF": "exif", b"XMP ": "xmp", b"ICCP": "icc"}
+# VP8X feature flags announcing the chunks above.
+WEBP_ICC_FLAG = 0x20
+WEBP_EXIF_FLAG = 0x08
+WEBP_XMP_FLAG = 0x04
+
+JPEG_SOS = 0xDA
+JPEG_COM = 0xFE
+# Markers without a length field: TEM, RST0-7, SOI, EOI.
+JPEG_STANDALONE = {0x01, *range(0xD0, 0xDA)}
+
+
+class UnsupportedContainer(ValueError):
+    pass
+
+
+def detect_format(data: bytes) -> str | None:
+    """Return the PIL format name for the containers handled here."""
+    if data.startswith(b"\xff\xd8"):
+        return "JPEG"
+    if data.startswith(PNG_SIGNATURE):
+        return "PNG"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def _jpeg_block_name(marker: int, payload: bytes) -> str | None:
+    if marker == 0xE1:
+        if payload.startswith(b"Exif\x00"):
+            return "exif"
+        if payload.startswith(b"http://ns.adobe.com/"):
+            return "xmp"
+        return "app1"
+    if marker == 0xE2:
+        return "icc" if payload.startswith(b"ICC_PROFILE\x00") else "app2"
+    if marker == 0xED:
+        return "iptc"
+    if marker == JPEG_COM:
+        return "comment"
+    return None
+
+
+def strip_jpeg(data: bytes) -> tuple[bytes, list[str]]:
+    """Drop APP1 (EXIF/XMP), APP2 (ICC), APP13 (IPTC) and COM segments.
+
+    APP0 (JFIF) and APP14 (Adobe) stay: decoders need them to pick the
+    right colour transform. Everything from the first SOS on is copied as-is.
+    """
+    view = memoryview(data)
+    output = io.BytesIO()
+    output.write(view[:2])
+    removed: list[str] = []
+    position = 2
+    while position + 1 < len(data):
+        if data[position] != 0xFF:
+            raise UnsupportedContainer("Corrupt JPEG marker.")
+        marker = data[position + 1]
+        if marker == 0xFF:  # fill byte
+            position += 1
+            continue
+        if marker in JPEG_STANDALONE:
+            output.write(view[position : position + 2])
+            position += 2
+            continue
+        if marker == JPEG_SOS:
+            output.write(view[position:])
+            break
+        if position + 4 > len(data):
+            raise UnsupportedContainer("Truncated JPEG segment.")
+        (length,) = struct.unpack(">H", data[position + 2 : position + 4])
+        end = position + 2 + length
+        if length < 2 or end > len(data):
+            raise UnsupportedContainer("Truncated JPEG segment.")
+        name = _jpeg_block_name(marker, data[position + 4 : position + 36])
+        if name is None:
+            output.write(view[position:end])
+        else:
+            removed.append(name)
+        position = end
+    return output.getvalue(), removed
+
+
+def strip_png(data: bytes) -> tuple[bytes, list[str]]:
+    view = memoryview(data)
+    output = io.BytesIO()
+    output.write(PNG_SIGNATURE)
+    removed: list[str] = []
+    position = len(PNG_SIGNATURE)
+    while position < len(data):
+        if position + 8 > len(data):
+            raise UnsupportedContainer("Truncated PNG chunk.")
+        length, chunk_type = struct.unpack(">I4s", data[position : position + 8])
+        end = position + 12 + length
+        if end > len(data):
+            raise UnsupportedContainer("Truncated PNG chunk.")
+        name = PNG_METADATA_CHUNKS.get(chunk_type)
+        if name is None:
+            output.write(view[position:end])
+        else:
+            removed.append(name)
+        position = end
+        if chunk_type == b"IEND":
+            break
+    return output.getvalue(), removed
+
+
+def strip_webp(data: bytes) -> tuple[bytes, list[str]]:
+    view = memoryview(data)
+    chunks = io.BytesIO()
+    removed: list[str] = []
+    position = 12
+    (riff_size,) = struct.unpack("<I", data[4:8])
+    limit = min(len(data), 8 + riff_size)
+    while position < limit:
+        if position + 8 > limit:
+            raise UnsupportedContainer("Truncated WebP chunk.")
+        fourcc, size = struct.unpack("<4sI", data[position : position + 8])
+        if position + 8 + size > limit:
+            raise UnsupportedContainer("Truncated WebP chunk.")
+        end = min(limit, position + 8 + size + (size & 1))
+        name = WEBP_METADATA_CHUNKS.get(fourcc)
+        if name is not None:
+            removed.append(name)
+        elif fourcc == b"VP8X":
+            header = bytearray(view[position:end])
+            header[8] &= ~(WEBP_ICC_FLAG | WEBP_EXIF_FLAG | WEBP_XMP_FLAG) & 0xFF
+            chunks.write(header)
+        else:
+            chunks.write(view[position:end])
+        position = end
+    body = chunks.getvalue()
+    return b"RIFF" + struct.pack("<I", 4 + len(body)) + b"WEBP" + body, removed
+
+
+STRIPPERS = {"JPEG": strip_jpeg, "PNG": strip_png, "WEBP": strip_webp}
+
+
+def strip_container(data: bytes) -> tuple[bytes, str, list[str]]:
+    """Drop metadata blocks by copying every other segment or chunk through.
+
+    Nothing is decoded or re-encoded, so JPEG quality is untouched and the
+    cost is one pass over the bytes. Returns (data, PIL format, removed).
+    """
+    image_format = detect_format(data)
+    if image_format is None:
+        raise UnsupportedContainer("Unsupported container.")
+    stripped, removed = STRIPPERS[image_format](data)
+    return stripped, image_format, list(dict.fromkeys(removed))
+
+
+def strip_by_copy(image: Image.Image) -> tuple[Image.Image, list[str]]:
+    """Fallback for re-encoded output: copy the pixel buffer into a new image.
+
+    The copy carries no info dict, so nothing reaches the encoder. The
+    pixels move as one tobytes() buffer, never as per-pixel tuples.
+    """
+    removed = {
+        name
+        for key, name in (
+            ("exif", "exif"),
+            ("icc_profile", "icc"),
+            ("xmp", "xmp"),
+            ("XML:com.adobe.xmp", "xmp"),
+            ("comment", "comment"),
+        )
+        if image.info.get(key)
+    }
+    clean = Image.frombytes(image.mode, image.size, image.tobytes())
+    if image.mode in ("P", "PA"):
+        palette = image.getpalette()
+        if palette is not None:
+            clean.putpalette(palette)
+        if "transparency" in image.info:
+            clean.info["transparency"] = image.info["transparency"]
+    return clean, sorted(removed)
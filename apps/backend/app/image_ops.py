@@ -0,0 +1,262 @@
+import io
+import json
+from pathlib import Path
+
+from fastapi import HTTPException
+from PIL import Image, ImageDraw, ImageFont
+
+IMAGE_FORMATS = {
+    "png": "PNG",
+    "jpeg": "JPEG",
+    "jpg": "JPEG",
+    "webp": "WEBP",
+}
+
+IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+RESIZE_MODES = {"exact", "thumbnail"}
+# Cheap integer downscaling (JPEG DCT scaling, Image.reduce) stops this many
+# times above the target size, leaving the real filter enough pixels.
+REDUCING_GAP = 2.0
+
+MAX_WATERMARK_TEXT_LENGTH = 1000
+MAX_PIPELINE_OPERATIONS = 20
+
+# Fields each pipeline operation accepts, with whether they are required.
+OPERATION_FIELDS: dict[str, dict[str, bool]] = {
+    "resize": {"width": False, "height": False, "resample": False, "mode": False},
+    "crop": {"x": True, "y": True, "width": True, "height": True},
+    "watermark": {"text": True},
+    "strip_metadata": {},
+    "convert": {"format": True},
+}
+
+
+def _invalid(detail: str) -> HTTPException:
+    return HTTPException(status_code=400, detail=detail)
+
+
+def _int_field(operation: dict, name: str) -> int | None:
+    value = operation.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise _invalid(f"'{name}' must be an integer.")
+    return value
+
+
+def parse_operations(raw: str | None) -> list[dict]:
+    """Validate a JSON list of image operations into plain, picklable dicts.
+
+    Each entry is an object with an "op" name plus the same parameters as
+    the matching single-image endpoint, e.g. {"op": "resize", "width": 320}.
+    """
+    if not raw:
+        return []
+    try:
+        operations = json.loads(raw)
+    except ValueError as exc:
+        raise _invalid("Operations must be a JSON list.") from exc
+    if not isinstance(operations, list):
+        raise _invalid("Operations must be a JSON list.")
+    if len(operations) > MAX_PIPELINE_OPERATIONS:
+        raise _invalid(f"Too many operations. Maximum is {MAX_PIPELINE_OPERATIONS}.")
+
+    normalized = []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise _invalid("Each operation must be an object.")
+        name = operation.get("op")
+        fields = OPERATION_FIELDS.get(name) if isinstance(name, str) else None
+        if fields is None:
+            raise _invalid(f"Unknown operation: {name}")
+        unknown = set(operation) - set(fields) - {"op"}
+        if unknown:
+            raise _invalid(f"Unknown fields for {name}: {', '.join(sorted(unknown))}")
+        missing = [field for field, required in fields.items() if required]
+        missing = [field for field in missing if operation.get(field) is None]
+        if missing:
+            raise _invalid(f"Missing fields for {name}: {', '.join(missing)}")
+        normalized.append(_normalize(name, operation))
+    return normalized
+
+
+def _normalize(name: str, operation: dict) -> dict:
+    if name == "resize":
+        width = _int_field(operation, "width")
+        height = _int_field(operation, "height")
+        if width is None and height is None:
+            raise _invalid("Provide width or height.")
+        if (width is not None and width <= 0) or (height is not None and height <= 0):
+            raise _invalid("Invalid resize dimensions.")
+        return {
+            "op": name,
+            "width": width,
+            "height": height,
+            "resample": resample_filter(operation.get("resample")),
+            "mode": resize_mode(operation.get("mode")),
+        }
+    if name == "crop":
+        values = {
+            field: _int_field(operation, field) for field in OPERATION_FIELDS[name]
+        }
+        if values["width"] <= 0 or values["height"] <= 0:
+            raise _invalid("Invalid crop size.")
+        return {"op": name, **values}
+    if name == "watermark":
+        text = operation["text"]
+        if not isinstance(text, str):
+            raise _invalid("'text' must be a string.")
+        if len(text) > MAX_WATERMARK_TEXT_LENGTH:
+            raise _invalid(
+                "Text too long. Maximum length is "
+                f"{MAX_WATERMARK_TEXT_LENGTH} characters."
+            )
+        return {"op": name, "text": text}
+    if name == "convert":
+        format_key = str(operation["format"]).strip().lower()
+        if format_key not in IMAGE_FORMATS:
+            raise _invalid("Unsupported format. Use png, jpeg, or webp.")
+        return {"op": name, "format": format_key}
+    return {"op": name}
+
+
+def output_format(operations: list[dict], filename: str | None) -> str:
+    """The last convert wins; otherwise keep the input's format, else PNG."""
+    for operation in reversed(operations):
+        if operation["op"] == "convert":
+            return operation["format"]
+    suffix = Path(filename or "").suffix.lower().lstrip(".")
+    return suffix if suffix in IMAGE_FORMATS else "png"
+
+
+def resample_filter(value: str | None) -> str:
+    key = (value or "bicubic").strip().lower()
+    if key not in RESAMPLE_FILTERS:
+        raise _invalid(
+            f"Unsupported resample filter. Use {', '.join(RESAMPLE_FILTERS)}."
+        )
+    return key
+
+
+def resize_mode(value: str | None) -> str:
+    key = (value or "exact").strip().lower()
+    if key not in RESIZE_MODES:
+        raise _invalid("Resize mode must be exact or thumbnail.")
+    return key
+
+
+def resize_dimensions(
+    size: tuple[int, int], width: int | None, height: int | None
+) -> tuple[int, int]:
+    """Fill in a missing width or height from the aspect ratio."""
+    original_width, original_height = size
+    if width is None:
+        width = int(original_width * (height / original_height))
+    if height is None:
+        height = int(original_height * (width / original_width))
+    return width, height
+
+
+def resize(
+    image: Image.Image,
+    width: int | None,
+    height: int | None,
+    resample: str = "bicubic",
+    mode: str = "exact",
+) -> Image.Image:
+    """Resize without decoding more pixels than the output needs.
+
+    JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale via draft() when the
+    image has not been loaded yet, and the remaining integer factor is taken
+    with Image.reduce before the chosen filter runs. Thumbnail mode fits the
+    image inside width x height, keeps the aspect ratio and never enlarges,
+    so memory is bounded by the output size rather than the input's.
+    """
+    resample_mode = RESAMPLE_FILTERS[resample]
+    if mode == "thumbnail":
+        box = (width or image.width, height or image.height)
+        image.thumbnail(box, resample_mode, reducing_gap=REDUCING_GAP)
+        return image
+
+    target = resize_dimensions(image.size, width, height)
+    reducing_gap = None if resample == "nearest" else REDUCING_GAP
+    if reducing_gap and image.format == "JPEG":
+        image.draft(
+            None, (int(target[0] * reducing_gap), int(target[1] * reducing_gap))
+        )
+    return image.resize(target, resample_mode, reducing_gap=reducing_gap)
+
+
+def crop(image: Image.Image, x: int, y: int, width: int, height: int) -> Image.Image:
+    return image.crop((x, y, x + width, y + height))
+
+
+def watermark(image: Image.Image, text: str) -> Image.Image:
+    image = image.convert("RGBA")
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    font = ImageFont.load_default()
+    text_bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+    padding = 16
+    position = (
+        max(padding, image.width - text_width - padding),
+        max(padding, image.height - text_height - padding),
+    )
+    draw.text(position, text, fill=(255, 255, 255, 160), font=font)
+    return Image.alpha_composite(image, overlay)
+
+
+def strip_metadata(image: Image.Image) -> Image.Image:
+    # EXIF, XMP and ICC only reach the encoder through image.info. Load first:
+    # PNG decoding adds text chunks found after the image data to info.
+    image.load()
+    image.info = {}
+    return image
+
+
+def apply_operations(image: Image.Image, operations: list[dict]) -> Image.Image:
+    for operation in operations:
+        name = operation["op"]
+        params = {key: value for key, value in operation.items() if key != "op"}
+        if name == "resize":
+            image = resize(image, **params)
+        elif name == "crop":
+            image = crop(image, **params)
+        elif name == "watermark":
+            image = watermark(image, **params)
+        elif name == "strip_metadata":
+            image = strip_metadata(image)
+    return image
+
+
+def encode(image: Image.Image, format_key: str) -> bytes:
+    if IMAGE_FORMATS[format_key] == "JPEG" and image.mode in ("RGBA", "P"):
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format=IMAGE_FORMATS[format_key])
+    return output.getvalue()
+
+
+def process_image(data: bytes, operations: list[dict], format_key: str) -> bytes:
+    """Decode once, apply every operation in order, encode once.
+
+    Module-level so it can run in the process pool.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        return encode(apply_operations(image, operations), format_key)
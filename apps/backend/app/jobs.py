@@ -0,0 +1,688 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.progress import PROGRESS_ID_PATTERN, progress_hub
+
+logger = logging.getLogger("localforge")
+
+router = APIRouter()
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 2.0
+LEASE_SECONDS = 30.0
+# Claims before a job whose worker keeps dying (crash, OOM kill) is failed.
+MAX_ATTEMPTS = 3
+PURGE_INTERVAL = 300.0
+EVENTS_POLL_INTERVAL = 1.0
+EVENTS_IDLE_TIMEOUT = 600.0
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+@dataclass
+class JobOutput:
+    path: Path
+    media_type: str
+    filename: str
+    # Response headers describing how the output was made, e.g. X-Trim-Path.
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class JobContext:
+    """What an operation gets, whether it runs inline or as a queued job."""
+
+    input_path: Path
+    work_dir: Path
+    params: dict
+    request: Request | None = None
+    job_id: str | None = None
+    progress_id: str | None = None
+    # SHA-256 of the input, when the caller already hashed it.
+    input_digest: str | None = None
+
+
+Operation = Callable[[JobContext], Awaitable[JobOutput]]
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("config.invalid name=%s value=%s", name, value)
+        return default
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class JobStore:
+    """SQLite-backed job table shared by every worker process on the host.
+
+    Running jobs hold a lease that their worker renews; a job whose lease
+    lapses (crash, restart) is claimed again by whichever worker polls next.
+    Calls block for up to the 30s busy timeout, so async code runs them in a
+    thread; each call opens its own connection.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._initialized:
+            return self._open()
+        # Threads racing through the schema setup would run the migrations twice.
+        with self._init_lock:
+            return self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    operation TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    work_dir TEXT NOT NULL,
+                    input_path TEXT NOT NULL,
+                    result_path TEXT,
+                    media_type TEXT,
+                    filename TEXT,
+                    result_headers TEXT,
+                    progress REAL,
+                    progress_detail TEXT,
+                    error TEXT,
+                    worker_id TEXT,
+                    lease_until REAL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "progress_detail" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN progress_detail TEXT")
+            if "result_headers" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN result_headers TEXT")
+            if "attempts" not in columns:
+                conn.execute(
+                    "ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+                )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+            self._initialized = True
+        return conn
+
+    def create(
+        self,
+        job_id: str,
+        operation: str,
+        params: dict,
+        work_dir: Path,
+        input_path: Path,
+    ) -> dict:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (
+                    id, operation, status, params, work_dir, input_path,
+                    created_at, updated_at
+                ) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)
+                """,
+                (
+                    job_id,
+                    operation,
+                    json.dumps(params),
+                    str(work_dir),
+                    str(input_path),
+                    now,
+                    now,
+                ),
+            )
+        return self.get(job_id) or {}
+
+    def get(self, job_id: str) -> dict | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count_pending(self) -> int:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()
+        return int(row[0])
+
+    def claim(
+        self, worker_id: str, lease: float, max_attempts: int = MAX_ATTEMPTS
+    ) -> dict | None:
+        """Take the oldest runnable job, counting the attempt.
+
+        A lapsed lease means the worker died mid-job; a job that has used up
+        max_attempts that way is failed instead of being run again.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs cancelled while their worker was down never get a final
+                # update from that worker; settle them here.
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'cancelled', updated_at = ?
+                    WHERE status = 'running' AND cancel_requested = 1
+                        AND lease_until < ?
+                    """,
+                    (now, now),
+                )
+                conn.execute(
+                    """
+                    UPDATE jobs
+                    SET status = 'failed', updated_at = ?,
+                        error = 'Processing stopped repeatedly; giving up.'
+                    WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+                    """,
+                    (now, now, max_attempts),
+                )
+                row = conn.execute(
+                    """
+                    SELECT id FROM jobs
+                    WHERE cancel_requested = 0 AND (
+                        status = 'queued'
+                        OR (status = 'running' AND lease_until < ?)
+                    )
+                    ORDER BY created_at
+                    LIMIT 1
+                    """,
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        """
+                        UPDATE jobs
+                        SET status = 'running', worker_id = ?, lease_until = ?,
+                            attempts = attempts + 1, updated_at = ?
+                        WHERE id = ?
+                        """,
+                        (worker_id, now + lease, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row else None
+
+    def heartbeat(self, job_id: str, worker_id: str, lease: float) -> tuple[bool, bool]:
+        """Renew the lease.
+
+        Returns whether the worker still holds it (it may have lapsed and
+        been claimed by another worker), and whether cancellation was
+        requested.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            renewed = conn.execute(
+                """
+                UPDATE jobs SET lease_until = ?, updated_at = ?
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+                """,
+                (now + lease, now, job_id, worker_id),
+            ).rowcount
+            row = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return renewed > 0, bool(row and row["cancel_requested"])
+
+    def update(self, job_id: str, owner: str | None = None, **fields: object) -> bool:
+        """Set fields on a job; returns whether a row was changed.
+
+        With owner, only a job still running under that worker is changed,
+        so a worker that lost its lease can't overwrite the new holder's.
+        """
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        condition = "id = ?"
+        values = [*fields.values(), job_id]
+        if owner is not None:
+            condition += " AND worker_id = ? AND status = 'running'"
+            values.append(owner)
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE {condition}", values
+            )
+        return cursor.rowcount > 0
+
+    def release(self, job_id: str, worker_id: str) -> None:
+        """Hand a job back to the queue without counting the attempt."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = 'queued', worker_id = NULL, attempts = attempts - 1,
+                    updated_at = ?
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+                """,
+                (time.time(), job_id, worker_id),
+            )
+
+    def request_cancel(self, job_id: str) -> dict | None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = CASE status WHEN 'queued' THEN 'cancelled' ELSE status END,
+                    cancel_requested = 1,
+                    updated_at = ?
+                WHERE id = ? AND status IN ('queued', 'running')
+                """,
+                (time.time(), job_id),
+            )
+        return self.get(job_id)
+
+    def expired(self, before: float) -> list[dict]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"""
+                SELECT * FROM jobs
+                WHERE updated_at < ? AND status IN {TERMINAL_STATUSES}
+                """,
+                (before,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, job_id: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+class JobManager:
+    """Bounded pool of asyncio workers draining the shared job store."""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        workers: int = 2,
+        max_pending: int = 100,
+        retention: float = 24 * 3600,
+        max_attempts: int = MAX_ATTEMPTS,
+    ) -> None:
+        self.data_dir = data_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_attempts = max_attempts
+        self.store = JobStore(data_dir / "jobs.sqlite3")
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.operations: dict[str, Operation] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._next_purge = 0.0
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        return cls(
+            data_dir=Path(os.getenv("JOB_DATA_DIR", ".data/jobs")),
+            workers=max(1, int(_env_number("JOB_WORKERS", 2))),
+            max_pending=max(1, int(_env_number("JOB_MAX_PENDING", 100))),
+            retention=_env_number("JOB_RETENTION_SECONDS", 24 * 3600),
+            max_attempts=max(1, int(_env_number("JOB_MAX_ATTEMPTS", MAX_ATTEMPTS))),
+        )
+
+    def operation(self, name: str) -> Callable[[Operation], Operation]:
+        """Register a coroutine as a named, queueable operation."""
+
+        def decorator(func: Operation) -> Operation:
+            self.operations[name] = func
+            return func
+
+        return decorator
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and all(not task.done() for task in self._tasks):
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            loop.create_task(self._worker(index)) for index in range(self.workers)
+        ]
+        logger.info("jobs.start worker=%s count=%s", self.worker_id, self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(
+        self, operation: str, work_dir: Path, input_path: Path, params: dict
+    ) -> dict:
+        """Queue an operation; takes ownership of work_dir."""
+        if operation not in self.operations:
+            raise HTTPException(status_code=400, detail="Unknown job operation.")
+        if await asyncio.to_thread(self.store.count_pending) >= self.max_pending:
+            logger.warning("jobs.queue_full max=%d", self.max_pending)
+            raise HTTPException(
+                status_code=503, detail="Job queue is full. Please retry shortly."
+            )
+
+        job_id = uuid.uuid4().hex
+        job = await asyncio.to_thread(
+            self._enqueue, job_id, operation, work_dir, input_path, params
+        )
+        logger.info("job.submit id=%s operation=%s", job_id, operation)
+        self.start()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return self.describe(job)
+
+    def _enqueue(
+        self,
+        job_id: str,
+        operation: str,
+        work_dir: Path,
+        input_path: Path,
+        params: dict,
+    ) -> dict:
+        job_dir = self.data_dir / job_id
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(work_dir), job_dir)
+        try:
+            return self.store.create(
+                job_id,
+                operation,
+                params,
+                job_dir,
+                job_dir / input_path.relative_to(work_dir),
+            )
+        except BaseException:
+            # Purge only finds directories through their rows.
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+    async def cancel(self, job_id: str) -> dict | None:
+        job = await asyncio.to_thread(self.store.request_cancel, job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        if job is not None:
+            logger.info("job.cancel id=%s status=%s", job_id, job["status"])
+        return job
+
+    def describe(self, job: dict) -> dict:
+        succeeded = job["status"] == "succeeded"
+        return {
+            "id": job["id"],
+            "operation": job["operation"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "progress_detail": (
+                json.loads(job["progress_detail"]) if job["progress_detail"] else None
+            ),
+            "error": job["error"],
+            "created_at": _isoformat(job["created_at"]),
+            "updated_at": _isoformat(job["updated_at"]),
+            "result_url": f"/api/jobs/{job['id']}/result" if succeeded else None,
+        }
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            if index == 0 and time.monotonic() >= self._next_purge:
+                self._next_purge = time.monotonic() + PURGE_INTERVAL
+                await asyncio.to_thread(self._purge)
+            job = await asyncio.to_thread(
+                self.store.claim, self.worker_id, LEASE_SECONDS, self.max_attempts
+            )
+            if job is None:
+                assert self._wakeup is not None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: dict) -> None:
+        job_id = job["id"]
+        operation = self.operations.get(job["operation"])
+        if operation is None:
+            await asyncio.to_thread(
+                self.store.update,
+                job_id,
+                self.worker_id,
+                status="failed",
+                error="Unknown job operation.",
+            )
+            return
+
+        context = JobContext(
+            input_path=Path(job["input_path"]),
+            work_dir=Path(job["work_dir"]),
+            params=json.loads(job["params"]),
+            job_id=job_id,
+            progress_id=job_id,
+        )
+        logger.info("job.start id=%s operation=%s", job_id, job["operation"])
+        start_time = time.perf_counter()
+        task = asyncio.ensure_future(operation(context))
+        self._running[job_id] = task
+        reported = None
+        lease_lost = False
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=HEARTBEAT_INTERVAL)
+                if task.done():
+                    break
+                held, cancel_requested = await asyncio.to_thread(
+                    self.store.heartbeat, job_id, self.worker_id, LEASE_SECONDS
+                )
+                if not held:
+                    # The lease lapsed (e.g. the loop stalled) and the job may
+                    # be running elsewhere, in the same job dir: stop here.
+                    lease_lost = True
+                    task.cancel()
+                    await asyncio.wait({task})
+                    break
+                if cancel_requested:
+                    task.cancel()
+                snapshot = progress_hub.latest(job_id)
+                if snapshot is not None and snapshot is not reported:
+                    reported = snapshot
+                    await self._store_progress(job_id, snapshot)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so the next worker reruns it.
+            task.cancel()
+            await asyncio.to_thread(self.store.release, job_id, self.worker_id)
+            raise
+        finally:
+            self._running.pop(job_id, None)
+
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        if lease_lost:
+            self._log_lease_lost(job_id)
+        elif task.cancelled():
+            if not await asyncio.to_thread(
+                self.store.update, job_id, self.worker_id, status="cancelled"
+            ):
+                self._log_lease_lost(job_id)
+                return
+            progress_hub.finish(job_id, "cancelled")
+            await asyncio.to_thread(shutil.rmtree, context.work_dir, ignore_errors=True)
+            logger.info("job.cancelled id=%s duration_ms=%.2f", job_id, duration_ms)
+        elif (error := task.exception()) is not None:
+            detail = (
+                error.detail
+                if isinstance(error, HTTPException)
+                else "Processing failed. Please check your input and try again."
+            )
+            if not await asyncio.to_thread(
+                self.store.update,
+                job_id,
+                self.worker_id,
+                status="failed",
+                error=str(detail),
+            ):
+                self._log_lease_lost(job_id)
+                return
+            progress_hub.finish(job_id, "failed", str(detail))
+            await asyncio.to_thread(shutil.rmtree, context.work_dir, ignore_errors=True)
+            logger.error("job.failed id=%s error=%s", job_id, error)
+        else:
+            output = task.result()
+            if not await asyncio.to_thread(
+                self.store.update,
+                job_id,
+                self.worker_id,
+                status="succeeded",
+                progress=1.0,
+                result_path=str(output.path),
+                media_type=output.media_type,
+                filename=output.filename,
+                result_headers=json.dumps(output.headers),
+            ):
+                self._log_lease_lost(job_id)
+                return
+            progress_hub.finish(job_id, "succeeded")
+            context.input_path.unlink(missing_ok=True)
+            logger.info("job.complete id=%s duration_ms=%.2f", job_id, duration_ms)
+
+    def _log_lease_lost(self, job_id: str) -> None:
+        logger.warning("job.lease_lost id=%s worker=%s", job_id, self.worker_id)
+
+    async def _store_progress(self, job_id: str, snapshot: dict) -> None:
+        percent = snapshot.get("percent")
+        await asyncio.to_thread(
+            self.store.update,
+            job_id,
+            self.worker_id,
+            progress=percent / 100 if percent is not None else None,
+            progress_detail=json.dumps(snapshot),
+        )
+
+    def _purge(self) -> None:
+        for job in self.store.expired(time.time() - self.retention):
+            shutil.rmtree(job["work_dir"], ignore_errors=True)
+            self.store.delete(job["id"])
+            logger.info("job.purge id=%s", job["id"])
+
+
+job_manager = JobManager.from_env()
+
+
+async def _get_job(job_id: str) -> dict:
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    job = await asyncio.to_thread(job_manager.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@router.get("/api/jobs/{job_id}")
+async def job_status(job_id: str) -> dict:
+    return job_manager.describe(await _get_job(job_id))
+
+
+@router.get("/api/jobs/{job_id}/result")
+async def job_result(job_id: str) -> FileResponse:
+    job = await _get_job(job_id)
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail="Job has no result yet.")
+    result_path = Path(job["result_path"])
+    if not result_path.is_file():
+        raise HTTPException(status_code=410, detail="Job result has expired.")
+    return FileResponse(
+        result_path,
+        media_type=job["media_type"],
+        filename=job["filename"],
+        headers=json.loads(job["result_headers"] or "{}"),
+    )
+
+
+@router.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str) -> dict:
+    await _get_job(job_id)
+    job = await job_manager.cancel(job_id)
+    assert job is not None
+    return job_manager.describe(job)
+
+
+def _snapshot_from_job(job: dict) -> dict:
+    snapshot = json.loads(job["progress_detail"]) if job["progress_detail"] else {}
+    snapshot["status"] = job["status"]
+    snapshot["done"] = job["status"] in TERMINAL_STATUSES
+    if job["error"]:
+        snapshot["error"] = job["error"]
+    return snapshot
+
+
+@router.get("/api/progress/{progress_id}")
+async def progress_events(progress_id: str) -> StreamingResponse:
+    """Server-Sent Events feed of progress for a job id or client progress id.
+
+    Updates published in this process are pushed as they happen; jobs run by
+    another worker process are followed through the job store instead.
+    """
+    if not PROGRESS_ID_PATTERN.fullmatch(progress_id):
+        raise HTTPException(status_code=404, detail="Unknown progress id.")
+    is_job = re.fullmatch(r"[0-9a-f]{32}", progress_id) is not None
+
+    async def events() -> AsyncIterator[str]:
+        last_sent = None
+        idle_since = time.monotonic()
+        async for snapshot in progress_hub.subscribe(progress_id, EVENTS_POLL_INTERVAL):
+            if snapshot is None:
+                job = None
+                if is_job:
+                    job = await asyncio.to_thread(job_manager.store.get, progress_id)
+                if job is not None:
+                    snapshot = _snapshot_from_job(job)
+            if snapshot is None or snapshot == last_sent:
+                if time.monotonic() - idle_since > EVENTS_IDLE_TIMEOUT:
+                    return
+                yield ": keepalive\n\n"
+                continue
+            last_sent = snapshot
+            idle_since = time.monotonic()
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if snapshot.get("done"):
+                return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,11 +1,16 @@
+import asyncio
+from collections import deque
+from contextlib import ExitStack, asynccontextmanager, contextmanager
 from datetime import datetime as DateTime
+import hashlib
 import io
-from typing import Iterable, cast
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator
 import logging
+import os
 import re
 import shutil
 import socket
-import subprocess
 import tempfile
 import time
 import uuid
@@ -14,22 +19,110 @@ from pathlib import Path
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
 
 import dns.resolver
-import pandas as pd
 from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse, Response
-from PIL import Image, ImageDraw, ImageFont
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from PIL import Image
 from pydantic import BaseModel, Field
 from pypdf import PdfReader, PdfWriter
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import ContentStream
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.commands import LineCallback, run_command, tool_limit
+from app import columnar, image_ops
+from app.image_metadata import (
+    UnsupportedContainer,
+    detect_format,
+    strip_by_copy,
+    strip_container,
+)
+from app.image_ops import (
+    IMAGE_FORMATS,
+    IMAGE_MEDIA_TYPES,
+    MAX_WATERMARK_TEXT_LENGTH,
+    output_format,
+    parse_operations,
+    process_image,
+)
+from app.columnar import (
+    TABLE_MEDIA_TYPES,
+    TableConversionError,
+    convert_table,
+    table_format,
+)
 from app.decision_logger import router as decision_logger_router
+from app.jobs import JobContext, JobOutput, job_manager
+from app.jobs import router as jobs_router
+from app.media_ops import (
+    COMPRESS_PROFILES,
+    DEFAULT_COMPRESS_PROFILE,
+    DEFAULT_VIDEO_ENCODERS,
+    KEYFRAME_SAMPLE_SECONDS,
+    KEYFRAME_TOLERANCE,
+    MAX_RENDITIONS,
+    PACKAGE_COPY_CODECS,
+    PACKAGE_FORMATS,
+    TRIM_REMUX,
+    TRIM_SMART_CUT,
+    TRIM_TRANSCODE,
+    MediaLayout,
+    TrimPlan,
+    audio_bit_rate,
+    can_copy,
+    compress_copies_audio,
+    copy_streams,
+    keyframe_probe_args,
+    package_args,
+    parse_keyframes,
+    parse_layout,
+    parse_segment_list,
+    plan_renditions,
+    plan_trim,
+    probe_summary,
+    segment_times,
+    same_stream_format,
+    size_bit_rate,
+    smart_cut_audio_args,
+    smart_cut_head_args,
+    video_bit_rate,
+    video_codec_args,
+)
+from app.media_packages import PACKAGE_MEDIA_TYPES, package_store
+from app.office_pool import DOCX_TO_PDF, PDF_TO_DOCX, OfficePool
+from app.pdf_ops import (
+    append_rotation_update,
+    document_outline,
+    extract_page_text,
+    page_count,
+    write_pdf_parts,
+)
+from app.process_pool import pool_size, run_in_process, shutdown_process_pool
+from app.progress import PROGRESS_ID_PATTERN, FfmpegProgress, progress_hub
+from app.result_cache import result_cache
+from app.table_ops import (
+    iter_sheet_csv,
+    sheet_names,
+    write_csv_from_xlsx,
+    write_xlsx_from_csv,
+)
+from app.zipstream import stream_zip
 
 # Constants for security
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
-MAX_WATERMARK_TEXT_LENGTH = 1000
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+MAX_BATCH_IMAGES = 500
+MAX_BATCH_UNCOMPRESSED_SIZE = 4 * MAX_FILE_SIZE
 
 
 logger = logging.getLogger("localforge")
@@ -41,12 +134,70 @@ if not logger.handlers:
 logger.setLevel(logging.INFO)
 
 
+office_pool = OfficePool.from_env()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_manager.start()
+    office_pool.log_mode()
+    yield
+    await job_manager.stop()
+    office_pool.shutdown()
+    shutdown_process_pool()
+
+
 # Initialize rate limiter
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(title="LocalForge API", version="0.2.0")
+app = FastAPI(title="LocalForge API", version="0.2.0", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.include_router(decision_logger_router)
+app.include_router(jobs_router)
+
+
+class BodySizeLimitMiddleware:
+    """Enforce MAX_FILE_SIZE on the request body as it streams in.
+
+    The content-length check in add_security_headers is only a fast path:
+    chunked uploads carry no length, so the limit is applied to the bytes
+    actually received as well.
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int) -> None:
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    logger.warning(
+                        "request.body_size_exceeded size=%d max=%d",
+                        received,
+                        self.max_size,
+                    )
+                    raise HTTPException(
+                        status_code=413,
+                        detail="File too large. Maximum size is 50MB.",
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+# Added before the http middleware so it sits inside it and its 413 reaches the
+# route handler's exception handling directly.
+app.add_middleware(BodySizeLimitMiddleware, max_size=MAX_FILE_SIZE)
 
 
 @app.middleware("http")
@@ -119,6 +270,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["Content-Type", "Authorization", "X-Request-ID"],
+    expose_headers=[
+        "X-Cache",
+        "X-Compress-Mode",
+        "X-Metadata-Removed",
+        "X-Original-Size",
+        "X-Segment-Timings",
+        "X-Optimized-Size",
+        "X-Shard-Timings",
+        "X-Stream-Copy",
+        "X-Target-Bit-Rate",
+        "X-Trim-Path",
+    ],
 )
 
 
@@ -150,7 +313,7 @@ TOOLS = [
         "slug": "pdf",
         "name": "PDF Toolkit",
         "path": "/tools/pdf",
-        "description": "Merge, split, rotate, and optimize PDF files.",
+        "description": "Merge, split, rotate, optimize, and extract PDF files.",
     },
     {
         "slug": "convert",
@@ -256,20 +419,6 @@ TOOLS = [
     },
 ]
 
-IMAGE_FORMATS = {
-    "png": "PNG",
-    "jpeg": "JPEG",
-    "jpg": "JPEG",
-    "webp": "WEBP",
-}
-
-IMAGE_MEDIA_TYPES = {
-    "png": "image/png",
-    "jpeg": "image/jpeg",
-    "jpg": "image/jpeg",
-    "webp": "image/webp",
-}
-
 MEDIA_MEDIA_TYPES = {
     "mp4": "video/mp4",
     "webm": "video/webm",
@@ -282,8 +431,31 @@ MEDIA_MEDIA_TYPES = {
 
 AUDIO_FORMATS = {"mp3", "wav", "m4a", "aac"}
 VIDEO_FORMATS = {"mp4", "webm", "mov"}
+MAX_BIT_RATE_KBPS = 100_000
+MIN_HEIGHT = 16
+MAX_HEIGHT = 4320
+MAX_ENCODER_THREADS = 64
+MAX_MEDIA_SEGMENTS = 64
 
 PDF_OPTIMIZE_LEVELS = {"screen", "ebook", "printer", "prepress"}
+# Deterministic conversions whose inline results are kept in the result cache.
+CACHED_OPERATIONS = {
+    "convert.docx_to_pdf",
+    "convert.markdown_to_pdf",
+    "convert.table",
+}
+# Media operations that look up the input's cached probe; their inline runs
+# hash the upload while saving it, so the lookup needs no second pass.
+PROBED_OPERATIONS = {"media.convert", "media.compress", "media.trim"}
+# Split work per pool worker; more batches stream sooner, each re-parses the PDF.
+SPLIT_BATCHES_PER_WORKER = 4
+MAX_OPTIMIZE_SHARDS = 32
+# Pages per text-extraction task; also the granularity of the extract cache.
+EXTRACT_BATCH_PAGES = 16
+THUMBNAIL_FORMATS = {"png", "webp"}
+MIN_THUMBNAIL_DPI = 10
+MAX_THUMBNAIL_DPI = 300
+MAX_THUMBNAIL_PAGES = 200
 DNS_RECORD_TYPES = {"A", "AAAA", "CNAME", "MX", "TXT", "NS"}
 
 
@@ -330,30 +502,106 @@ def _find_libreoffice() -> str:
     )
 
 
-def _run_command(args: list[str], error_message: str) -> None:
-    try:
-        logger.info("command.run tool=%s", args[0])
-        subprocess.run(
-            args, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+async def _run_command(
+    args: list[str],
+    error_message: str,
+    request: Request | None = None,
+    **callbacks: LineCallback,
+) -> None:
+    result = await run_command(args, request=request, **callbacks)
+    if result.returncode != 0:
+        stderr = result.stderr.strip() or result.stdout.strip()
+        logger.error(
+            "command.failed tool=%s reason=%s error=%s",
+            Path(args[0]).name,
+            error_message,
+            stderr,
         )
-    except FileNotFoundError as exc:
-        logger.error("dependency.missing name=%s", args[0])
-        raise HTTPException(
-            status_code=501, detail="Required system dependency is not available."
-        ) from exc
-    except subprocess.CalledProcessError as exc:
-        stderr = exc.stderr.strip() or exc.stdout.strip()
-        logger.error("command.failed tool=%s error=%s", args[0], stderr)
         # Use generic error message to avoid information disclosure
         raise HTTPException(
             status_code=400,
             detail="Processing failed. Please check your input and try again.",
-        ) from exc
+        )
 
 
-async def _save_upload(file: UploadFile, path: Path) -> None:
-    content = await file.read()
-    path.write_bytes(content)
+async def _run_ffmpeg(
+    args: list[str],
+    error_message: str,
+    context: JobContext,
+    duration: float | None = None,
+) -> None:
+    """Run ffmpeg, publishing -progress output under the context's progress id."""
+    progress_id = context.progress_id
+    if progress_id is None:
+        await _run_command(args, error_message, context.request)
+        return
+    progress = FfmpegProgress(
+        lambda snapshot: progress_hub.publish(progress_id, snapshot), duration
+    )
+    await _run_command(
+        [args[0], "-progress", "pipe:1", "-nostats", *args[1:]],
+        error_message,
+        context.request,
+        on_stdout_line=progress.feed_stdout,
+        on_stderr_line=progress.feed_stderr,
+    )
+
+
+def _validate_progress_id(progress_id: str | None) -> str | None:
+    if progress_id is None:
+        return None
+    if not PROGRESS_ID_PATTERN.fullmatch(progress_id):
+        raise HTTPException(status_code=400, detail="Invalid progress id.")
+    return progress_id
+
+
+async def _save_upload(
+    file: UploadFile, path: Path, digest: "hashlib._Hash | None" = None
+) -> int:
+    """Stream an upload to disk in fixed-size chunks; returns the byte count.
+
+    When a digest is given it is fed the same chunks, so cache lookups don't
+    need a second pass over the file.
+    """
+    written = 0
+    with path.open("wb") as output:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > MAX_FILE_SIZE:
+                raise HTTPException(
+                    status_code=413,
+                    detail="File too large. Maximum size is 50MB.",
+                )
+            if digest is not None:
+                digest.update(chunk)
+            output.write(chunk)
+    return written
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while chunk := handle.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def _upload_digest(file: UploadFile) -> str:
+    """Hash an already spooled upload and rewind it for the handler."""
+    digest = hashlib.sha256()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
+
+def _open_pdf(path: Path, stack: ExitStack) -> PdfReader:
+    # pypdf slurps the whole file when given a path; a handle lets it seek.
+    handle = stack.enter_context(path.open("rb"))
+    try:
+        return PdfReader(handle)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Invalid PDF file.") from exc
 
 
 def _response_from_bytes(data: bytes, media_type: str, filename: str) -> Response:
@@ -365,31 +613,202 @@ def _response_from_bytes(data: bytes, media_type: str, filename: str) -> Respons
     )
 
 
-def _response_from_file(path: Path, media_type: str, filename: str) -> Response:
-    return _response_from_bytes(path.read_bytes(), media_type, filename)
+@contextmanager
+def _work_dir() -> Iterator[str]:
+    """Temp dir for a request whose cleanup is handed to the file response.
+
+    Unlike TemporaryDirectory it survives the handler returning, so the output
+    can be streamed from disk; it is only removed here if the handler fails.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="localforge-")
+    try:
+        yield tmp_dir
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+class _WorkDirFileResponse(FileResponse):
+    """Stream a file from disk, then remove the work dir it lives in."""
+
+    def __init__(self, path: Path, work_dir: str, **kwargs) -> None:
+        super().__init__(
+            path,
+            background=BackgroundTask(shutil.rmtree, work_dir, ignore_errors=True),
+            **kwargs,
+        )
+        self.work_dir = work_dir
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Starlette skips the background task when the send is aborted or
+            # the Range header is rejected; the directory must go regardless.
+            await run_in_threadpool(shutil.rmtree, self.work_dir, ignore_errors=True)
+
+
+class _WorkDirStreamingResponse(StreamingResponse):
+    """Stream generated content, then remove the work dir it is read from."""
+
+    def __init__(self, content: ContentStream, work_dir: str, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.work_dir = work_dir
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # As for files: a client that disconnects mid-stream skips any
+            # background task.
+            await run_in_threadpool(shutil.rmtree, self.work_dir, ignore_errors=True)
+
+
+def _response_from_file(
+    path: Path, media_type: str, filename: str, work_dir: str | None = None
+) -> Response:
+    """Serve an output file from disk with Range support, no full read."""
+    sanitized_filename = _sanitize_filename(filename)
+    if work_dir is None:
+        return FileResponse(path, media_type=media_type, filename=sanitized_filename)
+    return _WorkDirFileResponse(
+        path, work_dir, media_type=media_type, filename=sanitized_filename
+    )
+
+
+async def _cached_response(
+    cache_key: str, filename: str | None = None, work_dir: str | None = None
+) -> Response | None:
+    """Serve a cache hit from a private link in a work dir, or return None.
+
+    Without a work dir, one is created for the hit and dropped on a miss.
+    """
+    own_dir = work_dir is None
+    if own_dir:
+        work_dir = tempfile.mkdtemp(prefix="localforge-")
+    entry = await run_in_threadpool(result_cache.get, cache_key, Path(work_dir))
+    if entry is None:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return None
+    response = _response_from_file(
+        entry.path, entry.media_type, filename or entry.filename, work_dir
+    )
+    response.headers["X-Cache"] = "HIT"
+    return response
+
+
+async def _store_result(
+    response: Response, cache_key: str, path: Path, media_type: str, filename: str
+) -> Response:
+    await run_in_threadpool(
+        result_cache.put_file, cache_key, path, media_type, filename
+    )
+    response.headers["X-Cache"] = "MISS"
+    return response
+
+
+async def _run_operation(
+    request: Request,
+    file: UploadFile,
+    operation: str,
+    params: dict,
+    background: bool,
+    input_name: str | None = None,
+    progress_id: str | None = None,
+) -> Response:
+    """Run a registered operation inline, or queue it when background is set.
+
+    Background jobs report progress under their job id; inline runs use the
+    client-supplied progress id, if any. Inline runs of operations listed in
+    CACHED_OPERATIONS are served from the result cache when possible.
+    """
+    if input_name is None:
+        input_name = f"input{Path(file.filename or '').suffix}"
+    cache_key = None
+    with _work_dir() as tmp_dir:
+        input_path = Path(tmp_dir) / input_name
+        cacheable = operation in CACHED_OPERATIONS and not background
+        hashed = cacheable or (operation in PROBED_OPERATIONS and not background)
+        digest = hashlib.sha256() if hashed else None
+        await _save_upload(file, input_path, digest)
+        if cacheable:
+            cache_key = result_cache.key(operation, digest.hexdigest(), params)
+            cached = await _cached_response(cache_key, work_dir=tmp_dir)
+            if cached is not None:
+                return cached
+        if background:
+            job = await job_manager.submit(operation, Path(tmp_dir), input_path, params)
+            return JSONResponse(
+                status_code=202,
+                content=job,
+                headers={"Location": f"/api/jobs/{job['id']}"},
+            )
+        context = JobContext(
+            input_path=input_path,
+            work_dir=Path(tmp_dir),
+            params=params,
+            request=request,
+            progress_id=progress_id,
+            input_digest=digest.hexdigest() if digest is not None else None,
+        )
+        try:
+            output = await job_manager.operations[operation](context)
+        except BaseException as exc:
+            if progress_id is not None:
+                detail = exc.detail if isinstance(exc, HTTPException) else None
+                progress_hub.finish(progress_id, "failed", detail)
+            raise
+        if progress_id is not None:
+            progress_hub.finish(progress_id, "succeeded")
+        response = _response_from_file(
+            output.path, output.media_type, output.filename, tmp_dir
+        )
+        response.headers.update(output.headers)
+        if cache_key is None:
+            return response
+        return await _store_result(
+            response, cache_key, output.path, output.media_type, output.filename
+        )
 
 
 def _parse_page_ranges(ranges: str | None, total_pages: int) -> list[list[int]]:
+    """Parse comma-separated page groups into zero-based page index lists.
+
+    Each chunk is one group: "3", "1-5", a stride such as "1-9/2" (pages 1,
+    3, 5, 7, 9), or "every N" which cuts the whole document into groups of N.
+    """
     if not ranges:
         return [[index] for index in range(total_pages)]
 
     groups: list[list[int]] = []
     for raw in ranges.split(","):
-        chunk = raw.strip()
+        chunk = raw.strip().lower()
         if not chunk:
             continue
-        if "-" in chunk:
-            start_str, end_str = chunk.split("-", 1)
-            start = int(start_str)
-            end = int(end_str)
-            if start < 1 or end > total_pages or start > end:
+        every = re.fullmatch(r"every\s+(\d+)(?:\s+pages?)?", chunk)
+        span = re.fullmatch(r"(\d+)\s*-\s*(\d+)(?:\s*/\s*(\d+))?", chunk)
+        if every:
+            size = int(every.group(1))
+            if size < 1:
                 raise HTTPException(status_code=400, detail="Invalid page range.")
-            groups.append(list(range(start - 1, end)))
-        else:
+            groups.extend(
+                list(range(start, min(start + size, total_pages)))
+                for start in range(0, total_pages, size)
+            )
+        elif span:
+            start, end = int(span.group(1)), int(span.group(2))
+            step = int(span.group(3) or 1)
+            if start < 1 or end > total_pages or start > end or step < 1:
+                raise HTTPException(status_code=400, detail="Invalid page range.")
+            groups.append(list(range(start - 1, end, step)))
+        elif chunk.isdigit():
             page = int(chunk)
             if page < 1 or page > total_pages:
                 raise HTTPException(status_code=400, detail="Invalid page range.")
             groups.append([page - 1])
+        else:
+            raise HTTPException(status_code=400, detail="Invalid page range.")
     if not groups:
         raise HTTPException(status_code=400, detail="Invalid page range.")
     return groups
@@ -417,18 +836,27 @@ def _resolve_image_format(file: UploadFile, target_format: str | None) -> str:
     return format_key
 
 
-def _image_to_bytes(image: Image.Image, format_key: str) -> bytes:
-    output = io.BytesIO()
-    image.save(output, format=IMAGE_FORMATS[format_key])
-    output.seek(0)
-    return output.read()
-
-
 def _image_response(image: Image.Image, format_key: str, filename: str) -> Response:
-    data = _image_to_bytes(image, format_key)
+    data = image_ops.encode(image, format_key)
     return _response_from_bytes(data, IMAGE_MEDIA_TYPES[format_key], filename)
 
 
+async def _cached_image_response(
+    image: Image.Image, format_key: str, filename: str, cache_key: str
+) -> Response:
+    try:
+        data = await run_in_threadpool(image_ops.encode, image, format_key)
+    except OSError as exc:
+        raise HTTPException(status_code=400, detail="Invalid image file.") from exc
+    media_type = IMAGE_MEDIA_TYPES[format_key]
+    await run_in_threadpool(
+        result_cache.put_bytes, cache_key, data, media_type, filename
+    )
+    response = _response_from_bytes(data, media_type, filename)
+    response.headers["X-Cache"] = "MISS"
+    return response
+
+
 @app.get("/api/health")
 async def health_check() -> dict:
     logger.info("health.check")
@@ -496,30 +924,94 @@ async def convert_timezone(payload: TimezoneConvertRequest) -> TimezoneConvertRe
     )
 
 
+def _merge_pdf_files(input_paths: list[Path], output_path: Path, dedupe: bool) -> None:
+    """Merge PDFs from disk, holding one input open at a time.
+
+    add_page copies a page and everything it references into the writer, so
+    each input's handle and parsed-object cache are released before the next
+    one is opened. The reader objects themselves stay referenced: the writer
+    keys its copy bookkeeping by id(reader), which must not be reused.
+    """
+    writer = PdfWriter()
+    readers = []
+    for input_path in input_paths:
+        with ExitStack() as stack:
+            reader = _open_pdf(input_path, stack)
+            for page in reader.pages:
+                writer.add_page(page)
+            reader.resolved_objects.clear()
+        readers.append(reader)
+        input_path.unlink()
+    if dedupe:
+        # Fonts and images repeated across inputs collapse to one object each.
+        writer.compress_identical_objects(
+            remove_duplicates=True, remove_unreferenced=True
+        )
+    writer.write(output_path)
+
+
 @app.post("/api/pdf/merge")
 @limiter.limit("10/minute")
 async def merge_pdf(
     request: Request,
     files: list[UploadFile] = File(...),
+    dedupe: bool = Form(True),
 ) -> Response:
-    logger.info("pdf.merge count=%s", len(files))
+    logger.info("pdf.merge count=%s dedupe=%s", len(files), dedupe)
     if len(files) < 2:
         raise HTTPException(status_code=400, detail="Upload at least two PDFs.")
 
-    writer = PdfWriter()
-    for file in files:
-        data = await file.read()
-        try:
-            reader = PdfReader(io.BytesIO(data))
-        except Exception as exc:
-            raise HTTPException(status_code=400, detail="Invalid PDF file.") from exc
-        for page in reader.pages:
-            writer.add_page(page)
+    with _work_dir() as tmp_dir:
+        input_paths = []
+        for index, file in enumerate(files):
+            input_path = Path(tmp_dir) / f"input-{index}.pdf"
+            await _save_upload(file, input_path)
+            input_paths.append(input_path)
+
+        output_path = Path(tmp_dir) / "merged.pdf"
+        await run_in_threadpool(_merge_pdf_files, input_paths, output_path, dedupe)
+        return _response_from_file(
+            output_path, "application/pdf", "merged.pdf", tmp_dir
+        )
+
 
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return _response_from_bytes(output.read(), "application/pdf", "merged.pdf")
+async def _split_parts(
+    input_path: Path, groups: list[list[int]]
+) -> AsyncIterator[tuple[str, bytes]]:
+    """Write split parts in worker processes, yielding each batch as it lands.
+
+    Groups are batched so a worker parses the source once per batch rather
+    than once per part: loading the page tree of a long document costs far
+    more than writing a single-page part.
+    """
+    parts = [
+        (pages, str(input_path.with_name(f"split-{index}.pdf")))
+        for index, pages in enumerate(groups, start=1)
+    ]
+    batch_count = min(len(parts), pool_size() * SPLIT_BATCHES_PER_WORKER)
+    batch_size = -(-len(parts) // batch_count)
+    tasks = {
+        run_in_process(write_pdf_parts, str(input_path), batch): batch
+        for batch in (
+            parts[start : start + batch_size]
+            for start in range(0, len(parts), batch_size)
+        )
+    }
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+                for _, output_path in tasks[task]:
+                    part_path = Path(output_path)
+                    yield part_path.name, await run_in_threadpool(part_path.read_bytes)
+                    part_path.unlink()
+    finally:
+        for task in pending:
+            task.cancel()
 
 
 @app.post("/api/pdf/split")
@@ -530,26 +1022,31 @@ async def split_pdf(
     ranges: str | None = Form(None),
 ) -> Response:
     logger.info("pdf.split name=%s ranges=%s", file.filename, ranges or "all")
-    data = await file.read()
-    try:
-        reader = PdfReader(io.BytesIO(data))
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Invalid PDF file.") from exc
+    with _work_dir() as tmp_dir:
+        input_path = Path(tmp_dir) / "input.pdf"
+        await _save_upload(file, input_path)
+        with ExitStack() as stack:
+            total_pages = len(_open_pdf(input_path, stack).pages)
+        groups = _parse_page_ranges(ranges, total_pages)
+
+        # PDF streams are already compressed; deflating them again buys little.
+        return _WorkDirStreamingResponse(
+            stream_zip(_split_parts(input_path, groups), zipfile.ZIP_STORED),
+            tmp_dir,
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="split-pdfs.zip"'},
+        )
 
-    groups = _parse_page_ranges(ranges, len(reader.pages))
-    archive = io.BytesIO()
-    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for index, pages in enumerate(groups, start=1):
-            writer = PdfWriter()
-            for page_index in pages:
-                writer.add_page(reader.pages[page_index])
-            output = io.BytesIO()
-            writer.write(output)
-            output.seek(0)
-            zip_file.writestr(f"split-{index}.pdf", output.read())
 
-    archive.seek(0)
-    return _response_from_bytes(archive.read(), "application/zip", "split-pdfs.zip")
+def _write_rotated_pdf(
+    reader: PdfReader, output_path: Path, targets: set[int], angle: int
+) -> None:
+    writer = PdfWriter()
+    for index, page in enumerate(reader.pages):
+        if index in targets:
+            page = page.rotate(angle)
+        writer.add_page(page)
+    writer.write(output_path)
 
 
 @app.post("/api/pdf/rotate")
@@ -559,33 +1056,138 @@ async def rotate_pdf(
     file: UploadFile = File(...),
     angle: int = Form(...),
     pages: str | None = Form(None),
+    incremental: bool = Form(True),
 ) -> Response:
     logger.info(
-        "pdf.rotate name=%s angle=%s pages=%s",
+        "pdf.rotate name=%s angle=%s pages=%s incremental=%s",
         file.filename,
         angle,
         pages or "all",
+        incremental,
     )
     if angle not in {90, 180, 270}:
         raise HTTPException(status_code=400, detail="Angle must be 90, 180, or 270.")
 
-    data = await file.read()
+    with _work_dir() as tmp_dir, ExitStack() as stack:
+        input_path = Path(tmp_dir) / "input.pdf"
+        await _save_upload(file, input_path)
+        reader = _open_pdf(input_path, stack)
+        incremental = incremental and not reader.is_encrypted
+        total_pages = page_count(reader) if incremental else len(reader.pages)
+        targets = _page_index_set(pages, total_pages)
+
+        if incremental:
+            try:
+                await run_in_threadpool(
+                    append_rotation_update, reader, input_path, targets, angle
+                )
+                return _response_from_file(
+                    input_path, "application/pdf", "rotated.pdf", tmp_dir
+                )
+            except ValueError as exc:
+                logger.warning("pdf.rotate.incremental_failed error=%s", exc)
+                reader = _open_pdf(input_path, stack)
+
+        output_path = Path(tmp_dir) / "rotated.pdf"
+        await run_in_threadpool(_write_rotated_pdf, reader, output_path, targets, angle)
+        return _response_from_file(
+            output_path, "application/pdf", "rotated.pdf", tmp_dir
+        )
+
+
+def _shard_ranges(total_pages: int, shards: int) -> list[list[int]]:
+    """Cut the document into contiguous, near-equal page ranges."""
+    shards = max(1, min(shards, total_pages))
+    size, extra = divmod(total_pages, shards)
+    ranges, start = [], 0
+    for index in range(shards):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def _ghostscript_optimize(
+    gs: str, input_path: Path, output_path: Path, level: str, request: Request
+) -> float:
+    started = time.perf_counter()
+    args = [
+        gs,
+        "-sDEVICE=pdfwrite",
+        "-dCompatibilityLevel=1.4",
+        f"-dPDFSETTINGS=/{level}",
+        "-dNOPAUSE",
+        "-dBATCH",
+        "-dQUIET",
+        f"-sOutputFile={output_path}",
+        str(input_path),
+    ]
+    await _run_command(args, "PDF optimization failed.", request)
+    return time.perf_counter() - started
+
+
+async def _optimize_sharded(
+    gs: str,
+    input_path: Path,
+    output_path: Path,
+    level: str,
+    ranges: list[list[int]],
+    request: Request,
+) -> list[tuple[str, float]]:
+    """Split with pypdf, run one Ghostscript per range in parallel, merge.
+
+    pdfwrite is single-threaded, so a long document otherwise keeps one core
+    busy for minutes. At most pool_size() Ghostscript processes run at once.
+    Fonts and images that each shard re-embeds are deduplicated on merge;
+    document-level outlines and forms do not survive the split.
+    """
+    work_dir = input_path.parent
+    parts = [
+        (pages, str(work_dir / f"shard-{index}.pdf"))
+        for index, pages in enumerate(ranges)
+    ]
+    await run_in_process(write_pdf_parts, str(input_path), parts)
+
+    slots = asyncio.Semaphore(pool_size())
+
+    async def optimize(shard_path: str) -> tuple[Path, float]:
+        optimized_path = Path(shard_path).with_suffix(".optimized.pdf")
+        async with slots:
+            seconds = await _ghostscript_optimize(
+                gs, Path(shard_path), optimized_path, level, request
+            )
+        Path(shard_path).unlink()
+        return optimized_path, seconds
+
+    tasks = [asyncio.ensure_future(optimize(path)) for _, path in parts]
     try:
-        reader = PdfReader(io.BytesIO(data))
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Invalid PDF file.") from exc
+        results = await asyncio.gather(*tasks)
+    finally:
+        # One failed shard fails the request; stop the others' Ghostscripts.
+        for task in tasks:
+            task.cancel()
+    await run_in_threadpool(
+        _merge_pdf_files, [path for path, _ in results], output_path, True
+    )
+    return [
+        (f"{pages[0] + 1}-{pages[-1] + 1}", seconds)
+        for pages, (_, seconds) in zip(ranges, results)
+    ]
 
-    targets = _page_index_set(pages, len(reader.pages))
-    writer = PdfWriter()
-    for index, page in enumerate(reader.pages):
-        if index in targets:
-            page = page.rotate(angle)
-        writer.add_page(page)
 
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return _response_from_bytes(output.read(), "application/pdf", "rotated.pdf")
+def _optimize_headers(
+    response: Response,
+    input_size: int,
+    output_size: int,
+    timings: list[tuple[str, float]] | None = None,
+) -> Response:
+    response.headers["X-Original-Size"] = str(input_size)
+    response.headers["X-Optimized-Size"] = str(output_size)
+    if timings:
+        response.headers["X-Shard-Timings"] = ",".join(
+            f"{pages}={seconds:.3f}" for pages, seconds in timings
+        )
+    return response
 
 
 @app.post("/api/pdf/optimize")
@@ -594,183 +1196,666 @@ async def optimize_pdf(
     request: Request,
     file: UploadFile = File(...),
     level: str = Form("screen"),
+    shards: int = Form(1),
 ) -> Response:
-    logger.info("pdf.optimize name=%s level=%s", file.filename, level)
+    logger.info("pdf.optimize name=%s level=%s shards=%s", file.filename, level, shards)
     level_key = level.strip().lower()
     if level_key not in PDF_OPTIMIZE_LEVELS:
         raise HTTPException(
             status_code=400,
             detail="Level must be screen, ebook, printer, or prepress.",
         )
+    if shards < 1 or shards > MAX_OPTIMIZE_SHARDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Shards must be between 1 and {MAX_OPTIMIZE_SHARDS}.",
+        )
 
     gs = _ensure_binary("gs")
-    with tempfile.TemporaryDirectory() as tmp_dir:
+    with _work_dir() as tmp_dir:
         input_path = Path(tmp_dir) / "input.pdf"
         output_path = Path(tmp_dir) / "optimized.pdf"
-        await _save_upload(file, input_path)
-        args = [
-            gs,
-            "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            f"-dPDFSETTINGS=/{level_key}",
-            "-dNOPAUSE",
-            "-dBATCH",
-            "-dQUIET",
-            f"-sOutputFile={output_path}",
-            str(input_path),
-        ]
-        _run_command(args, "PDF optimization failed.")
-        return _response_from_file(output_path, "application/pdf", "optimized.pdf")
+        digest = hashlib.sha256()
+        await _save_upload(file, input_path, digest)
+        input_size = input_path.stat().st_size
+        ranges = None
+        if shards > 1:
+            with ExitStack() as stack:
+                reader = _open_pdf(input_path, stack)
+                if not reader.is_encrypted:
+                    ranges = _shard_ranges(len(reader.pages), shards)
+        params = {"level": level_key}
+        if ranges and len(ranges) > 1:
+            params["shards"] = len(ranges)
+        cache_key = result_cache.key("pdf.optimize", digest.hexdigest(), params)
+        cached = await _cached_response(cache_key, work_dir=tmp_dir)
+        if cached is not None:
+            return _optimize_headers(cached, input_size, os.path.getsize(cached.path))
+
+        if "shards" in params:
+            timings = await _optimize_sharded(
+                gs, input_path, output_path, level_key, ranges, request
+            )
+        else:
+            seconds = await _ghostscript_optimize(
+                gs, input_path, output_path, level_key, request
+            )
+            timings = [("all", seconds)]
+        output_size = output_path.stat().st_size
+        logger.info(
+            "pdf.optimize.done shards=%s input_bytes=%s output_bytes=%s seconds=%s",
+            len(timings),
+            input_size,
+            output_size,
+            ",".join(f"{seconds:.3f}" for _, seconds in timings),
+        )
+        response = _response_from_file(
+            output_path, "application/pdf", "optimized.pdf", tmp_dir
+        )
+        _optimize_headers(response, input_size, output_size, timings)
+        return await _store_result(
+            response, cache_key, output_path, "application/pdf", "optimized.pdf"
+        )
 
 
-@app.post("/api/convert/docx-to-pdf")
-@limiter.limit("10/minute")
-async def docx_to_pdf(
-    request: Request,
-    file: UploadFile = File(...),
-) -> Response:
-    logger.info("convert.docx_to_pdf name=%s", file.filename)
-    soffice = _find_libreoffice()
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        input_path = Path(tmp_dir) / "input.docx"
-        await _save_upload(file, input_path)
-        _run_command(
-            [
-                soffice,
-                "--headless",
-                "--convert-to",
-                "pdf",
-                "--outdir",
-                tmp_dir,
-                str(input_path),
-            ],
-            "DOCX conversion failed.",
+async def _cached_json(key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Serve a JSON value from the result cache, computing it on a miss.
+
+    A None result is not stored, so a failed computation is retried next time.
+    """
+    entry = result_cache.get(key)
+    if entry is not None:
+        return json.loads(await run_in_threadpool(entry.path.read_bytes))
+    value = await compute()
+    if value is not None:
+        await run_in_threadpool(
+            result_cache.put_bytes,
+            key,
+            json.dumps(value).encode(),
+            "application/json",
+            "records.json",
         )
-        output_path = next(Path(tmp_dir).glob("input*.pdf"), None)
-        if not output_path:
-            raise HTTPException(
-                status_code=500, detail="Conversion produced no output."
-            )
-        return _response_from_file(output_path, "application/pdf", "converted.pdf")
+    return value
 
 
-@app.post("/api/convert/pdf-to-docx")
-@limiter.limit("10/minute")
-async def pdf_to_docx(
-    request: Request,
-    file: UploadFile = File(...),
-) -> Response:
-    logger.info("convert.pdf_to_docx name=%s", file.filename)
-    soffice = _find_libreoffice()
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        input_path = Path(tmp_dir) / "input.pdf"
-        await _save_upload(file, input_path)
-        _run_command(
-            [
-                soffice,
-                "--headless",
-                "--infilter=writer_pdf_import",
-                "--convert-to",
-                "docx:Office Open XML Text",
-                "--outdir",
-                tmp_dir,
-                str(input_path),
-            ],
-            "PDF conversion failed.",
+async def _extract_records(
+    input_path: Path, digest: str, summary: dict, total_pages: int
+) -> AsyncIterator[bytes]:
+    """Yield NDJSON lines: the document summary, each page in order, the outline.
+
+    Pages are extracted in fixed batches on the process pool, a few batches
+    ahead of the one being sent, so the first pages of a long document go
+    out while later ones are still being parsed. Every batch and the outline
+    are cached under the document hash; a repeat request only reads them.
+    """
+    window = pool_size() * 2
+
+    def extract(start: int) -> "asyncio.Task[list[dict]]":
+        key = result_cache.key(
+            "pdf.extract.pages",
+            digest,
+            {"start": start, "batch": EXTRACT_BATCH_PAGES},
         )
-        output_path = next(Path(tmp_dir).glob("input*.docx"), None)
-        if not output_path:
-            raise HTTPException(
-                status_code=500, detail="Conversion produced no output."
+        stop = min(start + EXTRACT_BATCH_PAGES, total_pages)
+        return asyncio.ensure_future(
+            _cached_json(
+                key,
+                lambda: run_in_process(extract_page_text, str(input_path), start, stop),
             )
-        media_type = (
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
         )
-        return _response_from_file(output_path, media_type, "converted.docx")
+
+    outline = asyncio.ensure_future(
+        _cached_json(
+            result_cache.key("pdf.extract.outline", digest, {}),
+            lambda: run_in_process(document_outline, str(input_path)),
+        )
+    )
+    batches = deque(
+        extract(start)
+        for start in range(
+            0, min(total_pages, window * EXTRACT_BATCH_PAGES), EXTRACT_BATCH_PAGES
+        )
+    )
+    next_start = len(batches) * EXTRACT_BATCH_PAGES
+    try:
+        yield (json.dumps(summary) + "\n").encode()
+        while batches:
+            records = await batches.popleft()
+            if next_start < total_pages:
+                batches.append(extract(next_start))
+                next_start += EXTRACT_BATCH_PAGES
+            yield "".join(json.dumps(record) + "\n" for record in records).encode()
+        try:
+            items = await outline
+        except Exception as exc:
+            logger.warning("pdf.extract.outline_failed error=%s", exc)
+            items = []
+        yield (json.dumps({"type": "outline", "outline": items}) + "\n").encode()
+    finally:
+        for task in (*batches, outline):
+            task.cancel()
 
 
-@app.post("/api/convert/csv-to-xlsx")
+@app.post("/api/pdf/extract")
 @limiter.limit("10/minute")
-async def csv_to_xlsx(
+async def extract_pdf(
     request: Request,
     file: UploadFile = File(...),
 ) -> Response:
-    logger.info("convert.csv_to_xlsx name=%s", file.filename)
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        input_path = Path(tmp_dir) / "input.csv"
-        output_path = Path(tmp_dir) / "output.xlsx"
-        await _save_upload(file, input_path)
-        df = pd.read_csv(input_path)
-        df.to_excel(output_path, index=False)
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        return _response_from_file(output_path, media_type, "converted.xlsx")
+    logger.info("pdf.extract name=%s", file.filename)
+    with _work_dir() as tmp_dir:
+        input_path = Path(tmp_dir) / "input.pdf"
+        digest = hashlib.sha256()
+        await _save_upload(file, input_path, digest)
+        with ExitStack() as stack:
+            reader = _open_pdf(input_path, stack)
+            if reader.is_encrypted:
+                raise HTTPException(
+                    status_code=400, detail="Encrypted PDFs are not supported."
+                )
+            total_pages = len(reader.pages)
+            metadata = {
+                key.lstrip("/"): str(value)
+                for key, value in (reader.metadata or {}).items()
+            }
+        summary = {"type": "document", "page_count": total_pages, "metadata": metadata}
+
+        return _WorkDirStreamingResponse(
+            _extract_records(input_path, digest.hexdigest(), summary, total_pages),
+            tmp_dir,
+            media_type="application/x-ndjson",
+        )
 
 
-@app.post("/api/convert/xlsx-to-csv")
-@limiter.limit("10/minute")
-async def xlsx_to_csv(
-    request: Request,
-    file: UploadFile = File(...),
-) -> Response:
-    logger.info("convert.xlsx_to_csv name=%s", file.filename)
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        input_path = Path(tmp_dir) / "input.xlsx"
-        output_path = Path(tmp_dir) / "output.csv"
-        await _save_upload(file, input_path)
-        df = pd.read_excel(input_path)
-        df.to_csv(output_path, index=False)
-        return _response_from_file(output_path, "text/csv", "converted.csv")
+def _page_chunks(indexes: list[int], parts: int) -> list[list[int]]:
+    """Cut sorted page indexes into contiguous runs of near-equal length.
 
+    Each run is one Ghostscript call (-dFirstPage/-dLastPage), so the
+    document is parsed once per run rather than once per page.
+    """
+    if not indexes:
+        return []
+    limit = -(-len(indexes) // parts)
+    chunks = [[indexes[0]]]
+    for index in indexes[1:]:
+        if index == chunks[-1][-1] + 1 and len(chunks[-1]) < limit:
+            chunks[-1].append(index)
+        else:
+            chunks.append([index])
+    return chunks
 
-@app.post("/api/convert/markdown-to-pdf")
-@limiter.limit("10/minute")
-async def markdown_to_pdf(
+
+def _thumbnail_name(index: int, format_key: str) -> str:
+    return f"page-{index + 1}.{format_key}"
+
+
+async def _thumbnail_entries(
+    gs: str,
+    input_path: Path,
+    digest: str,
+    indexes: list[int],
+    dpi: int,
+    format_key: str,
     request: Request,
-    file: UploadFile = File(...),
-) -> Response:
-    logger.info("convert.markdown_to_pdf name=%s", file.filename)
-    pandoc = _ensure_binary("pandoc")
-    _ensure_binary("wkhtmltopdf")
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        input_path = Path(tmp_dir) / "input.md"
-        output_path = Path(tmp_dir) / "output.pdf"
-        await _save_upload(file, input_path)
-        _run_command(
-            [
-                pandoc,
-                str(input_path),
-                "-o",
-                str(output_path),
-                "--pdf-engine=wkhtmltopdf",
-            ],
-            "Markdown conversion failed.",
+) -> AsyncIterator[tuple[str, bytes]]:
+    """Yield (name, image) per page: cached pages first, then renders as they land.
+
+    Uncached pages are rendered to PNG by up to pool_size() Ghostscript
+    processes at once; WebP output is encoded from that PNG in the process
+    pool. Every page is cached on its own under the document hash, so a
+    later request for an overlapping page range only renders what is new.
+    """
+    media_type = IMAGE_MEDIA_TYPES[format_key]
+    keys = {
+        index: result_cache.key(
+            "pdf.thumbnail",
+            digest,
+            {"page": index + 1, "dpi": dpi, "format": format_key},
         )
-        return _response_from_file(output_path, "application/pdf", "converted.pdf")
+        for index in indexes
+    }
+    missing = []
+    for index in indexes:
+        entry = result_cache.get(keys[index])
+        if entry is None:
+            missing.append(index)
+            continue
+        data = await run_in_threadpool(entry.path.read_bytes)
+        yield _thumbnail_name(index, format_key), data
 
+    slots = asyncio.Semaphore(pool_size())
 
-@app.post("/api/image/convert")
+    async def render(chunk: list[int]) -> list[tuple[int, Path]]:
+        first, last = chunk[0], chunk[-1]
+        pattern = input_path.with_name(f"render-{first}-%d.png")
+        args = [
+            gs,
+            "-dSAFER",
+            "-dBATCH",
+            "-dNOPAUSE",
+            "-dQUIET",
+            "-sDEVICE=png16m",
+            f"-r{dpi}",
+            "-dTextAlphaBits=4",
+            "-dGraphicsAlphaBits=4",
+            f"-dFirstPage={first + 1}",
+            f"-dLastPage={last + 1}",
+            f"-sOutputFile={pattern}",
+            str(input_path),
+        ]
+        async with slots:
+            await _run_command(args, "PDF rendering failed.", request)
+        return [
+            (index, input_path.with_name(f"render-{first}-{index - first + 1}.png"))
+            for index in chunk
+        ]
+
+    tasks = [
+        asyncio.ensure_future(render(chunk))
+        for chunk in _page_chunks(missing, pool_size())
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for index, path in await task:
+                data = await run_in_threadpool(path.read_bytes)
+                path.unlink()
+                if format_key != "png":
+                    data = await run_in_process(
+                        image_ops.process_image, data, [], format_key
+                    )
+                name = _thumbnail_name(index, format_key)
+                await run_in_threadpool(
+                    result_cache.put_bytes, keys[index], data, media_type, name
+                )
+                yield name, data
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/api/pdf/thumbnails")
 @limiter.limit("30/minute")
-async def convert_image(
+async def pdf_thumbnails(
     request: Request,
     file: UploadFile = File(...),
-    target_format: str = Form(...),
+    pages: str | None = Form(None),
+    dpi: int = Form(72),
+    format: str = Form("png"),
 ) -> Response:
     logger.info(
-        "image.convert name=%s target=%s",
+        "pdf.thumbnails name=%s pages=%s dpi=%s format=%s",
         file.filename,
-        target_format,
+        pages or "all",
+        dpi,
+        format,
+    )
+    format_key = format.strip().lower()
+    if format_key not in THUMBNAIL_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be png or webp.")
+    if dpi < MIN_THUMBNAIL_DPI or dpi > MAX_THUMBNAIL_DPI:
+        raise HTTPException(
+            status_code=400,
+            detail=f"DPI must be between {MIN_THUMBNAIL_DPI} and {MAX_THUMBNAIL_DPI}.",
+        )
+
+    gs = _ensure_binary("gs")
+    with _work_dir() as tmp_dir:
+        input_path = Path(tmp_dir) / "input.pdf"
+        digest = hashlib.sha256()
+        await _save_upload(file, input_path, digest)
+        with ExitStack() as stack:
+            total_pages = len(_open_pdf(input_path, stack).pages)
+        indexes = sorted(_page_index_set(pages, total_pages))
+        if not indexes:
+            raise HTTPException(status_code=400, detail="No pages selected.")
+        if len(indexes) > MAX_THUMBNAIL_PAGES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many pages. Maximum is {MAX_THUMBNAIL_PAGES} per request.",
+            )
+        entries = _thumbnail_entries(
+            gs, input_path, digest.hexdigest(), indexes, dpi, format_key, request
+        )
+
+        if len(indexes) == 1:
+            try:
+                name, data = [entry async for entry in entries][0]
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            return _response_from_bytes(data, IMAGE_MEDIA_TYPES[format_key], name)
+
+        # PNG and WebP are already compressed; deflating them again buys little.
+        return _WorkDirStreamingResponse(
+            stream_zip(entries, zipfile.ZIP_STORED),
+            tmp_dir,
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="thumbnails.zip"'},
+        )
+
+
+@job_manager.operation("convert.docx_to_pdf")
+async def _docx_to_pdf(context: JobContext) -> JobOutput:
+    soffice = _find_libreoffice()
+    output_path = await office_pool.convert(
+        soffice, context.input_path, context.work_dir, DOCX_TO_PDF
+    )
+    if not output_path.exists():
+        raise HTTPException(status_code=500, detail="Conversion produced no output.")
+    return JobOutput(output_path, "application/pdf", "converted.pdf")
+
+
+@app.post("/api/convert/docx-to-pdf")
+@limiter.limit("10/minute")
+async def docx_to_pdf(
+    request: Request,
+    file: UploadFile = File(...),
+    background: bool = Form(False),
+) -> Response:
+    logger.info("convert.docx_to_pdf name=%s", file.filename)
+    _find_libreoffice()
+    return await _run_operation(
+        request, file, "convert.docx_to_pdf", {}, background, "input.docx"
+    )
+
+
+@job_manager.operation("convert.pdf_to_docx")
+async def _pdf_to_docx(context: JobContext) -> JobOutput:
+    soffice = _find_libreoffice()
+    output_path = await office_pool.convert(
+        soffice, context.input_path, context.work_dir, PDF_TO_DOCX
+    )
+    if not output_path.exists():
+        raise HTTPException(status_code=500, detail="Conversion produced no output.")
+    media_type = (
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    )
+    return JobOutput(output_path, media_type, "converted.docx")
+
+
+@app.post("/api/convert/pdf-to-docx")
+@limiter.limit("10/minute")
+async def pdf_to_docx(
+    request: Request,
+    file: UploadFile = File(...),
+    background: bool = Form(False),
+) -> Response:
+    logger.info("convert.pdf_to_docx name=%s", file.filename)
+    _find_libreoffice()
+    return await _run_operation(
+        request, file, "convert.pdf_to_docx", {}, background, "input.pdf"
+    )
+
+
+@app.get("/api/convert/office-pool")
+async def office_pool_metrics() -> dict:
+    logger.info("convert.office_pool.metrics")
+    return office_pool.metrics()
+
+
+@job_manager.operation("convert.csv_to_xlsx")
+async def _csv_to_xlsx(context: JobContext) -> JobOutput:
+    output_path = context.work_dir / "output.xlsx"
+    await run_in_process(write_xlsx_from_csv, context.input_path, output_path)
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    return JobOutput(output_path, media_type, "converted.xlsx")
+
+
+@app.post("/api/convert/csv-to-xlsx")
+@limiter.limit("10/minute")
+async def csv_to_xlsx(
+    request: Request,
+    file: UploadFile = File(...),
+    background: bool = Form(False),
+) -> Response:
+    logger.info("convert.csv_to_xlsx name=%s", file.filename)
+    return await _run_operation(
+        request, file, "convert.csv_to_xlsx", {}, background, "input.csv"
+    )
+
+
+async def _xlsx_sheet_names(input_path: Path) -> list[str]:
+    try:
+        return await run_in_threadpool(sheet_names, input_path)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Invalid XLSX file.") from exc
+
+
+async def _sheet_csv_files(
+    input_path: Path, names: list[str]
+) -> AsyncIterator[tuple[str, Path]]:
+    """Convert each sheet in its own worker process, yielding (name, CSV path).
+
+    Files come back in completion order, so one large sheet does not hold
+    back the small ones.
+    """
+    used: set[str] = set()
+    tasks = {}
+    for index, name in enumerate(names):
+        output_path = input_path.with_name(f"sheet-{index}.csv")
+        task = run_in_process(write_csv_from_xlsx, input_path, output_path, name)
+        entry_name = _sanitize_filename(name).strip() or f"sheet-{index + 1}"
+        tasks[task] = (_unique_name(f"{entry_name}.csv", used), output_path)
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+                yield tasks[task]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _sheet_zip_entries(
+    input_path: Path, names: list[str]
+) -> AsyncIterator[tuple[str, bytes]]:
+    async for name, path in _sheet_csv_files(input_path, names):
+        yield name, await run_in_threadpool(path.read_bytes)
+        path.unlink()
+
+
+def _write_zip(entries: list[tuple[str, Path]], output_path: Path) -> None:
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, path in entries:
+            archive.write(path, name)
+            path.unlink()
+
+
+@job_manager.operation("convert.xlsx_to_csv")
+async def _xlsx_to_csv(context: JobContext) -> JobOutput:
+    if not context.params.get("all_sheets"):
+        output_path = context.work_dir / "output.csv"
+        await run_in_process(write_csv_from_xlsx, context.input_path, output_path)
+        return JobOutput(output_path, "text/csv", "converted.csv")
+
+    names = await _xlsx_sheet_names(context.input_path)
+    entries = [entry async for entry in _sheet_csv_files(context.input_path, names)]
+    output_path = context.work_dir / "sheets.zip"
+    await run_in_threadpool(_write_zip, entries, output_path)
+    return JobOutput(output_path, "application/zip", "converted-sheets.zip")
+
+
+@app.post("/api/convert/xlsx-to-csv")
+@limiter.limit("10/minute")
+async def xlsx_to_csv(
+    request: Request,
+    file: UploadFile = File(...),
+    background: bool = Form(False),
+    all_sheets: bool = Form(False),
+) -> Response:
+    """Convert the first sheet to CSV, or every sheet into a zip of CSVs.
+
+    Inline runs stream: a single sheet is sent chunk by chunk as openpyxl
+    reads it, and a zip entry goes out as soon as its sheet is converted.
+    """
+    logger.info("convert.xlsx_to_csv name=%s all_sheets=%s", file.filename, all_sheets)
+    params = {"all_sheets": all_sheets}
+    if background:
+        return await _run_operation(
+            request, file, "convert.xlsx_to_csv", params, background, "input.xlsx"
+        )
+
+    with _work_dir() as tmp_dir:
+        input_path = Path(tmp_dir) / "input.xlsx"
+        await _save_upload(file, input_path)
+        names = await _xlsx_sheet_names(input_path)
+        if all_sheets:
+            return _WorkDirStreamingResponse(
+                stream_zip(_sheet_zip_entries(input_path, names)),
+                tmp_dir,
+                media_type="application/zip",
+                headers={
+                    "Content-Disposition": 'attachment; filename="converted-sheets.zip"'
+                },
+            )
+
+        return _WorkDirStreamingResponse(
+            iter_sheet_csv(input_path, names[0] if names else None),
+            tmp_dir,
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="converted.csv"'},
+        )
+
+
+@job_manager.operation("convert.table")
+async def _convert_table(context: JobContext) -> JobOutput:
+    source = context.params["source"]
+    target = context.params["target"]
+    output_path = context.work_dir / f"output.{target}"
+    try:
+        rows = await run_in_process(
+            convert_table, context.input_path, output_path, source, target
+        )
+    except TableConversionError as exc:
+        logger.error(
+            "convert.table.failed source=%s target=%s error=%s", source, target, exc
+        )
+        raise HTTPException(
+            status_code=400,
+            detail=f"Could not convert this {source} file to {target}.",
+        ) from exc
+    logger.info(
+        "convert.table.done source=%s target=%s rows=%s bytes=%s",
+        source,
+        target,
+        rows,
+        output_path.stat().st_size,
+    )
+    return JobOutput(output_path, TABLE_MEDIA_TYPES[target], f"converted.{target}")
+
+
+@app.post("/api/convert/table")
+@limiter.limit("10/minute")
+async def convert_table_format(
+    request: Request,
+    file: UploadFile = File(...),
+    target_format: str = Form(...),
+    source_format: str | None = Form(None),
+    background: bool = Form(False),
+) -> Response:
+    """Convert between CSV, XLSX, JSON Lines, Parquet and Arrow IPC.
+
+    The source format defaults to the upload's extension.
+    """
+    logger.info(
+        "convert.table name=%s source=%s target=%s",
+        file.filename,
+        source_format,
+        target_format,
+    )
+    if columnar.pa is None:
+        logger.error("dependency.missing name=pyarrow")
+        raise HTTPException(
+            status_code=501,
+            detail="Missing optional dependency: pyarrow. Install the columnar extra.",
+        )
+    source = table_format(source_format or Path(file.filename or "").suffix)
+    target = table_format(target_format)
+    if source is None or target is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Formats must be csv, xlsx, jsonl, parquet, or arrow.",
+        )
+    if source == target:
+        raise HTTPException(
+            status_code=400, detail="Source and target formats are the same."
+        )
+    return await _run_operation(
+        request,
+        file,
+        "convert.table",
+        {"source": source, "target": target},
+        background,
+        f"input.{source}",
+    )
+
+
+@job_manager.operation("convert.markdown_to_pdf")
+async def _markdown_to_pdf(context: JobContext) -> JobOutput:
+    pandoc = _ensure_binary("pandoc")
+    _ensure_binary("wkhtmltopdf")
+    output_path = context.work_dir / "output.pdf"
+    await _run_command(
+        [
+            pandoc,
+            str(context.input_path),
+            "-o",
+            str(output_path),
+            "--pdf-engine=wkhtmltopdf",
+        ],
+        "Markdown conversion failed.",
+        context.request,
+    )
+    return JobOutput(output_path, "application/pdf", "converted.pdf")
+
+
+@app.post("/api/convert/markdown-to-pdf")
+@limiter.limit("10/minute")
+async def markdown_to_pdf(
+    request: Request,
+    file: UploadFile = File(...),
+    background: bool = Form(False),
+) -> Response:
+    logger.info("convert.markdown_to_pdf name=%s", file.filename)
+    _ensure_binary("pandoc")
+    _ensure_binary("wkhtmltopdf")
+    return await _run_operation(
+        request, file, "convert.markdown_to_pdf", {}, background, "input.md"
     )
-    format_key = _resolve_image_format(file, target_format)
-    try:
-        image = Image.open(file.file)
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail="Invalid image file.") from exc
 
-    if IMAGE_FORMATS[format_key] == "JPEG" and image.mode in ("RGBA", "P"):
-        image = image.convert("RGB")
 
+@app.post("/api/image/convert")
+@limiter.limit("30/minute")
+async def convert_image(
+    request: Request,
+    file: UploadFile = File(...),
+    target_format: str = Form(...),
+) -> Response:
+    logger.info(
+        "image.convert name=%s target=%s",
+        file.filename,
+        target_format,
+    )
+    format_key = _resolve_image_format(file, target_format)
     filename = f"{Path(file.filename or 'image').stem}.{format_key}"
-    return _image_response(image, format_key, filename)
+    cache_key = result_cache.key(
+        "image.convert",
+        await _upload_digest(file),
+        {"format": IMAGE_FORMATS[format_key]},
+    )
+    cached = await _cached_response(cache_key, filename)
+    if cached is not None:
+        return cached
+
+    try:
+        image = await run_in_threadpool(Image.open, file.file)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Invalid image file.") from exc
+
+    return await _cached_image_response(image, format_key, filename, cache_key)
 
 
 @app.post("/api/image/resize")
@@ -781,40 +1866,57 @@ async def resize_image(
     width: int | None = Form(None),
     height: int | None = Form(None),
     target_format: str | None = Form(None),
+    resample: str = Form("bicubic"),
+    mode: str = Form("exact"),
 ) -> Response:
     logger.info(
-        "image.resize name=%s width=%s height=%s",
+        "image.resize name=%s width=%s height=%s resample=%s mode=%s",
         file.filename,
         width,
         height,
+        resample,
+        mode,
     )
     if width is None and height is None:
         raise HTTPException(status_code=400, detail="Provide width or height.")
 
+    resample_key = image_ops.resample_filter(resample)
+    mode_key = image_ops.resize_mode(mode)
     format_key = _resolve_image_format(file, target_format)
+    input_digest = await _upload_digest(file)
     try:
-        image = Image.open(file.file)
+        image = await run_in_threadpool(Image.open, file.file)
     except Exception as exc:
         raise HTTPException(status_code=400, detail="Invalid image file.") from exc
 
-    original_width, original_height = image.size
-    target_width = width
-    target_height = height
-    if target_width is None:
-        if target_height is None:
-            raise HTTPException(status_code=400, detail="Provide width or height.")
-        target_width = int(original_width * (target_height / original_height))
-    if target_height is None:
-        if target_width is None:
-            raise HTTPException(status_code=400, detail="Provide width or height.")
-        target_height = int(original_height * (target_width / original_width))
-
-    resized = image.resize((target_width, target_height))
-    if IMAGE_FORMATS[format_key] == "JPEG" and resized.mode in ("RGBA", "P"):
-        resized = resized.convert("RGB")
+    if mode_key == "exact":
+        size = image_ops.resize_dimensions(image.size, width, height)
+    else:
+        size = (width or image.width, height or image.height)
 
+    # Image.open only parsed the header so far; a hit skips the decode.
     filename = f"{Path(file.filename or 'image').stem}-resize.{format_key}"
-    return _image_response(resized, format_key, filename)
+    cache_key = result_cache.key(
+        "image.resize",
+        input_digest,
+        {
+            "size": list(size),
+            "mode": mode_key,
+            "resample": resample_key,
+            "format": IMAGE_FORMATS[format_key],
+        },
+    )
+    cached = await _cached_response(cache_key, filename)
+    if cached is not None:
+        return cached
+
+    try:
+        resized = await run_in_threadpool(
+            image_ops.resize, image, size[0], size[1], resample_key, mode_key
+        )
+    except OSError as exc:
+        raise HTTPException(status_code=400, detail="Invalid image file.") from exc
+    return await _cached_image_response(resized, format_key, filename, cache_key)
 
 
 @app.post("/api/image/crop")
@@ -845,10 +1947,7 @@ async def crop_image(
     except Exception as exc:
         raise HTTPException(status_code=400, detail="Invalid image file.") from exc
 
-    cropped = image.crop((x, y, x + width, y + height))
-    if IMAGE_FORMATS[format_key] == "JPEG" and cropped.mode in ("RGBA", "P"):
-        cropped = cropped.convert("RGB")
-
+    cropped = image_ops.crop(image, x, y, width, height)
     filename = f"{Path(file.filename or 'image').stem}-crop.{format_key}"
     return _image_response(cropped, format_key, filename)
 
@@ -879,23 +1978,7 @@ async def watermark_image(
     except Exception as exc:
         raise HTTPException(status_code=400, detail="Invalid image file.") from exc
 
-    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(overlay)
-    font = ImageFont.load_default()
-    text_bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
-    padding = 16
-    position = (
-        max(padding, image.width - text_width - padding),
-        max(padding, image.height - text_height - padding),
-    )
-    draw.text(position, text, fill=(255, 255, 255, 160), font=font)
-    combined = Image.alpha_composite(image, overlay)
-
-    if IMAGE_FORMATS[format_key] == "JPEG":
-        combined = combined.convert("RGB")
-
+    combined = image_ops.watermark(image, text)
     filename = f"{Path(file.filename or 'image').stem}-watermark.{format_key}"
     return _image_response(combined, format_key, filename)
 
@@ -909,19 +1992,403 @@ async def strip_exif(
 ) -> Response:
     logger.info("image.strip_exif name=%s", file.filename)
     format_key = _resolve_image_format(file, target_format)
+    filename = f"{Path(file.filename or 'image').stem}-clean.{format_key}"
+    data = await file.read()
+    # Same container in and out: drop metadata blocks without re-encoding.
+    if detect_format(data) == IMAGE_FORMATS[format_key]:
+        try:
+            clean_data, _, removed = await run_in_threadpool(strip_container, data)
+        except UnsupportedContainer as exc:
+            raise HTTPException(status_code=400, detail="Invalid image file.") from exc
+        response = _response_from_bytes(
+            clean_data, IMAGE_MEDIA_TYPES[format_key], filename
+        )
+    else:
+        try:
+            image = Image.open(io.BytesIO(data))
+            clean, removed = await run_in_threadpool(strip_by_copy, image)
+        except Exception as exc:
+            raise HTTPException(status_code=400, detail="Invalid image file.") from exc
+        response = _image_response(clean, format_key, filename)
+
+    logger.info("image.strip_exif.removed blocks=%s", ",".join(removed) or "none")
+    response.headers["X-Metadata-Removed"] = ",".join(removed)
+    return response
+
+
+@app.post("/api/image/pipeline")
+@limiter.limit("30/minute")
+async def image_pipeline(
+    request: Request,
+    file: UploadFile = File(...),
+    operations: str = Form(...),
+) -> Response:
+    """Apply a JSON list of operations to one image with a single decode/encode.
+
+    Operations take the same parameters as the single-purpose endpoints, e.g.
+    [{"op": "crop", "x": 0, "y": 0, "width": 400, "height": 300},
+     {"op": "watermark", "text": "draft"}, {"op": "convert", "format": "webp"}].
+    """
+    pipeline = parse_operations(operations)
+    logger.info(
+        "image.pipeline name=%s operations=%s",
+        file.filename,
+        ",".join(operation["op"] for operation in pipeline),
+    )
+    format_key = output_format(pipeline, file.filename)
+    data = await file.read()
     try:
-        image = Image.open(file.file)
+        output = await run_in_process(process_image, data, pipeline, format_key)
     except Exception as exc:
+        logger.warning("image.pipeline.failed name=%s error=%s", file.filename, exc)
         raise HTTPException(status_code=400, detail="Invalid image file.") from exc
 
-    data = cast(Iterable, image.getdata())
-    clean = Image.new(image.mode, image.size)
-    clean.putdata(list(data))
-    if IMAGE_FORMATS[format_key] == "JPEG" and clean.mode in ("RGBA", "P"):
-        clean = clean.convert("RGB")
+    filename = f"{Path(file.filename or 'image').stem}-edited.{format_key}"
+    return _response_from_bytes(output, IMAGE_MEDIA_TYPES[format_key], filename)
+
+
+def _unique_name(name: str, used: set[str]) -> str:
+    candidate = name
+    counter = 1
+    while candidate in used:
+        path = Path(name)
+        candidate = f"{path.stem}-{counter}{path.suffix}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def _read_image_zip(file: UploadFile) -> list[tuple[str, bytes]]:
+    try:
+        archive = zipfile.ZipFile(file.file)
+    except zipfile.BadZipFile as exc:
+        raise HTTPException(status_code=400, detail="Invalid zip file.") from exc
+
+    inputs = []
+    total_size = 0
+    with archive:
+        for info in archive.infolist():
+            name = Path(info.filename).name
+            suffix = Path(name).suffix.lower().lstrip(".")
+            if info.is_dir() or name.startswith(".") or suffix not in IMAGE_FORMATS:
+                continue
+            if len(inputs) >= MAX_BATCH_IMAGES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Too many images. Maximum is {MAX_BATCH_IMAGES}.",
+                )
+            # zipfile stops reading at the declared size, so this bounds memory.
+            total_size += info.file_size
+            if total_size > MAX_BATCH_UNCOMPRESSED_SIZE:
+                raise HTTPException(status_code=413, detail="Zip contents too large.")
+            inputs.append((name, archive.read(info)))
+    return inputs
+
+
+async def _batch_results(
+    inputs: list[tuple[str, bytes]], operations: list[dict]
+) -> AsyncIterator[tuple[str, bytes]]:
+    """Fan images out to the process pool and yield them as they finish.
+
+    Only a couple of images per pool slot are in flight; the next one is
+    submitted as each finishes, so inputs waiting their turn aren't also
+    copied into the pool's call queue.
+    """
+    window = pool_size() * 2
+    waiting = deque(inputs)
+    inputs.clear()
+    used_names: set[str] = set()
+    tasks: dict[asyncio.Future, tuple[str, str]] = {}
+
+    def fill() -> None:
+        while waiting and len(tasks) < window:
+            name, data = waiting.popleft()
+            format_key = output_format(operations, name)
+            output_name = _unique_name(f"{Path(name).stem}.{format_key}", used_names)
+            task = run_in_process(process_image, data, operations, format_key)
+            tasks[task] = (name, output_name)
+
+    errors = []
+    try:
+        fill()
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name, output_name = tasks.pop(task)
+                fill()
+                try:
+                    yield output_name, task.result()
+                except Exception as exc:
+                    logger.warning("image.batch.failed name=%s error=%s", name, exc)
+                    errors.append({"file": name, "error": "Invalid image file."})
+        if errors:
+            yield "errors.json", json.dumps(errors, indent=2).encode()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/api/image/batch")
+@limiter.limit("10/minute")
+async def batch_images(
+    request: Request,
+    files: list[UploadFile] = File(...),
+    operations: str = Form("[]"),
+) -> StreamingResponse:
+    """Apply one operation pipeline to many images, or to the images in a zip.
+
+    The response is a zip streamed as images finish, so entries are in
+    completion order; images that fail are listed in errors.json.
+    """
+    logger.info("image.batch files=%s", len(files))
+    pipeline = parse_operations(operations)
+    if len(files) == 1 and Path(files[0].filename or "").suffix.lower() == ".zip":
+        inputs = await run_in_threadpool(_read_image_zip, files[0])
+    else:
+        if len(files) > MAX_BATCH_IMAGES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many images. Maximum is {MAX_BATCH_IMAGES}.",
+            )
+        inputs = [(file.filename or "image", await file.read()) for file in files]
+    if not inputs:
+        raise HTTPException(status_code=400, detail="No images to process.")
+
+    return StreamingResponse(
+        stream_zip(_batch_results(inputs, pipeline)),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="images.zip"'},
+    )
+
+
+def _segment_count(context: JobContext, layout: MediaLayout | None) -> int:
+    """Segments to encode in parallel; 1 when the input can't be split."""
+    segments = context.params.get("segments", 1)
+    if segments > 1 and (layout is None or not layout.video_codec):
+        logger.info("media.segments.skipped reason=no_video_or_probe")
+        return 1
+    if segments > 1 and not layout.duration:
+        logger.info("media.segments.skipped reason=unknown_duration")
+        return 1
+    return segments
+
+
+async def _segmented_video(
+    ffmpeg: str,
+    context: JobContext,
+    duration: float,
+    segments: int,
+    encode_args: list[str],
+    audio_args: list[str],
+    output_path: Path,
+    two_pass: bool = False,
+) -> list[tuple[str, float]]:
+    """Encode the video in keyframe-aligned pieces in parallel, then join.
+
+    The video stream is first split with stream copy by the segment muxer,
+    which moves each even split point to the next keyframe, so the pieces
+    decode on their own and nothing is decoded twice. At most `concurrency`
+    (default pool_size(), capped by FFMPEG_CONCURRENCY) encoders run at
+    once, and each gets an even share of the cores unless encode_args set
+    -threads. The encoded pieces are joined with the concat demuxer while
+    the audio is taken from the source in the same pass. Returns each
+    piece's source time span and encode time.
+    """
+    work_dir = context.work_dir
+    # More encoders than the ffmpeg limit would only queue, and would leave
+    # each running one with too small a share of the cores.
+    concurrency = min(
+        context.params.get("concurrency") or pool_size(), tool_limit("ffmpeg")
+    )
+    listing = work_dir / "pieces.csv"
+    await _run_command(
+        [
+            ffmpeg,
+            "-y",
+            "-i",
+            str(context.input_path),
+            "-map",
+            "0:V:0",
+            "-c",
+            "copy",
+            "-f",
+            "segment",
+            "-segment_format",
+            "matroska",
+            "-segment_times",
+            ",".join(str(time) for time in segment_times(duration, segments)),
+            "-segment_list",
+            str(listing),
+            "-segment_list_type",
+            "csv",
+            "-reset_timestamps",
+            "1",
+            str(work_dir / "piece-%03d.mkv"),
+        ],
+        "Media segmenting failed.",
+        context.request,
+    )
+    pieces = parse_segment_list(listing.read_text())
+    if "-threads" not in encode_args:
+        share = max(1, (os.cpu_count() or 1) // min(concurrency, len(pieces)))
+        encode_args = [*encode_args, "-threads", str(share)]
+    slots = asyncio.Semaphore(concurrency)
+    finished = 0
+
+    async def encode(index: int, name: str) -> tuple[Path, float]:
+        nonlocal finished
+        piece = work_dir / name
+        encoded = work_dir / f"encoded-{index:03d}.mkv"
+        args = [ffmpeg, "-y", "-i", str(piece), *encode_args]
+        passlog = ["-passlogfile", str(work_dir / f"passlog-{index:03d}")]
+        async with slots:
+            started = time.perf_counter()
+            if two_pass:
+                await _run_command(
+                    [*args, "-pass", "1", *passlog, "-an", "-f", "null", os.devnull],
+                    "Media encoding failed.",
+                    context.request,
+                )
+                args += ["-pass", "2", *passlog]
+            await _run_command(
+                [*args, "-an", str(encoded)], "Media encoding failed.", context.request
+            )
+            seconds = time.perf_counter() - started
+        piece.unlink()
+        finished += 1
+        if context.progress_id is not None:
+            progress_hub.publish(
+                context.progress_id,
+                {
+                    "status": "running",
+                    "percent": round(finished / len(pieces) * 100, 2),
+                    "segments": len(pieces),
+                    "segments_done": finished,
+                    "done": False,
+                },
+            )
+        return encoded, seconds
+
+    tasks = [
+        asyncio.ensure_future(encode(index, name))
+        for index, (name, _, _) in enumerate(pieces)
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # One failed piece fails the run; stop the other encoders.
+        for task in tasks:
+            task.cancel()
+
+    join_list = work_dir / "encoded.txt"
+    join_list.write_text("".join(f"file '{path.name}'\n" for path, _ in results))
+    await _run_command(
+        [
+            ffmpeg,
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            str(join_list),
+            "-i",
+            str(context.input_path),
+            "-map",
+            "0:v:0",
+            "-map",
+            "1:a:0?",
+            "-c:v",
+            "copy",
+            *audio_args,
+            str(output_path),
+        ],
+        "Media joining failed.",
+        context.request,
+    )
+    timings = [
+        (f"{start:.3f}-{end:.3f}", seconds)
+        for (_, start, end), (_, seconds) in zip(pieces, results)
+    ]
+    logger.info(
+        "media.segments.done pieces=%s concurrency=%s wall=%s",
+        len(pieces),
+        concurrency,
+        ",".join(f"{seconds:.2f}" for _, seconds in timings),
+    )
+    return timings
+
+
+def _segment_params(segments: int, concurrency: int | None) -> dict:
+    if not 1 <= segments <= MAX_MEDIA_SEGMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Segments must be between 1 and {MAX_MEDIA_SEGMENTS}.",
+        )
+    if concurrency is not None and not 1 <= concurrency <= MAX_MEDIA_SEGMENTS:
+        raise HTTPException(status_code=400, detail="Invalid concurrency.")
+    params: dict = {"segments": segments}
+    if concurrency is not None:
+        params["concurrency"] = concurrency
+    return params
 
-    filename = f"{Path(file.filename or 'image').stem}-clean.{format_key}"
-    return _image_response(clean, format_key, filename)
+
+def _segment_timings_header(timings: list[tuple[str, float]]) -> str:
+    return ",".join(f"{span}={seconds:.3f}" for span, seconds in timings)
+
+
+@job_manager.operation("media.convert")
+async def _convert_media(context: JobContext) -> JobOutput:
+    format_key = context.params["target_format"]
+    ffmpeg = _ensure_binary("ffmpeg")
+    output_path = context.work_dir / f"output.{format_key}"
+    audio_only = format_key in AUDIO_FORMATS
+    layout = await _context_layout(context)
+    copied = copy_streams(layout, format_key, audio_only) if layout else []
+    headers = {"X-Stream-Copy": ",".join(copied) or "none"}
+    segments = 1 if audio_only or "video" in copied else _segment_count(context, layout)
+    logger.info(
+        "media.convert.plan copy=%s segments=%s", ",".join(copied) or "none", segments
+    )
+    if segments > 1:
+        timings = await _segmented_video(
+            ffmpeg,
+            context,
+            layout.duration,
+            segments,
+            ["-c:v", DEFAULT_VIDEO_ENCODERS[format_key]],
+            ["-c:a", "copy"] if "audio" in copied else [],
+            output_path,
+        )
+        headers["X-Segment-Timings"] = _segment_timings_header(timings)
+        return JobOutput(
+            output_path,
+            MEDIA_MEDIA_TYPES[format_key],
+            f"converted.{format_key}",
+            headers=headers,
+        )
+
+    args = [ffmpeg, "-y", "-i", str(context.input_path)]
+    if copied:
+        # Copying streams that already fit the target skips their encode.
+        if audio_only:
+            args += ["-map", "0:a:0"]
+        else:
+            args += ["-map", "0:V:0?", "-map", "0:a:0?"]
+        if "video" in copied:
+            args += ["-c:v", "copy"]
+        if "audio" in copied:
+            args += ["-c:a", "copy"]
+    if audio_only:
+        args += ["-vn"]
+    args.append(str(output_path))
+    await _run_ffmpeg(args, "Media conversion failed.", context)
+    return JobOutput(
+        output_path,
+        MEDIA_MEDIA_TYPES[format_key],
+        f"converted.{format_key}",
+        headers=headers,
+    )
 
 
 @app.post("/api/media/convert")
@@ -930,26 +2397,50 @@ async def convert_media(
     request: Request,
     file: UploadFile = File(...),
     target_format: str = Form(...),
+    segments: int = Form(1),
+    concurrency: int | None = Form(None),
+    background: bool = Form(False),
+    progress_id: str | None = Form(None),
 ) -> Response:
-    logger.info("media.convert name=%s target=%s", file.filename, target_format)
+    """Convert media, copying streams that already fit the target.
+
+    With segments > 1 a video transcode is split at keyframes and the pieces
+    are encoded in parallel, at most `concurrency` at a time; each piece's
+    span and encode time is reported in X-Segment-Timings.
+    """
+    logger.info(
+        "media.convert name=%s target=%s segments=%s",
+        file.filename,
+        target_format,
+        segments,
+    )
     format_key = target_format.strip().lower()
     if format_key not in MEDIA_MEDIA_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported media format.")
+    params = {"target_format": format_key, **_segment_params(segments, concurrency)}
+
+    _ensure_binary("ffmpeg")
+    return await _run_operation(
+        request,
+        file,
+        "media.convert",
+        params,
+        background,
+        progress_id=_validate_progress_id(progress_id),
+    )
+
 
+@job_manager.operation("media.extract_audio")
+async def _extract_audio(context: JobContext) -> JobOutput:
+    format_key = context.params["target_format"]
     ffmpeg = _ensure_binary("ffmpeg")
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        suffix = Path(file.filename or "").suffix
-        input_path = Path(tmp_dir) / f"input{suffix}"
-        await _save_upload(file, input_path)
-        output_path = Path(tmp_dir) / f"output.{format_key}"
-        args = [ffmpeg, "-y", "-i", str(input_path)]
-        if format_key in AUDIO_FORMATS:
-            args += ["-vn"]
-        args.append(str(output_path))
-        _run_command(args, "Media conversion failed.")
-        return _response_from_file(
-            output_path, MEDIA_MEDIA_TYPES[format_key], f"converted.{format_key}"
-        )
+    output_path = context.work_dir / f"audio.{format_key}"
+    await _run_ffmpeg(
+        [ffmpeg, "-y", "-i", str(context.input_path), "-vn", str(output_path)],
+        "Audio extraction failed.",
+        context,
+    )
+    return JobOutput(output_path, MEDIA_MEDIA_TYPES[format_key], f"audio.{format_key}")
 
 
 @app.post("/api/media/extract-audio")
@@ -958,25 +2449,317 @@ async def extract_audio(
     request: Request,
     file: UploadFile = File(...),
     target_format: str = Form("mp3"),
+    background: bool = Form(False),
+    progress_id: str | None = Form(None),
 ) -> Response:
     logger.info("media.extract_audio name=%s target=%s", file.filename, target_format)
     format_key = target_format.strip().lower()
     if format_key not in MEDIA_MEDIA_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported audio format.")
 
-    ffmpeg = _ensure_binary("ffmpeg")
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        suffix = Path(file.filename or "").suffix
-        input_path = Path(tmp_dir) / f"input{suffix}"
-        await _save_upload(file, input_path)
-        output_path = Path(tmp_dir) / f"audio.{format_key}"
-        _run_command(
-            [ffmpeg, "-y", "-i", str(input_path), "-vn", str(output_path)],
-            "Audio extraction failed.",
-        )
-        return _response_from_file(
-            output_path, MEDIA_MEDIA_TYPES[format_key], f"audio.{format_key}"
+    _ensure_binary("ffmpeg")
+    return await _run_operation(
+        request,
+        file,
+        "media.extract_audio",
+        {"target_format": format_key},
+        background,
+        progress_id=_validate_progress_id(progress_id),
+    )
+
+
+async def _ffprobe_json(path: Path, request: Request | None = None) -> dict | None:
+    """ffprobe's format and stream report, or None when it can't be had.
+
+    ffprobe is optional: callers fall back to their ffmpeg-only behaviour.
+    """
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        logger.warning("dependency.missing name=ffprobe fallback=true")
+        return None
+    result = await run_command(
+        [
+            ffprobe,
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+            str(path),
+        ],
+        request=request,
+    )
+    if result.returncode != 0:
+        logger.warning("media.probe.failed error=%s", result.stderr.strip())
+        return None
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        return None
+
+
+async def _media_report(
+    path: Path, request: Request | None = None, digest: str | None = None
+) -> dict | None:
+    """ffprobe's report for a file, cached under the file's SHA-256.
+
+    Returns None without ffprobe, like _ffprobe_json. The file is hashed
+    here when the caller has no digest for it (e.g. queued jobs).
+    """
+    if shutil.which("ffprobe") is None:
+        logger.warning("dependency.missing name=ffprobe fallback=true")
+        return None
+    if digest is None:
+        digest = await run_in_threadpool(_file_digest, path)
+    return await _cached_json(
+        result_cache.key("media.probe", digest, {}),
+        lambda: _ffprobe_json(path, request),
+    )
+
+
+async def _context_layout(context: JobContext) -> MediaLayout | None:
+    report = await _media_report(
+        context.input_path, context.request, context.input_digest
+    )
+    return parse_layout(report) if report is not None else None
+
+
+async def _sample_keyframes(path: Path, request: Request) -> list[float]:
+    ffprobe = _ensure_binary("ffprobe")
+    result = await run_command(
+        keyframe_probe_args(ffprobe, str(path), 0.0, KEYFRAME_SAMPLE_SECONDS),
+        request=request,
+    )
+    return parse_keyframes(result.stdout) if result.returncode == 0 else []
+
+
+@app.post("/api/media/probe")
+@limiter.limit("30/minute")
+async def probe_media(request: Request, file: UploadFile = File(...)) -> dict:
+    """Describe a media file without converting it.
+
+    Container, codecs, duration, bitrate, resolution and keyframe interval
+    (median over the first KEYFRAME_SAMPLE_SECONDS), plus the targets the
+    file can be remuxed into without re-encoding. Results are cached by
+    content hash, and convert, compress and trim read the same cache.
+    """
+    logger.info("media.probe name=%s", file.filename)
+    _ensure_binary("ffprobe")
+    with tempfile.TemporaryDirectory(prefix="localforge-") as tmp_dir:
+        input_path = Path(tmp_dir) / f"input{Path(file.filename or '').suffix}"
+        digest = hashlib.sha256()
+        await _save_upload(file, input_path, digest)
+        report = await _media_report(input_path, request, digest.hexdigest())
+        if report is None:
+            raise HTTPException(status_code=400, detail="Unreadable media file.")
+        layout = parse_layout(report)
+        keyframes: list[float] = []
+        if layout.video_codec:
+            keyframes = await _cached_json(
+                result_cache.key(
+                    "media.probe.keyframes",
+                    digest.hexdigest(),
+                    {"seconds": KEYFRAME_SAMPLE_SECONDS},
+                ),
+                lambda: _sample_keyframes(input_path, request),
+            )
+    summary = probe_summary(report, keyframes)
+    summary["remux_targets"] = [
+        format_key
+        for format_key in MEDIA_MEDIA_TYPES
+        if can_copy(layout, format_key, format_key in AUDIO_FORMATS)
+    ]
+    return summary
+
+
+async def _plan_trim(
+    context: JobContext, start: float, end: float, format_key: str
+) -> tuple[TrimPlan, MediaLayout | None]:
+    audio_only = format_key in AUDIO_FORMATS
+    layout = await _context_layout(context)
+    if layout is None:
+        # Without a probe, keep the old rule: copy only between like formats.
+        input_ext = context.input_path.suffix.lower().lstrip(".")
+        path = TRIM_REMUX if input_ext == format_key else TRIM_TRANSCODE
+        return TrimPlan(path), None
+    keyframes: list[float] = []
+    if not audio_only and layout.video_codec and start > KEYFRAME_TOLERANCE:
+        result = await run_command(
+            keyframe_probe_args(
+                shutil.which("ffprobe") or "ffprobe",
+                str(context.input_path),
+                start,
+                end,
+            ),
+            request=context.request,
         )
+        if result.returncode == 0:
+            keyframes = parse_keyframes(result.stdout)
+    plan = plan_trim(layout, keyframes, start, end, format_key, audio_only)
+    return plan, layout
+
+
+async def _smart_cut(
+    ffmpeg: str,
+    context: JobContext,
+    layout: MediaLayout,
+    start: float,
+    keyframe: float,
+    end: float,
+    output_path: Path,
+) -> bool:
+    """Re-encode only up to the first keyframe after start, copy the rest.
+
+    The head and the copied tail are written as Matroska pieces in parallel
+    and joined with the concat demuxer. The head is held to the source's
+    profile, level, pixel format and frame size, and probed before the join:
+    returns False, leaving the output unwritten, when libx264 didn't match.
+    Audio is re-encoded from the cut, as copied packets would not start on it.
+    """
+    head_settings = smart_cut_head_args(layout)
+    if head_settings is None:
+        return False
+    input_path = str(context.input_path)
+    head = context.work_dir / "head.mkv"
+    tail = context.work_dir / "tail.mkv"
+    listing = context.work_dir / "parts.txt"
+    head_args = [
+        ffmpeg,
+        "-y",
+        "-ss",
+        str(start),
+        "-i",
+        input_path,
+        "-t",
+        str(keyframe - start),
+        "-map",
+        "0:v:0",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-crf",
+        "18",
+        *head_settings,
+        str(head),
+    ]
+    # Input seeking with stream copy lands on the keyframe at or before the
+    # position; nudging past it keeps float rounding from picking the GOP before.
+    tail_args = [
+        ffmpeg,
+        "-y",
+        "-ss",
+        str(keyframe + 0.001),
+        "-i",
+        input_path,
+        "-t",
+        str(end - keyframe),
+        "-map",
+        "0:v:0",
+        "-c",
+        "copy",
+        str(tail),
+    ]
+    await asyncio.gather(
+        _run_command(head_args, "Trim failed.", context.request),
+        _run_command(tail_args, "Trim failed.", context.request),
+    )
+    report = await _ffprobe_json(head, context.request)
+    if report is None or not same_stream_format(layout, parse_layout(report)):
+        return False
+    listing.write_text(f"file '{head.name}'\nfile '{tail.name}'\n")
+    join_args = [
+        ffmpeg,
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        str(listing),
+        "-ss",
+        str(start),
+        "-i",
+        input_path,
+        "-t",
+        str(end - start),
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a:0?",
+        "-c:v",
+        "copy",
+        *smart_cut_audio_args(layout),
+        str(output_path),
+    ]
+    await _run_ffmpeg(join_args, "Trim failed.", context, end - start)
+    return True
+
+
+@job_manager.operation("media.trim")
+async def _trim_media(context: JobContext) -> JobOutput:
+    """Trim by remux, smart cut or transcode, whichever is cheapest.
+
+    The choice comes from an ffprobe of the stream layout and the keyframes
+    around the cut, and is reported in the X-Trim-Path header.
+    """
+    format_key = context.params["target_format"]
+    start = context.params["start"]
+    end = context.params["end"]
+    ffmpeg = _ensure_binary("ffmpeg")
+    output_path = context.work_dir / f"trim.{format_key}"
+    plan, layout = await _plan_trim(context, start, end, format_key)
+    logger.info(
+        "media.trim.plan path=%s keyframe=%s video=%s audio=%s",
+        plan.path,
+        plan.keyframe,
+        layout.video_codec if layout else None,
+        layout.audio_codec if layout else None,
+    )
+
+    if plan.path == TRIM_SMART_CUT:
+        assert layout is not None and plan.keyframe is not None
+        if not await _smart_cut(
+            ffmpeg, context, layout, start, plan.keyframe, end, output_path
+        ):
+            logger.info("media.trim.plan path=%s reason=head_mismatch", TRIM_TRANSCODE)
+            plan = TrimPlan(TRIM_TRANSCODE)
+    if plan.path != TRIM_SMART_CUT:
+        if plan.path == TRIM_REMUX and format_key in AUDIO_FORMATS:
+            # Input seeking lands on a video keyframe, which would drag in
+            # earlier audio; seeking on output drops packets up to the cut
+            # after demuxing only, nothing is decoded.
+            args = [ffmpeg, "-y", "-i", str(context.input_path), "-ss", str(start)]
+            args += ["-t", str(end - start)]
+        else:
+            seek = start
+            if plan.keyframe is not None:
+                seek = max(start, plan.keyframe) + 0.001
+            args = [ffmpeg, "-y", "-ss", str(seek), "-i", str(context.input_path)]
+            args += ["-t", str(end - (plan.keyframe if plan.keyframe else start))]
+        if format_key in AUDIO_FORMATS:
+            args += ["-vn"]
+        if plan.path == TRIM_REMUX:
+            # Map explicitly: default selection may add streams (e.g. subtitles)
+            # the target container can't take as-is.
+            if format_key in AUDIO_FORMATS:
+                args += ["-map", "0:a:0"]
+            else:
+                args += ["-map", "0:V:0", "-map", "0:a:0?"]
+            args += ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+        elif format_key in AUDIO_FORMATS:
+            args += ["-b:a", "128k"]
+        elif format_key != "webm":
+            args += ["-vcodec", "libx264", "-crf", "23", "-preset", "veryfast"]
+        args.append(str(output_path))
+        await _run_ffmpeg(args, "Trim failed.", context, end - start)
+    return JobOutput(
+        output_path,
+        MEDIA_MEDIA_TYPES[format_key],
+        f"trimmed.{format_key}",
+        headers={"X-Trim-Path": plan.path},
+    )
 
 
 @app.post("/api/media/trim")
@@ -987,6 +2770,8 @@ async def trim_media(
     start: float = Form(...),
     end: float = Form(...),
     target_format: str = Form("mp4"),
+    background: bool = Form(False),
+    progress_id: str | None = Form(None),
 ) -> Response:
     logger.info(
         "media.trim name=%s start=%s end=%s target=%s",
@@ -1002,34 +2787,128 @@ async def trim_media(
     if format_key not in MEDIA_MEDIA_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported media format.")
 
+    _ensure_binary("ffmpeg")
+    params = {"start": start, "end": end, "target_format": format_key}
+    return await _run_operation(
+        request,
+        file,
+        "media.trim",
+        params,
+        background,
+        progress_id=_validate_progress_id(progress_id),
+    )
+
+
+@job_manager.operation("media.compress")
+async def _compress_media(context: JobContext) -> JobOutput:
+    """Compress at a profile's constant quality, or to a size or bitrate.
+
+    A target size is turned into a bitrate with the probed duration, minus
+    the audio's share, and video at a set bitrate is encoded in two passes
+    so one encode lands close to the target.
+    """
+    params = context.params
+    format_key = params["target_format"]
+    profile = COMPRESS_PROFILES[params.get("profile", DEFAULT_COMPRESS_PROFILE)]
+    audio_only = format_key in AUDIO_FORMATS
     ffmpeg = _ensure_binary("ffmpeg")
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        suffix = Path(file.filename or "").suffix
-        input_path = Path(tmp_dir) / f"input{suffix}"
-        await _save_upload(file, input_path)
-        output_path = Path(tmp_dir) / f"trim.{format_key}"
-        input_ext = suffix.lower().lstrip(".")
-        args = [
-            ffmpeg,
-            "-y",
-            "-ss",
-            str(start),
-            "-to",
-            str(end),
-            "-i",
-            str(input_path),
-        ]
-        if input_ext == format_key:
-            args += ["-c", "copy"]
-        elif format_key in AUDIO_FORMATS:
-            args += ["-vn", "-b:a", "128k"]
-        else:
-            args += ["-vcodec", "libx264", "-crf", "23", "-preset", "veryfast"]
-        args.append(str(output_path))
-        _run_command(args, "Trim failed.")
-        return _response_from_file(
-            output_path, MEDIA_MEDIA_TYPES[format_key], f"trimmed.{format_key}"
+    output_path = context.work_dir / f"compress.{format_key}"
+    layout = await _context_layout(context)
+    timings = None
+
+    bit_rate = params.get("bit_rate")
+    if params.get("target_size"):
+        if layout is None or not layout.duration:
+            raise HTTPException(
+                status_code=400, detail="Media duration is unknown; set a bitrate."
+            )
+        bit_rate = size_bit_rate(params["target_size"], layout.duration)
+    audio_rate = profile.audio_bit_rate
+    if audio_only and bit_rate:
+        audio_rate = audio_bit_rate(bit_rate)
+    # Audio already in the target's codec at or under the rate it would be
+    # encoded at only loses quality by going through the encoder again.
+    copy_audio = layout is not None and compress_copies_audio(
+        layout, format_key, audio_rate
+    )
+    if copy_audio:
+        audio_args = ["-c:a", "copy"]
+    else:
+        audio_args = ["-b:a", str(audio_rate)]
+    threads = ["-threads", str(params["threads"])] if params.get("threads") else []
+
+    if audio_only:
+        mode = "bitrate" if bit_rate else "quality"
+        args = [ffmpeg, "-y", "-i", str(context.input_path), "-map", "0:a:0", "-vn"]
+        await _run_ffmpeg(
+            [*args, *audio_args, *threads, str(output_path)],
+            "Compression failed.",
+            context,
         )
+    else:
+        if bit_rate and params.get("target_size"):
+            audio_share = 0
+            if layout is not None and layout.audio_codec:
+                audio_share = (
+                    layout.audio_bit_rate or audio_rate if copy_audio else audio_rate
+                )
+            try:
+                bit_rate = video_bit_rate(bit_rate, audio_share)
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc)) from exc
+        encode_args = []
+        if params.get("max_height"):
+            # -2 keeps the aspect ratio with an even width; min() never upscales.
+            encode_args += ["-vf", f"scale=-2:'min({params['max_height']},ih)'"]
+        encode_args += video_codec_args(format_key, profile, bit_rate) + threads
+        mode = "two_pass" if bit_rate else "quality"
+        segments = _segment_count(context, layout)
+        if segments > 1:
+            timings = await _segmented_video(
+                ffmpeg,
+                context,
+                layout.duration,
+                segments,
+                encode_args,
+                audio_args,
+                output_path,
+                two_pass=bool(bit_rate),
+            )
+        else:
+            args = [ffmpeg, "-y", "-i", str(context.input_path), *encode_args]
+            if bit_rate:
+                passlog = ["-passlogfile", str(context.work_dir / "passlog")]
+                await _run_ffmpeg(
+                    [*args, "-pass", "1", *passlog, "-an", "-f", "null", os.devnull],
+                    "Compression failed.",
+                    context,
+                )
+                args += ["-pass", "2", *passlog]
+            await _run_ffmpeg(
+                [*args, *audio_args, str(output_path)], "Compression failed.", context
+            )
+
+    logger.info(
+        "media.compress.done mode=%s bit_rate=%s copy_audio=%s size=%s",
+        mode,
+        bit_rate,
+        copy_audio,
+        output_path.stat().st_size,
+    )
+    headers = {
+        "X-Stream-Copy": "audio" if copy_audio else "none",
+        "X-Compress-Mode": mode,
+    }
+    if bit_rate:
+        headers["X-Target-Bit-Rate"] = str(audio_rate if audio_only else bit_rate)
+    if timings:
+        headers["X-Segment-Timings"] = _segment_timings_header(timings)
+    return JobOutput(
+        output_path,
+        MEDIA_MEDIA_TYPES[format_key],
+        f"compressed.{format_key}",
+        headers=headers,
+    )
 
 
 @app.post("/api/media/compress")
@@ -1038,36 +2917,202 @@ async def compress_media(
     request: Request,
     file: UploadFile = File(...),
     target_format: str = Form("mp4"),
+    profile: str = Form(DEFAULT_COMPRESS_PROFILE),
+    target_size_mb: float | None = Form(None),
+    bit_rate_kbps: int | None = Form(None),
+    max_height: int | None = Form(None),
+    threads: int | None = Form(None),
+    segments: int = Form(1),
+    concurrency: int | None = Form(None),
+    background: bool = Form(False),
+    progress_id: str | None = Form(None),
 ) -> Response:
-    logger.info("media.compress name=%s target=%s", file.filename, target_format)
+    """Compress media, optionally to a target size or bitrate.
+
+    profile picks the speed/quality trade-off (fast, balanced, quality,
+    smallest). target_size_mb or bit_rate_kbps switches video to a two-pass
+    encode at a set bitrate; for audio targets the bitrate is the audio's.
+    max_height downscales video, threads caps the encoder's threads.
+    segments and concurrency encode video in parallel pieces, as in convert.
+    """
+    logger.info(
+        "media.compress name=%s target=%s profile=%s size_mb=%s kbps=%s",
+        file.filename,
+        target_format,
+        profile,
+        target_size_mb,
+        bit_rate_kbps,
+    )
     format_key = target_format.strip().lower()
     if format_key not in MEDIA_MEDIA_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported media format.")
+    profile_key = profile.strip().lower()
+    if profile_key not in COMPRESS_PROFILES:
+        raise HTTPException(status_code=400, detail="Unknown compression profile.")
+    if target_size_mb is not None and bit_rate_kbps is not None:
+        raise HTTPException(
+            status_code=400, detail="Set a target size or a bitrate, not both."
+        )
+    if target_size_mb is not None and target_size_mb <= 0:
+        raise HTTPException(status_code=400, detail="Invalid target size.")
+    if bit_rate_kbps is not None and not 1 <= bit_rate_kbps <= MAX_BIT_RATE_KBPS:
+        raise HTTPException(status_code=400, detail="Invalid bitrate.")
+    if max_height is not None and not MIN_HEIGHT <= max_height <= MAX_HEIGHT:
+        raise HTTPException(status_code=400, detail="Invalid maximum height.")
+    if threads is not None and not 1 <= threads <= MAX_ENCODER_THREADS:
+        raise HTTPException(status_code=400, detail="Invalid thread count.")
+
+    _ensure_binary("ffmpeg")
+    if target_size_mb is not None:
+        # The size budget is spread over the duration, which only ffprobe gives.
+        _ensure_binary("ffprobe")
+    params = {
+        "target_format": format_key,
+        "profile": profile_key,
+        **_segment_params(segments, concurrency),
+    }
+    if target_size_mb is not None:
+        params["target_size"] = int(target_size_mb * 1024 * 1024)
+    if bit_rate_kbps is not None:
+        params["bit_rate"] = bit_rate_kbps * 1000
+    if max_height is not None:
+        params["max_height"] = max_height
+    if threads is not None:
+        params["threads"] = threads
+    return await _run_operation(
+        request,
+        file,
+        "media.compress",
+        params,
+        background,
+        progress_id=_validate_progress_id(progress_id),
+    )
+
 
+@job_manager.operation("media.package")
+async def _package_media(context: JobContext) -> JobOutput:
+    """Package video as HLS or DASH into a served, expiring directory.
+
+    The result is the package descriptor; the manifest and segments are
+    fetched from /api/media/packages/{id}/ until the package expires.
+    """
+    package_format = context.params["format"]
+    layout = await _context_layout(context)
+    if layout is None or not layout.video_codec:
+        raise HTTPException(status_code=400, detail="No video stream to package.")
+    if not layout.width or not layout.height:
+        raise HTTPException(status_code=400, detail="Video frame size is unknown.")
     ffmpeg = _ensure_binary("ffmpeg")
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        suffix = Path(file.filename or "").suffix
-        input_path = Path(tmp_dir) / f"input{suffix}"
-        await _save_upload(file, input_path)
-        output_path = Path(tmp_dir) / f"compress.{format_key}"
-        args = [ffmpeg, "-y", "-i", str(input_path)]
-        if format_key in AUDIO_FORMATS:
-            args += ["-b:a", "128k", str(output_path)]
-        else:
-            args += [
-                "-vcodec",
-                "libx264",
-                "-crf",
-                "28",
-                "-preset",
-                "veryfast",
-                str(output_path),
-            ]
-
-        _run_command(args, "Compression failed.")
-        return _response_from_file(
-            output_path, MEDIA_MEDIA_TYPES[format_key], f"compressed.{format_key}"
+    heights = context.params["renditions"]
+    # Without renditions, H.264 is only cut into segments, not re-encoded.
+    copy_video = not heights and layout.video_codec in PACKAGE_COPY_CODECS
+    renditions = plan_renditions(layout, heights)
+    package_id, directory = package_store.create()
+    logger.info(
+        "media.package.plan id=%s format=%s copy_video=%s renditions=%s",
+        package_id,
+        package_format,
+        copy_video,
+        ",".join(str(rendition["height"]) for rendition in renditions),
+    )
+    try:
+        await _run_ffmpeg(
+            package_args(
+                ffmpeg,
+                str(context.input_path),
+                str(directory),
+                package_format,
+                layout,
+                renditions,
+                copy_video,
+            ),
+            "Media packaging failed.",
+            context,
+            layout.duration,
         )
+    except BaseException:
+        package_store.discard(directory)
+        raise
+    descriptor = package_store.publish(
+        directory,
+        {
+            "id": package_id,
+            "format": package_format,
+            "manifest": (
+                f"/api/media/packages/{package_id}/{PACKAGE_FORMATS[package_format]}"
+            ),
+            "copied_video": copy_video,
+            "renditions": [] if copy_video else renditions,
+        },
+    )
+    output_path = context.work_dir / "package.json"
+    output_path.write_text(json.dumps(descriptor))
+    return JobOutput(output_path, "application/json", "package.json")
+
+
+@app.post("/api/media/package")
+@limiter.limit("10/minute")
+async def package_media(
+    request: Request,
+    file: UploadFile = File(...),
+    package_format: str = Form("hls"),
+    renditions: str | None = Form(None),
+    background: bool = Form(False),
+    progress_id: str | None = Form(None),
+) -> Response:
+    """Package video for streaming playback as HLS or DASH.
+
+    renditions is a comma-separated list of heights (e.g. "1080,720,480");
+    all of them are encoded from one decode of the source, with keyframes
+    aligned across renditions. Heights above the source are skipped. The
+    response is a JSON descriptor with the manifest URL and expiry time.
+    """
+    logger.info(
+        "media.package name=%s format=%s renditions=%s",
+        file.filename,
+        package_format,
+        renditions,
+    )
+    format_key = package_format.strip().lower()
+    if format_key not in PACKAGE_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported package format.")
+    try:
+        heights = sorted(
+            {int(value) for value in (renditions or "").split(",") if value.strip()},
+            reverse=True,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid renditions.") from None
+    if len(heights) > MAX_RENDITIONS or any(
+        not MIN_HEIGHT <= height <= MAX_HEIGHT for height in heights
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Up to {MAX_RENDITIONS} renditions between {MIN_HEIGHT} and "
+            f"{MAX_HEIGHT} pixels high.",
+        )
+
+    _ensure_binary("ffmpeg")
+    _ensure_binary("ffprobe")
+    return await _run_operation(
+        request,
+        file,
+        "media.package",
+        {"format": format_key, "renditions": heights},
+        background,
+        progress_id=_validate_progress_id(progress_id),
+    )
+
+
+@app.get("/api/media/packages/{package_id}/{name:path}")
+async def media_package_file(package_id: str, name: str) -> FileResponse:
+    path = package_store.file(package_id, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Package file not found.")
+    return FileResponse(
+        path,
+        media_type=PACKAGE_MEDIA_TYPES.get(path.suffix, "application/octet-stream"),
+    )
 
 
 @app.get("/api/network/ip")
@@ -1088,17 +3133,10 @@ async def ping_host(
     host = _safe_host(host)
     logger.info("network.ping host=%s", host)
     ping_bin = _ensure_binary("ping")
-    try:
-        result = subprocess.run(
-            [ping_bin, "-c", "4", "-W", "2", host],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-    except subprocess.CalledProcessError as exc:
-        message = exc.stderr.strip() or exc.stdout.strip()
-        raise HTTPException(status_code=400, detail=message) from exc
+    result = await run_command([ping_bin, "-c", "4", "-W", "2", host], request=request)
+    if result.returncode != 0:
+        message = result.stderr.strip() or result.stdout.strip()
+        raise HTTPException(status_code=400, detail=message)
 
     return {"host": host, "output": result.stdout}
 
@@ -0,0 +1,534 @@
+import statistics
+from dataclasses import dataclass
+
+# Codecs each output container can take without re-encoding.
+CONTAINER_CODECS = {
+    "mp4": {"h264", "hevc", "av1", "mpeg4", "aac", "mp3", "ac3", "opus", "alac"},
+    "mov": {"h264", "hevc", "mpeg4", "prores", "mjpeg", "aac", "mp3", "alac"},
+    "webm": {"vp8", "vp9", "av1", "opus", "vorbis"},
+    "mp3": {"mp3"},
+    "m4a": {"aac", "alac"},
+    "aac": {"aac"},
+    "wav": {"pcm_s16le", "pcm_s24le", "pcm_s32le", "pcm_f32le", "pcm_u8"},
+}
+# Smart cut re-encodes the head up to the next keyframe and joins it to the
+# copied GOPs with the concat demuxer. MP4 and MOV keep the SPS/PPS out of
+# band, and the joined track has one sample entry: the head's. The concat
+# demuxer repeats each piece's parameter sets in-band at its keyframe, but
+# readers that only look at the sample entry decode the tail with the head's,
+# so the head must match the source on everything the entry advertises.
+SMART_CUT_CODECS = {"h264"}
+# ffprobe's name for each H.264 profile libx264 can be held to, and the
+# -profile:v that asks for it. All three are 8-bit 4:2:0 only.
+SMART_CUT_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+}
+SMART_CUT_PIX_FMT = "yuv420p"
+# Audio is re-encoded from the cut so it starts on the same sample as the
+# video; codecs without an encoder here become AAC.
+SMART_CUT_AUDIO_ENCODERS = {"aac": "aac", "alac": "alac", "mp3": "libmp3lame"}
+DEFAULT_SMART_CUT_AUDIO_BIT_RATE = 192_000
+SMART_CUT_FORMATS = {"mp4", "mov"}
+# A cut this close to a keyframe counts as on it (about one frame at 25 fps).
+KEYFRAME_TOLERANCE = 0.04
+# How far before the cut ffprobe starts reading packets for keyframes.
+KEYFRAME_LOOKBEHIND = 30.0
+# Seconds from the start sampled to estimate the keyframe interval.
+KEYFRAME_SAMPLE_SECONDS = 60.0
+# Share of a target size held back for container overhead.
+CONTAINER_OVERHEAD = 0.02
+# Below this a target size leaves too little for watchable video.
+MIN_VIDEO_BIT_RATE = 64_000
+MIN_AUDIO_BIT_RATE = 32_000
+MAX_AUDIO_BIT_RATE = 320_000
+
+# What ffmpeg picks for each video target when no encoder is named; the
+# segmented path names it, so pieces match an unsegmented conversion.
+DEFAULT_VIDEO_ENCODERS = {"mp4": "libx264", "mov": "libx264", "webm": "libvpx-vp9"}
+
+TRIM_REMUX = "remux"
+TRIM_SMART_CUT = "smart_cut"
+TRIM_TRANSCODE = "transcode"
+
+
+@dataclass(frozen=True)
+class MediaLayout:
+    """The parts of an ffprobe report the media planners look at."""
+
+    format_name: str
+    duration: float | None
+    video_codec: str | None
+    audio_codec: str | None
+    pix_fmt: str | None = None
+    bit_rate: int | None = None
+    width: int | None = None
+    height: int | None = None
+    frame_rate: float | None = None
+    audio_bit_rate: int | None = None
+    # H.264 and friends: ffprobe's profile name and level_idc (e.g. 31).
+    profile: str | None = None
+    level: int | None = None
+
+
+@dataclass(frozen=True)
+class CompressProfile:
+    """Encoder settings behind a named compress profile."""
+
+    x264_preset: str
+    # Constant-quality levels, used when no size or bitrate is asked for.
+    crf: int
+    vp9_crf: int
+    # libvpx-vp9 -cpu-used: higher is faster and coarser.
+    vp9_speed: int
+    audio_bit_rate: int
+
+
+COMPRESS_PROFILES = {
+    # "fast" is what compress always did before profiles existed.
+    "fast": CompressProfile("veryfast", 28, 36, 5, 128_000),
+    "balanced": CompressProfile("medium", 26, 33, 3, 128_000),
+    "quality": CompressProfile("slow", 22, 30, 2, 160_000),
+    "smallest": CompressProfile("slow", 32, 40, 2, 96_000),
+}
+DEFAULT_COMPRESS_PROFILE = "fast"
+
+
+@dataclass(frozen=True)
+class TrimPlan:
+    path: str
+    # Where the copied part starts: the keyframe at or after the cut.
+    keyframe: float | None = None
+
+
+def _float(value: object) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value: object) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate(value: object) -> float | None:
+    """ffprobe writes frame rates as fractions, e.g. "30000/1001"."""
+    numerator, _, denominator = str(value or "").partition("/")
+    number = _float(numerator)
+    divisor = _float(denominator or "1")
+    if number is None or not divisor:
+        return None
+    return round(number / divisor, 3)
+
+
+def _primary_streams(report: dict) -> tuple[dict | None, dict | None]:
+    """The first video and audio streams, the ones ffmpeg picks by default."""
+    streams = report.get("streams", [])
+    video = next(
+        (
+            stream
+            for stream in streams
+            if stream.get("codec_type") == "video"
+            # Cover art is stored as a one-frame video stream.
+            and not stream.get("disposition", {}).get("attached_pic")
+        ),
+        None,
+    )
+    audio = next(
+        (stream for stream in streams if stream.get("codec_type") == "audio"), None
+    )
+    return video, audio
+
+
+def parse_layout(report: dict) -> MediaLayout:
+    """Reduce `ffprobe -show_format -show_streams` JSON to a MediaLayout."""
+    video, audio = _primary_streams(report)
+    container = report.get("format", {})
+    video = video or {}
+    audio = audio or {}
+    level = _int(video.get("level"))
+    return MediaLayout(
+        format_name=container.get("format_name", ""),
+        duration=_float(container.get("duration")),
+        video_codec=video.get("codec_name"),
+        audio_codec=audio.get("codec_name"),
+        pix_fmt=video.get("pix_fmt"),
+        bit_rate=_int(container.get("bit_rate")),
+        width=_int(video.get("width")),
+        height=_int(video.get("height")),
+        frame_rate=_rate(video.get("avg_frame_rate")),
+        audio_bit_rate=_int(audio.get("bit_rate")),
+        profile=video.get("profile"),
+        # ffprobe reports -99 when the stream has no level.
+        level=level if level and level > 0 else None,
+    )
+
+
+def keyframe_interval(keyframes: list[float]) -> float | None:
+    """Median gap between keyframes, or None with fewer than two."""
+    gaps = [later - earlier for earlier, later in zip(keyframes, keyframes[1:])]
+    return round(statistics.median(gaps), 3) if gaps else None
+
+
+def probe_summary(report: dict, keyframes: list[float]) -> dict:
+    """The client-facing view of an ffprobe report."""
+    layout = parse_layout(report)
+    video, audio = _primary_streams(report)
+    if video is not None:
+        video = {
+            "codec": layout.video_codec,
+            "profile": layout.profile,
+            "width": layout.width,
+            "height": layout.height,
+            "pix_fmt": layout.pix_fmt,
+            "frame_rate": layout.frame_rate,
+            "bit_rate": _int(video.get("bit_rate")),
+        }
+    if audio is not None:
+        audio = {
+            "codec": layout.audio_codec,
+            "sample_rate": _int(audio.get("sample_rate")),
+            "channels": _int(audio.get("channels")),
+            "bit_rate": layout.audio_bit_rate,
+        }
+    return {
+        "container": layout.format_name,
+        "duration": layout.duration,
+        "bit_rate": layout.bit_rate,
+        "size": _int(report.get("format", {}).get("size")),
+        "video": video,
+        "audio": audio,
+        "keyframe_interval": keyframe_interval(keyframes),
+    }
+
+
+def keyframe_probe_args(ffprobe: str, path: str, start: float, end: float) -> list[str]:
+    """ffprobe arguments listing video packet times and flags around a cut.
+
+    Packets are read without decoding, so this costs a demux of the window
+    only, not of the whole file.
+    """
+    window_start = max(0.0, start - KEYFRAME_LOOKBEHIND)
+    return [
+        ffprobe,
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-read_intervals",
+        f"{window_start}%{end}",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        path,
+    ]
+
+
+def parse_keyframes(output: str) -> list[float]:
+    keyframes = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and (value := _float(pts_time)) is not None:
+            keyframes.append(value)
+    return sorted(keyframes)
+
+
+def can_copy(layout: MediaLayout, target_format: str, audio_only: bool) -> bool:
+    """Whether every stream kept in the output fits the target as-is."""
+    allowed = CONTAINER_CODECS.get(target_format, set())
+    kept = [layout.audio_codec] if audio_only else [layout.video_codec]
+    if not audio_only and layout.audio_codec:
+        kept.append(layout.audio_codec)
+    kept = [codec for codec in kept if codec]
+    return bool(kept) and all(codec in allowed for codec in kept)
+
+
+def copy_streams(
+    layout: MediaLayout, target_format: str, audio_only: bool
+) -> list[str]:
+    """Stream kinds ("video", "audio") that can go into the target as-is."""
+    allowed = CONTAINER_CODECS.get(target_format, set())
+    kinds = []
+    if not audio_only and layout.video_codec in allowed:
+        kinds.append("video")
+    if layout.audio_codec in allowed:
+        kinds.append("audio")
+    return kinds
+
+
+def compress_copies_audio(
+    layout: MediaLayout, target_format: str, bit_rate: int
+) -> bool:
+    """Whether re-encoding the audio for compress would gain nothing.
+
+    True when the audio already fits the target and is at or below the rate
+    compress would encode it at.
+    """
+    return (
+        layout.audio_codec in CONTAINER_CODECS.get(target_format, set())
+        and layout.audio_bit_rate is not None
+        and layout.audio_bit_rate <= bit_rate
+    )
+
+
+def size_bit_rate(target_bytes: int, duration: float) -> int:
+    """Overall bits per second that fill target_bytes over duration."""
+    return int(target_bytes * 8 * (1 - CONTAINER_OVERHEAD) / duration)
+
+
+def audio_bit_rate(bit_rate: int) -> int:
+    return max(MIN_AUDIO_BIT_RATE, min(MAX_AUDIO_BIT_RATE, bit_rate))
+
+
+def video_bit_rate(total_bit_rate: int, audio_share: int) -> int:
+    """What is left for video once the audio has its share.
+
+    Raises ValueError when that is too little to encode anything useful.
+    """
+    remaining = total_bit_rate - audio_share
+    if remaining < MIN_VIDEO_BIT_RATE:
+        raise ValueError("target size is too small for the duration")
+    return remaining
+
+
+def video_codec_args(
+    target_format: str, profile: CompressProfile, bit_rate: int | None = None
+) -> list[str]:
+    """Encoder arguments: constant quality, or an average bitrate when given."""
+    if target_format == "webm":
+        args = ["-c:v", "libvpx-vp9", "-deadline", "good", "-row-mt", "1"]
+        args += ["-cpu-used", str(profile.vp9_speed)]
+        if bit_rate:
+            return args + ["-b:v", str(bit_rate)]
+        # -b:v 0 puts libvpx in constant-quality mode.
+        return args + ["-crf", str(profile.vp9_crf), "-b:v", "0"]
+    args = ["-c:v", "libx264", "-preset", profile.x264_preset]
+    if bit_rate:
+        return args + ["-b:v", str(bit_rate)]
+    return args + ["-crf", str(profile.crf)]
+
+
+def smart_cut_head_args(layout: MediaLayout) -> list[str] | None:
+    """libx264 settings for a head that matches the source's sample entry.
+
+    The head must agree with the copied tail on profile, level, pixel format
+    and frame size. Returns None when libx264 can't be held to the source's
+    values, or the probe didn't report them.
+    """
+    x264_profile = SMART_CUT_PROFILES.get(layout.profile or "")
+    if (
+        x264_profile is None
+        or layout.level is None
+        or layout.pix_fmt != SMART_CUT_PIX_FMT
+        or not layout.width
+        or not layout.height
+    ):
+        return None
+    return [
+        "-profile:v",
+        x264_profile,
+        "-level:v",
+        str(layout.level / 10),
+        "-pix_fmt",
+        layout.pix_fmt,
+    ]
+
+
+def same_stream_format(source: MediaLayout, head: MediaLayout) -> bool:
+    """Whether an encoded head advertises what the source does."""
+    fields = ("profile", "level", "pix_fmt", "width", "height")
+    return all(getattr(source, name) == getattr(head, name) for name in fields)
+
+
+def smart_cut_audio_args(layout: MediaLayout) -> list[str]:
+    """Encoder arguments for the smart cut's re-encoded audio."""
+    encoder = SMART_CUT_AUDIO_ENCODERS.get(layout.audio_codec or "", "aac")
+    if encoder == "alac":
+        return ["-c:a", encoder]
+    bit_rate = audio_bit_rate(layout.audio_bit_rate or DEFAULT_SMART_CUT_AUDIO_BIT_RATE)
+    return ["-c:a", encoder, "-b:a", str(bit_rate)]
+
+
+def plan_trim(
+    layout: MediaLayout,
+    keyframes: list[float],
+    start: float,
+    end: float,
+    target_format: str,
+    audio_only: bool,
+) -> TrimPlan:
+    """Pick the cheapest trim that still cuts at the requested start.
+
+    Remux when the kept streams fit the target and the cut is on a keyframe
+    (or there is no video, since audio packets all decode on their own).
+    Smart cut when only the head of the clip, up to the next keyframe, needs
+    re-encoding and libx264 can match the source's stream format. Otherwise
+    transcode.
+    """
+    if not can_copy(layout, target_format, audio_only):
+        return TrimPlan(TRIM_TRANSCODE)
+    if audio_only or layout.video_codec is None:
+        return TrimPlan(TRIM_REMUX)
+    if start <= KEYFRAME_TOLERANCE:
+        return TrimPlan(TRIM_REMUX, 0.0)
+    for keyframe in keyframes:
+        if abs(keyframe - start) <= KEYFRAME_TOLERANCE:
+            return TrimPlan(TRIM_REMUX, keyframe)
+    following = [keyframe for keyframe in keyframes if keyframe > start]
+    if (
+        following
+        and following[0] < end - KEYFRAME_TOLERANCE
+        and layout.video_codec in SMART_CUT_CODECS
+        and target_format in SMART_CUT_FORMATS
+        and smart_cut_head_args(layout) is not None
+    ):
+        return TrimPlan(TRIM_SMART_CUT, following[0])
+    return TrimPlan(TRIM_TRANSCODE)
+
+
+def segment_times(duration: float, segments: int) -> list[float]:
+    """Even split points for the segment muxer, which moves each one to the
+    next keyframe when cutting with stream copy."""
+    return [round(duration * index / segments, 3) for index in range(1, segments)]
+
+
+def parse_segment_list(text: str) -> list[tuple[str, float, float]]:
+    """Read the segment muxer's CSV list: file name, start and end times."""
+    pieces = []
+    for line in text.splitlines():
+        name, _, times = line.partition(",")
+        start, _, end = times.partition(",")
+        start_time, end_time = _float(start), _float(end)
+        if name and start_time is not None and end_time is not None:
+            pieces.append((name, start_time, end_time))
+    return pieces
+
+
+PACKAGE_FORMATS = {"hls": "master.m3u8", "dash": "manifest.mpd"}
+# Target segment length; renditions get keyframes on this grid so their
+# segments line up and players can switch between them at any boundary.
+PACKAGE_SEGMENT_SECONDS = 4
+# Video a package can carry as-is when no renditions are asked for.
+PACKAGE_COPY_CODECS = {"h264"}
+MAX_RENDITIONS = 4
+# Bitrate per rendition, as bits per pixel per frame (~5 Mb/s at 1080p30).
+BITS_PER_PIXEL = 0.08
+PACKAGE_AUDIO_BIT_RATE = 128_000
+
+
+def plan_renditions(layout: MediaLayout, heights: list[int]) -> list[dict]:
+    """Width, height and bitrate per rendition, largest first.
+
+    Heights above the source are dropped rather than upscaled; with none
+    left (or none asked for) the source size is the single rendition.
+    Raises ValueError when the probe gave no frame size to scale from.
+    """
+    if not layout.width or not layout.height:
+        raise ValueError("video frame size is unknown")
+    source_height = layout.height
+    source_width = layout.width
+    wanted = {height - height % 2 for height in heights if height <= source_height}
+    if not wanted:
+        wanted = {source_height - source_height % 2}
+    renditions = []
+    for height in sorted(wanted, reverse=True):
+        width = round(source_width * height / source_height / 2) * 2
+        bit_rate = int(width * height * (layout.frame_rate or 30) * BITS_PER_PIXEL)
+        renditions.append({"width": width, "height": height, "bit_rate": bit_rate})
+    return renditions
+
+
+def package_args(
+    ffmpeg: str,
+    input_path: str,
+    directory: str,
+    package_format: str,
+    layout: MediaLayout,
+    renditions: list[dict],
+    copy_video: bool,
+) -> list[str]:
+    """One ffmpeg run that writes every rendition of an HLS or DASH package.
+
+    The source is decoded once and split into one scaler and encoder per
+    rendition. Segments are fragmented MP4 for both formats, so the same
+    players that take one take the other.
+    """
+    args = [ffmpeg, "-y", "-i", input_path]
+    if copy_video:
+        args += ["-map", "0:V:0", "-c:v", "copy"]
+    else:
+        labels = [f"v{index}" for index in range(len(renditions))]
+        # Even widths round the aspect slightly differently per rendition; the
+        # DASH muxer rejects an adaptation set whose aspect ratios differ.
+        aspect = f"{layout.width}/{layout.height}" if layout.height else "16/9"
+        graph = f"[0:V:0]split={len(renditions)}" + "".join(
+            f"[s{label}]" for label in labels
+        )
+        for label, rendition in zip(labels, renditions):
+            graph += f";[s{label}]scale={rendition['width']}:{rendition['height']}"
+            graph += f",setdar={aspect}"
+            graph += f"[{label}]"
+        args += ["-filter_complex", graph]
+        for index, (label, rendition) in enumerate(zip(labels, renditions)):
+            bit_rate = rendition["bit_rate"]
+            args += ["-map", f"[{label}]", f"-c:v:{index}", "libx264"]
+            args += [f"-b:v:{index}", str(bit_rate)]
+            args += [f"-maxrate:v:{index}", str(int(bit_rate * 1.1))]
+            args += [f"-bufsize:v:{index}", str(bit_rate * 2)]
+        args += ["-preset", "veryfast", "-sc_threshold", "0", "-pix_fmt", "yuv420p"]
+        args += ["-force_key_frames", f"expr:gte(t,n_forced*{PACKAGE_SEGMENT_SECONDS})"]
+    if layout.audio_codec:
+        args += ["-map", "0:a:0"]
+        if layout.audio_codec == "aac":
+            args += ["-c:a", "copy"]
+        else:
+            args += ["-c:a", "aac", "-b:a", str(PACKAGE_AUDIO_BIT_RATE)]
+
+    video_count = 1 if copy_video else len(renditions)
+    manifest = f"{directory}/{PACKAGE_FORMATS[package_format]}"
+    if package_format == "dash":
+        sets = "id=0,streams=v" + (" id=1,streams=a" if layout.audio_codec else "")
+        return args + [
+            "-f",
+            "dash",
+            "-seg_duration",
+            str(PACKAGE_SEGMENT_SECONDS),
+            "-use_template",
+            "1",
+            "-use_timeline",
+            "1",
+            "-adaptation_sets",
+            sets,
+            manifest,
+        ]
+    variants = [f"v:{index}" for index in range(video_count)]
+    if layout.audio_codec:
+        # One audio rendition shared by every video variant.
+        variants = ["a:0,agroup:audio"] + [
+            f"{variant},agroup:audio" for variant in variants
+        ]
+    return args + [
+        "-f",
+        "hls",
+        "-hls_time",
+        str(PACKAGE_SEGMENT_SECONDS),
+        "-hls_playlist_type",
+        "vod",
+        "-hls_segment_type",
+        "fmp4",
+        "-hls_fmp4_init_filename",
+        "init_%v.mp4",
+        "-hls_segment_filename",
+        f"{directory}/segment_%v_%05d.m4s",
+        "-master_pl_name",
+        PACKAGE_FORMATS[package_format],
+        "-var_stream_map",
+        " ".join(variants),
+        f"{directory}/stream_%v.m3u8",
+    ]
@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger("localforge")
+
+PACKAGE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+# Written last, so a package without it is still being built (or failed).
+DESCRIPTOR_NAME = "package.json"
+PACKAGE_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".mpd": "application/dash+xml",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("config.invalid name=%s value=%s", name, value)
+        return default
+
+
+class PackageStore:
+    """Directories of HLS/DASH output served file by file until they expire.
+
+    Each package is a directory named by a random id holding the manifests,
+    the segments and a descriptor. The descriptor is written once the
+    packaging succeeded; its mtime is the creation time the TTL counts from.
+    Expired packages are removed whenever a new one is created.
+    """
+
+    def __init__(self, root: Path, ttl: float) -> None:
+        self.root = root
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls) -> "PackageStore":
+        return cls(
+            root=Path(os.getenv("MEDIA_PACKAGE_DIR", ".data/packages")),
+            ttl=_env_number("MEDIA_PACKAGE_TTL_SECONDS", 6 * 3600),
+        )
+
+    def create(self) -> tuple[str, Path]:
+        self.purge()
+        package_id = uuid.uuid4().hex
+        directory = self.root / package_id
+        directory.mkdir(parents=True)
+        return package_id, directory
+
+    def publish(self, directory: Path, descriptor: dict) -> dict:
+        """Mark a finished package as servable; returns the descriptor."""
+        descriptor = {**descriptor, "expires_at": time.time() + self.ttl}
+        (directory / DESCRIPTOR_NAME).write_text(json.dumps(descriptor))
+        return descriptor
+
+    def discard(self, directory: Path) -> None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def _created(self, directory: Path) -> float | None:
+        try:
+            return (directory / DESCRIPTOR_NAME).stat().st_mtime
+        except OSError:
+            return None
+
+    def file(self, package_id: str, name: str) -> Path | None:
+        """A file inside a live package, or None.
+
+        Names that would leave the package directory, and packages that are
+        unfinished or past their TTL, resolve to None.
+        """
+        if not PACKAGE_ID_PATTERN.fullmatch(package_id):
+            return None
+        directory = self.root / package_id
+        created = self._created(directory)
+        if created is None:
+            return None
+        if time.time() - created > self.ttl:
+            self.discard(directory)
+            return None
+        path = (directory / name).resolve()
+        if not path.is_relative_to(directory.resolve()) or not path.is_file():
+            return None
+        if path.name == DESCRIPTOR_NAME:
+            return None
+        return path
+
+    def purge(self) -> None:
+        """Remove expired packages, and unfinished ones older than the TTL."""
+        if not self.root.is_dir():
+            return
+        now = time.time()
+        for directory in self.root.iterdir():
+            if not directory.is_dir():
+                continue
+            created = self._created(directory)
+            if created is None:
+                try:
+                    created = directory.stat().st_mtime
+                except OSError:
+                    continue
+            if now - created > self.ttl:
+                self.discard(directory)
+                logger.info("package.purge id=%s", directory.name)
+
+
+package_store = PackageStore.from_env()
@@ -0,0 +1,538 @@
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException
+
+try:  # pyuno ships with LibreOffice itself, not on PyPI.
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+logger = logging.getLogger("localforge")
+
+STARTUP_TIMEOUT = 30.0
+LATENCY_WINDOW = 200
+
+
+@dataclass(frozen=True)
+class OfficeConversion:
+    extension: str
+    convert_to: str
+    filter_name: str
+    infilter: str | None = None
+
+
+DOCX_TO_PDF = OfficeConversion(
+    extension="pdf",
+    convert_to="pdf",
+    filter_name="writer_pdf_Export",
+)
+PDF_TO_DOCX = OfficeConversion(
+    extension="docx",
+    convert_to="docx:Office Open XML Text",
+    filter_name="Office Open XML Text",
+    infilter="writer_pdf_import",
+)
+
+
+class _WorkerStartError(RuntimeError):
+    """The worker's LibreOffice could not be started; not the input's fault."""
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning("config.invalid name=%s value=%s", name, value)
+        return default
+
+
+def _kill_group(process: subprocess.Popen) -> None:
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def _prop(name: str, value: object) -> "PropertyValue":
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _pipe_path(name: str) -> Path | None:
+    """Where LibreOffice puts the socket of a named pipe, once it exists."""
+    for directory in ("/tmp", "/var/tmp"):
+        path = Path(directory) / f"OSL_PIPE_{os.getuid()}_{name}"
+        if path.exists():
+            return path
+    return None
+
+
+class _OfficeWorker:
+    """One LibreOffice instance with a private user profile.
+
+    The worker keeps a headless soffice running on its profile and converts
+    over UNO when pyuno is importable. Without it (Debian's python3-uno is
+    built for the system Python, not the app's), a `soffice --convert-to`
+    on the same profile hands the conversion to the running instance over
+    LibreOffice's single-instance pipe. If the instance won't start, the
+    worker is degraded to one-shot conversions on its warm profile.
+    """
+
+    def __init__(self, index: int, soffice: str, profile_dir: Path) -> None:
+        self.index = index
+        self.soffice = soffice
+        self.profile_dir = profile_dir
+        self.pipe_name = f"localforge-office-{os.getpid()}-{index}"
+        self.process: subprocess.Popen | None = None
+        self.desktop = None
+        self.conversions = 0
+        self.started = False
+        self.degraded = False
+
+    @property
+    def profile_url(self) -> str:
+        return self.profile_dir.resolve().as_uri()
+
+    def start(self) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self.conversions = 0
+        # A killed instance leaves its socket behind, which would pass for a
+        # listening one.
+        stale = _pipe_path(self.pipe_name)
+        if stale is not None:
+            stale.unlink(missing_ok=True)
+        accept = f"pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+        self.process = subprocess.Popen(
+            [
+                self.soffice,
+                f"-env:UserInstallation={self.profile_url}",
+                "--headless",
+                "--invisible",
+                "--nologo",
+                "--nodefault",
+                "--norestore",
+                "--nolockcheck",
+                f"--accept={accept}",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        if uno is not None:
+            self.desktop = self._connect()
+        elif not self._wait_listening():
+            self.stop()
+            self._warm_profile()
+            self.degraded = True
+            logger.warning(
+                "office.pool.degraded worker=%s mode=one_shot reason=listener_failed",
+                self.index,
+            )
+        self.started = True
+        logger.info("office.worker.start index=%s", self.index)
+
+    def stop(self) -> None:
+        if self.process is not None:
+            _kill_group(self.process)
+        self.process = None
+        self.desktop = None
+        self.started = False
+        self.degraded = False
+
+    def recycle(self) -> None:
+        logger.info(
+            "office.worker.recycle index=%s conversions=%s",
+            self.index,
+            self.conversions,
+        )
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+        self.start()
+
+    def is_healthy(self) -> bool:
+        if not self.started:
+            return False
+        if self.degraded:
+            return True
+        if self.process is None or self.process.poll() is not None:
+            return False
+        if uno is None:
+            return True
+        try:
+            self.desktop.getComponents()
+        except Exception:
+            return False
+        return True
+
+    def ensure_ready(self, max_conversions: int) -> bool:
+        """Start, restart, or recycle the worker. Returns True if recycled."""
+        if self.started and self.conversions >= max_conversions:
+            self.recycle()
+            return True
+        if not self.is_healthy():
+            if self.started:
+                logger.warning("office.worker.unhealthy index=%s", self.index)
+            self.stop()
+            self.start()
+        return False
+
+    def convert(
+        self,
+        input_path: Path,
+        output_dir: Path,
+        spec: OfficeConversion,
+        timeout: float,
+    ) -> Path:
+        output_path = output_dir / f"{input_path.stem}.{spec.extension}"
+        if uno is None:
+            self._convert_cli(input_path, output_dir, spec, timeout)
+        else:
+            self._convert_uno(input_path, output_path, spec, timeout)
+        self.conversions += 1
+        return output_path
+
+    def _warm_profile(self) -> None:
+        if (self.profile_dir / "user").exists():
+            return
+        process = subprocess.Popen(
+            [
+                self.soffice,
+                f"-env:UserInstallation={self.profile_url}",
+                "--headless",
+                "--terminate_after_init",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        try:
+            process.wait(timeout=STARTUP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            _kill_group(process)
+
+    def _wait_listening(self) -> bool:
+        """Wait for the instance to open its pipe, i.e. finish starting up."""
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while _pipe_path(self.pipe_name) is None:
+            exited = self.process is None or self.process.poll() is not None
+            if exited or time.monotonic() > deadline:
+                return False
+            time.sleep(0.25)
+        return True
+
+    def _connect(self):
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context
+        )
+        url = f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(url)
+                return context.ServiceManager.createInstanceWithContext(
+                    "com.sun.star.frame.Desktop", context
+                )
+            except NoConnectException:
+                exited = self.process is None or self.process.poll() is not None
+                if exited or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError("LibreOffice listener did not start.")
+                time.sleep(0.25)
+
+    def _convert_cli(
+        self,
+        input_path: Path,
+        output_dir: Path,
+        spec: OfficeConversion,
+        timeout: float,
+    ) -> None:
+        args = [
+            self.soffice,
+            f"-env:UserInstallation={self.profile_url}",
+            "--headless",
+        ]
+        if spec.infilter:
+            args.append(f"--infilter={spec.infilter}")
+        args += ["--convert-to", spec.convert_to, "--outdir", str(output_dir)]
+        args.append(str(input_path))
+        process = subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired as exc:
+            _kill_group(process)
+            raise TimeoutError from exc
+        if process.returncode != 0:
+            raise RuntimeError(stderr.strip() or stdout.strip())
+
+    def _convert_uno(
+        self,
+        input_path: Path,
+        output_path: Path,
+        spec: OfficeConversion,
+        timeout: float,
+    ) -> None:
+        # A hung document blocks the UNO call; killing soffice unblocks it.
+        watchdog = threading.Timer(timeout, self.stop)
+        watchdog.start()
+        try:
+            load_props = [_prop("Hidden", True), _prop("ReadOnly", True)]
+            if spec.infilter:
+                load_props.append(_prop("FilterName", spec.infilter))
+            document = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(str(input_path.resolve())),
+                "_blank",
+                0,
+                tuple(load_props),
+            )
+            if document is None:
+                raise RuntimeError("LibreOffice could not load the document.")
+            try:
+                document.storeToURL(
+                    uno.systemPathToFileUrl(str(output_path.resolve())),
+                    (_prop("FilterName", spec.filter_name),),
+                )
+            finally:
+                document.close(True)
+        except Exception as exc:
+            if not watchdog.is_alive():
+                raise TimeoutError from exc
+            raise
+        finally:
+            watchdog.cancel()
+
+
+class OfficePool:
+    """Bounded pool of warm LibreOffice workers with a backpressured queue."""
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_conversions: int = 50,
+        max_queue: int = 16,
+        timeout: float = 120.0,
+        profile_root: Path | None = None,
+    ) -> None:
+        self.size = size
+        self.max_conversions = max_conversions
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.profile_root = profile_root or (
+            Path(tempfile.gettempdir()) / "localforge-office"
+        )
+        self._workers: list[_OfficeWorker] = []
+        self._idle: asyncio.Queue[_OfficeWorker] | None = None
+        self._waiting = 0
+        self._busy = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._recycled = 0
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    @classmethod
+    def from_env(cls) -> "OfficePool":
+        profile_root = os.getenv("OFFICE_POOL_PROFILE_DIR")
+        return cls(
+            size=_env_int("OFFICE_POOL_SIZE", 2),
+            max_conversions=_env_int("OFFICE_POOL_MAX_CONVERSIONS", 50),
+            max_queue=_env_int("OFFICE_POOL_MAX_QUEUE", 16),
+            timeout=float(_env_int("OFFICE_CONVERSION_TIMEOUT", 120)),
+            profile_root=Path(profile_root) if profile_root else None,
+        )
+
+    def log_mode(self) -> None:
+        """Say at startup how conversions will reach LibreOffice."""
+        if uno is None:
+            logger.info("office.pool.mode mode=listener size=%s pyuno=false", self.size)
+        else:
+            logger.info("office.pool.mode mode=uno size=%s", self.size)
+
+    def _ensure_workers(self, soffice: str) -> asyncio.Queue[_OfficeWorker]:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for index in range(self.size):
+                worker = _OfficeWorker(
+                    index, soffice, self.profile_root / f"worker-{index}"
+                )
+                self._workers.append(worker)
+                self._idle.put_nowait(worker)
+        return self._idle
+
+    async def convert(
+        self,
+        soffice: str,
+        input_path: Path,
+        output_dir: Path,
+        spec: OfficeConversion,
+    ) -> Path:
+        idle = self._ensure_workers(soffice)
+        if idle.empty() and self._waiting >= self.max_queue:
+            self._rejected += 1
+            logger.warning(
+                "office.queue_full waiting=%d max=%d", self._waiting, self.max_queue
+            )
+            raise HTTPException(
+                status_code=503,
+                detail="Conversion queue is full. Please retry shortly.",
+            )
+
+        self._waiting += 1
+        try:
+            worker = await idle.get()
+        finally:
+            self._waiting -= 1
+
+        self._busy += 1
+        start_time = time.perf_counter()
+        # The thread can't be interrupted, so a cancelled request leaves the
+        # worker checked out until its conversion has finished.
+        work = asyncio.ensure_future(
+            asyncio.to_thread(self._run, worker, input_path, output_dir, spec)
+        )
+        try:
+            recycled, output_path = await asyncio.shield(work)
+        except asyncio.CancelledError:
+            work.add_done_callback(lambda _: self._release(idle, worker, work))
+            raise
+        except TimeoutError as exc:
+            self._failed += 1
+            self._release(idle, worker)
+            logger.error("office.convert.timeout worker=%s", worker.index)
+            raise HTTPException(
+                status_code=504, detail="Conversion timed out."
+            ) from exc
+        except _WorkerStartError as exc:
+            self._failed += 1
+            self._release(idle, worker)
+            logger.error(
+                "office.worker.start_failed worker=%s error=%s", worker.index, exc
+            )
+            raise HTTPException(
+                status_code=503,
+                detail="Document converter is unavailable. Please retry shortly.",
+            ) from exc
+        except Exception as exc:
+            self._failed += 1
+            self._release(idle, worker)
+            logger.error("office.convert.failed worker=%s error=%s", worker.index, exc)
+            raise HTTPException(
+                status_code=400,
+                detail="Processing failed. Please check your input and try again.",
+            ) from exc
+        else:
+            self._release(idle, worker)
+        if recycled:
+            self._recycled += 1
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        self._completed += 1
+        self._latencies.append(duration_ms)
+        logger.info(
+            "office.convert worker=%s target=%s duration_ms=%.2f",
+            worker.index,
+            spec.extension,
+            duration_ms,
+        )
+        return output_path
+
+    def _run(
+        self,
+        worker: _OfficeWorker,
+        input_path: Path,
+        output_dir: Path,
+        spec: OfficeConversion,
+    ) -> tuple[bool, Path]:
+        """Prepare the worker and convert; returns whether it was recycled."""
+        try:
+            recycled = worker.ensure_ready(self.max_conversions)
+        except Exception as exc:
+            worker.stop()
+            raise _WorkerStartError(str(exc)) from exc
+        try:
+            return recycled, worker.convert(input_path, output_dir, spec, self.timeout)
+        except TimeoutError:
+            worker.stop()
+            raise
+
+    def _release(
+        self,
+        idle: asyncio.Queue[_OfficeWorker],
+        worker: _OfficeWorker,
+        abandoned: asyncio.Future | None = None,
+    ) -> None:
+        # The request that started an abandoned conversion is gone, so its
+        # outcome is accounted for here.
+        if abandoned is not None and not abandoned.cancelled():
+            error = abandoned.exception()
+            if error is not None:
+                self._failed += 1
+                logger.warning(
+                    "office.convert.abandoned worker=%s error=%s", worker.index, error
+                )
+            elif abandoned.result()[0]:
+                self._recycled += 1
+        self._busy -= 1
+        idle.put_nowait(worker)
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction: float) -> float | None:
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(len(latencies) * fraction))
+            return round(latencies[index], 2)
+
+        mode = "uno" if uno is not None else "listener"
+        if any(worker.degraded for worker in self._workers):
+            mode = "one_shot"
+        return {
+            "mode": mode,
+            "size": self.size,
+            "started_workers": sum(1 for worker in self._workers if worker.started),
+            "busy": self._busy,
+            "queue_depth": self._waiting,
+            "max_queue": self.max_queue,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "recycled": self._recycled,
+            "latency_ms": {
+                "samples": len(latencies),
+                "avg": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 2) if latencies else None,
+            },
+        }
+
+    def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.stop()
@@ -0,0 +1,209 @@
+import os
+import re
+import struct
+from pathlib import Path
+from typing import BinaryIO
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+
+def write_pdf_parts(input_path: str, parts: list[tuple[list[int], str]]) -> None:
+    """Write each (page indexes, output path) part of one source PDF.
+
+    Runs in the process pool; a batch of parts shares one parse of the source.
+    """
+    with open(input_path, "rb") as handle:
+        reader = PdfReader(handle)
+        for pages, output_path in parts:
+            writer = PdfWriter()
+            for index in pages:
+                writer.add_page(reader.pages[index])
+            writer.write(output_path)
+
+
+def extract_page_text(input_path: str, start: int, stop: int) -> list[dict]:
+    """Extract the text of pages [start, stop) as one record per page.
+
+    Runs in the process pool. A page whose content can't be parsed gets an
+    error instead of failing the whole batch.
+    """
+    records = []
+    with open(input_path, "rb") as handle:
+        reader = PdfReader(handle)
+        for index in range(start, stop):
+            record = {"type": "page", "page": index + 1}
+            try:
+                record["text"] = reader.pages[index].extract_text()
+            except Exception as exc:
+                record["text"] = ""
+                record["error"] = type(exc).__name__
+            records.append(record)
+    return records
+
+
+def _outline_items(reader: PdfReader, items: list) -> list[dict]:
+    # pypdf lists an entry's children as a nested list right after it.
+    result: list[dict] = []
+    for item in items:
+        if isinstance(item, list):
+            if result:
+                result[-1]["children"] = _outline_items(reader, item)
+            continue
+        page = reader.get_destination_page_number(item)
+        result.append(
+            {
+                "title": item.title,
+                "page": page + 1 if page is not None and page >= 0 else None,
+                "children": [],
+            }
+        )
+    return result
+
+
+def document_outline(input_path: str) -> list[dict]:
+    """Bookmarks as nested {title, page, children}; runs in the process pool."""
+    with open(input_path, "rb") as handle:
+        reader = PdfReader(handle)
+        return _outline_items(reader, reader.outline)
+
+
+def _startxref(handle: BinaryIO) -> int:
+    handle.seek(0, os.SEEK_END)
+    size = handle.tell()
+    handle.seek(max(0, size - 2048))
+    matches = re.findall(rb"startxref\s+(\d+)", handle.read())
+    if not matches:
+        raise ValueError("startxref not found")
+    return int(matches[-1])
+
+
+def page_count(reader: PdfReader) -> int:
+    """The page count from the page tree root, without flattening the tree.
+
+    len(reader.pages) resolves every page of an unencrypted file first;
+    pypdf itself reads /Count only for encrypted ones.
+    """
+    try:
+        count = int(reader.trailer["/Root"]["/Pages"]["/Count"])
+    except (KeyError, TypeError, ValueError):
+        return len(reader.pages)
+    return count if count >= 0 else len(reader.pages)
+
+
+def _locate_page(
+    reader: PdfReader, index: int
+) -> tuple[IndirectObject, DictionaryObject, int]:
+    """Find a page by walking /Count down the page tree, without flattening it.
+
+    reader.pages resolves and copies every page in the document on first
+    use; this touches only the nodes on the way to one page. Returns the
+    page's reference, its dictionary and its effective /Rotate.
+    """
+    node = reader.trailer["/Root"]["/Pages"]
+    rotation = node.get("/Rotate", 0)
+    while True:
+        # A /Count can't tell one-page kids apart from empty /Pages nodes, so
+        # every kid's own count is checked on the way down.
+        for reference in node["/Kids"]:
+            kid = reference.get_object()
+            count = kid.get("/Count", 0) if kid.get("/Type") == "/Pages" else 1
+            if index >= count:
+                index -= count
+                continue
+            if kid.get("/Type") != "/Pages":
+                return reference, kid, int(kid.get("/Rotate", rotation))
+            node = kid
+            rotation = kid.get("/Rotate", rotation)
+            break
+        else:
+            raise ValueError("page index out of range")
+
+
+def append_rotation_update(
+    reader: PdfReader, path: Path, targets: set[int], angle: int
+) -> None:
+    """Rotate pages by appending an incremental update to the file at path.
+
+    Only the page dictionaries in targets are rewritten, after the original
+    bytes, followed by a cross-reference section that points at them and
+    chains to the previous one through /Prev. Everything already in the file
+    is left byte-for-byte as it was. The section uses the same form (table or
+    stream) as the file's latest one. Raises ValueError when the file's own
+    cross-reference data can't be chained to; callers then rewrite instead.
+    """
+    updates = []
+    for index in sorted(targets):
+        try:
+            reference, page, rotation = _locate_page(reader, index)
+        except (AttributeError, IndexError, KeyError, TypeError) as exc:
+            raise ValueError(f"malformed page tree: {exc!r}") from exc
+        page[NameObject("/Rotate")] = NumberObject((rotation + angle) % 360)
+        updates.append((reference.idnum, reference.generation, page))
+
+    with path.open("r+b") as handle:
+        previous = _startxref(handle)
+        handle.seek(previous)
+        head = handle.read(32)
+        previous_is_table = head.startswith(b"xref")
+        if not previous_is_table and not re.match(rb"\d+\s+\d+\s+obj", head):
+            # pypdf repaired a bad startxref; chaining to it would break the file.
+            raise ValueError("startxref does not point at a cross-reference section")
+        handle.seek(0, os.SEEK_END)
+        handle.write(b"\n")
+        offsets = {}
+        for idnum, generation, page in updates:
+            offsets[idnum] = (handle.tell(), generation)
+            handle.write(f"{idnum} {generation} obj\n".encode())
+            page.write_to_stream(handle)
+            handle.write(b"\nendobj\n")
+
+        trailer = DictionaryObject(
+            {
+                NameObject(key): reader.trailer.raw_get(key)
+                for key in ("/Root", "/Info", "/ID")
+                if key in reader.trailer
+            }
+        )
+        trailer[NameObject("/Prev")] = NumberObject(previous)
+        size = int(reader.trailer["/Size"])
+        xref_offset = handle.tell()
+        if previous_is_table:
+            trailer[NameObject("/Size")] = NumberObject(size)
+            handle.write(b"xref\n")
+            for idnum in sorted(offsets):
+                offset, generation = offsets[idnum]
+                handle.write(
+                    f"{idnum} 1\n{offset:010d} {generation:05d} n\r\n".encode()
+                )
+            handle.write(b"trailer\n")
+            trailer.write_to_stream(handle)
+        else:
+            # The xref stream is itself a new object, numbered at the old /Size.
+            trailer[NameObject("/Type")] = NameObject("/XRef")
+            trailer[NameObject("/Size")] = NumberObject(size + 1)
+            trailer[NameObject("/W")] = ArrayObject(
+                [NumberObject(1), NumberObject(4), NumberObject(2)]
+            )
+            trailer[NameObject("/Index")] = ArrayObject(
+                [NumberObject(n) for idnum in sorted(offsets) for n in (idnum, 1)]
+            )
+            stream = StreamObject.initialize_from_dictionary(
+                {**trailer, "__streamdata__": b""}
+            )
+            stream.set_data(
+                b"".join(
+                    struct.pack(">BIH", 1, *offsets[idnum]) for idnum in sorted(offsets)
+                )
+            )
+            handle.write(f"{size} 0 obj\n".encode())
+            stream.write_to_stream(handle)
+            handle.write(b"\nendobj\n")
+        handle.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
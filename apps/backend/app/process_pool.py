@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Callable, TypeVar
+
+logger = logging.getLogger("localforge")
+
+T = TypeVar("T")
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def pool_size() -> int:
+    default = os.cpu_count() or 2
+    value = os.getenv("PROCESS_POOL_SIZE")
+    if not value:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning("config.invalid name=PROCESS_POOL_SIZE value=%s", value)
+        return default
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Shared pool for CPU-bound work (Pillow, pypdf) sized to the cores.
+
+    Workers come from a forkserver rather than fork: the server process has
+    event-loop and thread-pool threads that a forked child must not inherit.
+    """
+    global _executor
+    if _executor is None:
+        size = pool_size()
+        _executor = ProcessPoolExecutor(
+            max_workers=size,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        logger.info("process_pool.start size=%s", size)
+    return _executor
+
+
+def run_in_process(func: Callable[..., T], *args, **kwargs) -> "asyncio.Future[T]":
+    """Schedule a picklable, module-level function on the shared pool."""
+    loop = asyncio.get_running_loop()
+    call = partial(func, *args, **kwargs)
+    try:
+        return loop.run_in_executor(get_process_pool(), call)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); the executor refuses new work.
+        logger.error("process_pool.broken restarting=true")
+        shutdown_process_pool()
+        return loop.run_in_executor(get_process_pool(), call)
+
+
+def shutdown_process_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,148 @@
+import asyncio
+import re
+import time
+from typing import AsyncIterator, Callable
+
+RETENTION_SECONDS = 600.0
+DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+PROGRESS_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+
+class ProgressHub:
+    """In-process fan-out of progress snapshots keyed by job or request id.
+
+    Subscribers get the latest snapshot immediately and every update after
+    it. Finished snapshots are kept for a while so a client that connects
+    late still sees how the run ended.
+    """
+
+    def __init__(self) -> None:
+        self._latest: dict[str, dict] = {}
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    def latest(self, key: str) -> dict | None:
+        return self._latest.get(key)
+
+    def publish(self, key: str, snapshot: dict) -> None:
+        snapshot = {**snapshot, "updated_at": time.time()}
+        self._latest[key] = snapshot
+        for queue in self._subscribers.get(key, ()):
+            queue.put_nowait(snapshot)
+        self._prune()
+
+    def finish(self, key: str, status: str, error: str | None = None) -> None:
+        snapshot = {**self._latest.get(key, {}), "status": status, "done": True}
+        if status == "succeeded":
+            snapshot["percent"] = 100.0
+            snapshot["eta_seconds"] = 0.0
+        if error:
+            snapshot["error"] = error
+        self.publish(key, snapshot)
+
+    async def subscribe(
+        self, key: str, idle_interval: float
+    ) -> AsyncIterator[dict | None]:
+        """Yield snapshots as they arrive, or None after each idle interval."""
+        queue: asyncio.Queue[dict] = asyncio.Queue()
+        self._subscribers.setdefault(key, set()).add(queue)
+        try:
+            if key in self._latest:
+                yield self._latest[key]
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), idle_interval)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            subscribers = self._subscribers.get(key, set())
+            subscribers.discard(queue)
+            if not subscribers:
+                self._subscribers.pop(key, None)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - RETENTION_SECONDS
+        stale = [
+            key
+            for key, snapshot in self._latest.items()
+            if snapshot["updated_at"] < cutoff and key not in self._subscribers
+        ]
+        for key in stale:
+            del self._latest[key]
+
+
+progress_hub = ProgressHub()
+
+
+def _seconds_from_micros(value: str | None) -> float | None:
+    try:
+        return int(value or "") / 1_000_000
+    except ValueError:
+        return None
+
+
+def _float_or_none(value: str | None) -> float | None:
+    try:
+        return float((value or "").rstrip("x"))
+    except ValueError:
+        return None
+
+
+class FfmpegProgress:
+    """Parse `ffmpeg -progress pipe:1` output into progress snapshots.
+
+    ffmpeg prints key=value lines and closes each block with a
+    progress=continue|end line. The total duration comes from the caller
+    when it is known (trims) or from the Duration: line ffmpeg logs on stderr.
+    """
+
+    def __init__(
+        self, publish: Callable[[dict], None], duration: float | None = None
+    ) -> None:
+        self.publish = publish
+        self.duration = duration
+        self._block: dict[str, str] = {}
+
+    def feed_stderr(self, line: str) -> None:
+        if self.duration is not None:
+            return
+        match = DURATION_PATTERN.search(line)
+        if match:
+            hours, minutes, seconds = match.groups()
+            self.duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    def feed_stdout(self, line: str) -> None:
+        key, _, value = line.strip().partition("=")
+        if not key:
+            return
+        self._block[key] = value
+        if key == "progress":
+            self._emit()
+            self._block = {}
+
+    def _emit(self) -> None:
+        # out_time_ms is microseconds too, despite the name.
+        out_time = _seconds_from_micros(
+            self._block.get("out_time_us") or self._block.get("out_time_ms")
+        )
+        speed = _float_or_none(self._block.get("speed"))
+        percent = None
+        eta_seconds = None
+        if self.duration and out_time is not None:
+            percent = round(min(100.0, max(0.0, out_time / self.duration * 100)), 2)
+            if speed:
+                remaining = max(0.0, self.duration - out_time)
+                eta_seconds = round(remaining / speed, 2)
+        frame = self._block.get("frame")
+        self.publish(
+            {
+                "status": "running",
+                "percent": percent,
+                "out_time": out_time,
+                "duration": self.duration,
+                "frame": int(frame) if frame and frame.isdigit() else None,
+                "fps": _float_or_none(self._block.get("fps")),
+                "speed": speed,
+                "eta_seconds": eta_seconds,
+                "done": False,
+            }
+        )
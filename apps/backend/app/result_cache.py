@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+logger = logging.getLogger("localforge")
+
+# Bump when an operation's output format changes so old entries stop matching.
+CACHE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    path: Path
+    media_type: str
+    filename: str
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("config.invalid name=%s value=%s", name, value)
+        return default
+
+
+class ResultCache:
+    """Disk cache of conversion outputs keyed by input hash and parameters.
+
+    Each entry is a data file plus a small JSON sidecar. The data file's
+    mtime is bumped on every hit and drives LRU eviction; the sidecar is
+    written once, so its mtime is the creation time the TTL counts from.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, ttl: float) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            root=Path(os.getenv("RESULT_CACHE_DIR", ".data/cache")),
+            max_bytes=int(_env_number("RESULT_CACHE_MAX_MB", 512) * 1024 * 1024),
+            ttl=_env_number("RESULT_CACHE_TTL_SECONDS", 24 * 3600),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl > 0
+
+    @staticmethod
+    def key(operation: str, input_digest: str, params: dict) -> str:
+        normalized = json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "operation": operation,
+                "input": input_digest,
+                "params": params,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        shard = self.root / key[:2]
+        return shard / f"{key}.bin", shard / f"{key}.json"
+
+    def get(self, key: str, copy_to: Path | None = None) -> CacheEntry | None:
+        """Look up an entry, optionally linking its data into `copy_to`.
+
+        A response served straight from the cache would fail if eviction or
+        the TTL removed the file mid-send; the private link keeps it alive.
+        """
+        if not self.enabled:
+            return None
+        data_path, meta_path = self._paths(key)
+        try:
+            created = meta_path.stat().st_mtime
+            meta = json.loads(meta_path.read_text())
+            if time.time() - created > self.ttl:
+                self._remove(data_path, meta_path)
+                return None
+            os.utime(data_path)
+            if copy_to is not None:
+                data_path = self._link(data_path, copy_to / data_path.name)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(data_path, meta["media_type"], meta["filename"])
+
+    def put_file(self, key: str, source: Path, media_type: str, filename: str) -> None:
+        """Copy an output into the cache; failures only cost the cache entry."""
+        if not self.enabled:
+            return
+
+        def write(tmp) -> None:
+            with source.open("rb") as src:
+                shutil.copyfileobj(src, tmp)
+
+        self._store(key, source.stat().st_size, write, media_type, filename)
+
+    def put_bytes(self, key: str, data: bytes, media_type: str, filename: str) -> None:
+        if self.enabled:
+            self._store(
+                key, len(data), lambda tmp: tmp.write(data), media_type, filename
+            )
+
+    def _store(
+        self,
+        key: str,
+        size: int,
+        write: Callable[[BinaryIO], object],
+        media_type: str,
+        filename: str,
+    ) -> None:
+        """Write an entry through a temp file in its shard, then swap it in."""
+        if size > self.max_bytes:
+            return
+        data_path, meta_path = self._paths(key)
+        tmp_name = None
+        try:
+            data_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=data_path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp:
+                write(tmp)
+            # Sidecar first: a data file without metadata is never served.
+            meta_path.write_text(
+                json.dumps({"media_type": media_type, "filename": filename})
+            )
+            try:
+                replaced = data_path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_name, data_path)
+        except OSError as exc:
+            logger.warning("cache.store_failed key=%s error=%s", key[:12], exc)
+            if tmp_name is not None:
+                Path(tmp_name).unlink(missing_ok=True)
+            return
+        self._account(size - replaced)
+
+    def _account(self, added: int) -> None:
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_size()
+            else:
+                self._size += added
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[Path, Path]]:
+        entries = []
+        for data_path in self.root.glob("*/*.bin"):
+            entries.append((data_path, data_path.with_suffix(".json")))
+        return entries
+
+    def _disk_size(self) -> int:
+        total = 0
+        for data_path, _ in self._entries():
+            try:
+                total += data_path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under budget.
+
+        The running size is only an estimate across processes, so it is
+        recomputed from disk here.
+        """
+        now = time.time()
+        live = []
+        total = 0
+        for data_path, meta_path in self._entries():
+            try:
+                data_stat = data_path.stat()
+                created = meta_path.stat().st_mtime
+            except OSError:
+                self._remove(data_path, meta_path)
+                continue
+            if now - created > self.ttl:
+                self._remove(data_path, meta_path)
+                continue
+            live.append((data_stat.st_mtime, data_stat.st_size, data_path, meta_path))
+            total += data_stat.st_size
+
+        live.sort()
+        evicted = 0
+        # Leave headroom so the next few stores don't trigger another scan.
+        target = self.max_bytes * 0.9
+        for _, size, data_path, meta_path in live:
+            if total <= target:
+                break
+            self._remove(data_path, meta_path)
+            total -= size
+            evicted += 1
+        self._size = total
+        logger.info("cache.evict removed=%d size=%d", evicted, total)
+
+    @staticmethod
+    def _link(source: Path, target: Path) -> Path:
+        try:
+            os.link(source, target)
+        except OSError:
+            # Another filesystem, or no hard links: fall back to a copy.
+            shutil.copyfile(source, target)
+        return target
+
+    @staticmethod
+    def _remove(data_path: Path, meta_path: Path) -> None:
+        data_path.unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+
+
+result_cache = ResultCache.from_env()
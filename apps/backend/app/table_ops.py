@@ -0,0 +1,142 @@
+import csv
+import io
+import math
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+# Excel's hard limit, header row included.
+EXCEL_MAX_ROWS = 1_048_576
+CSV_CHUNK_ROWS = 10_000
+TYPE_SAMPLE_ROWS = 1_000
+# Rows per CSV chunk handed to the response when streaming a sheet.
+CSV_STREAM_ROWS = 2_000
+
+BOOLEAN_VALUES = {"true": True, "false": False}
+
+
+def _infer_column_kinds(input_path: Path) -> dict[str, str]:
+    """Pick numeric, boolean or text per column from the first rows only."""
+    sample = pd.read_csv(input_path, nrows=TYPE_SAMPLE_ROWS)
+    kinds = {}
+    for name, dtype in sample.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            kinds[name] = "boolean"
+        elif pd.api.types.is_numeric_dtype(dtype):
+            kinds[name] = "numeric"
+        else:
+            kinds[name] = "text"
+    return kinds
+
+
+def _typed_column(values: pd.Series, kind: str) -> list:
+    """Convert one chunk's column of strings to cell values.
+
+    Cells that don't fit the sampled type stay text rather than failing the
+    conversion; missing cells become empty.
+    """
+    if kind == "numeric":
+        numbers = pd.to_numeric(values, errors="coerce")
+        cells = numbers.astype(object).where(numbers.notna(), values)
+    elif kind == "boolean":
+        flags = values.str.lower().map(BOOLEAN_VALUES)
+        cells = flags.astype(object).where(flags.notna(), values)
+    else:
+        cells = values.astype(object)
+    return [
+        None if isinstance(cell, float) and math.isnan(cell) else cell
+        for cell in cells.tolist()
+    ]
+
+
+def write_xlsx_rows(
+    header: list[str],
+    rows: Iterable[Sequence],
+    output_path: Path,
+    sheet_rows: int = EXCEL_MAX_ROWS,
+) -> None:
+    """Append rows through openpyxl's write-only workbook.
+
+    Each sheet is streamed to disk as it is written, so memory does not grow
+    with the row count. When a sheet reaches sheet_rows (header included)
+    the rest continues on Sheet2, Sheet3, ... each starting with the header.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = None
+    rows_in_sheet = sheet_rows
+    for row in rows:
+        if rows_in_sheet >= sheet_rows:
+            sheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+            sheet.append(header)
+            rows_in_sheet = 1
+        sheet.append(row)
+        rows_in_sheet += 1
+    if sheet is None:
+        workbook.create_sheet("Sheet1").append(header)
+    workbook.save(output_path)
+
+
+def write_xlsx_from_csv(
+    input_path: Path, output_path: Path, sheet_rows: int = EXCEL_MAX_ROWS
+) -> None:
+    """Convert CSV to XLSX with memory bounded by the chunk size.
+
+    Rows are read CSV_CHUNK_ROWS at a time as strings and typed with the
+    column kinds inferred from a sample before they reach the write-only
+    workbook. Runs in the process pool.
+    """
+    kinds = _infer_column_kinds(input_path)
+
+    def rows() -> Iterator[tuple]:
+        chunks = pd.read_csv(input_path, dtype=str, chunksize=CSV_CHUNK_ROWS)
+        for chunk in chunks:
+            columns = [
+                _typed_column(chunk[name], kinds.get(name, "text"))
+                for name in chunk.columns
+            ]
+            yield from zip(*columns)
+
+    write_xlsx_rows(list(kinds), rows(), output_path, sheet_rows)
+
+
+def sheet_names(input_path: Path) -> list[str]:
+    workbook = load_workbook(input_path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def iter_sheet_csv(input_path: Path, sheet_name: str | None = None) -> Iterator[bytes]:
+    """Yield one sheet as UTF-8 CSV, CSV_STREAM_ROWS rows per chunk.
+
+    The workbook is opened read-only, so openpyxl parses rows from the sheet
+    XML as they are iterated instead of building the whole workbook; memory
+    is bounded by one chunk. The first sheet is used when none is named.
+    """
+    workbook = load_workbook(input_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for count, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+            writer.writerow(row)
+            if count % CSV_STREAM_ROWS == 0:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    finally:
+        workbook.close()
+
+
+def write_csv_from_xlsx(
+    input_path: Path, output_path: Path, sheet_name: str | None = None
+) -> None:
+    """Write one sheet to a CSV file; runs in the process pool."""
+    with output_path.open("wb") as output:
+        for chunk in iter_sheet_csv(input_path, sheet_name):
+            output.write(chunk)
@@ -0,0 +1,38 @@
+import zipfile
+from typing import AsyncIterable, AsyncIterator
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever zipfile has written.
+
+    It has no seek/tell, so zipfile writes local headers with data
+    descriptors and the archive can be sent while it is being built.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(
+    entries: AsyncIterable[tuple[str, bytes]],
+    compression: int = zipfile.ZIP_DEFLATED,
+) -> AsyncIterator[bytes]:
+    """Yield a zip archive chunk by chunk as (name, data) entries arrive."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=compression) as archive:
+        async for name, data in entries:
+            archive.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
@@ -1,16 +1,56 @@
+import asyncio
 import io
+import json
 import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import wave
 import zipfile
+from dataclasses import replace
+from pathlib import Path
 
 import pandas as pd
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from PIL import Image
-from pypdf import PdfWriter
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
 
+from app.commands import run_command
+from app import main as main_module
+from app.jobs import JobContext, JobStore, job_manager
 from app.main import app
-
+from app.media_packages import PackageStore
+from app.media_ops import (
+    COMPRESS_PROFILES,
+    MediaLayout,
+    copy_streams,
+    package_args,
+    parse_layout,
+    parse_segment_list,
+    plan_renditions,
+    plan_trim,
+    probe_summary,
+    segment_times,
+    size_bit_rate,
+    smart_cut_head_args,
+    video_bit_rate,
+    video_codec_args,
+)
+from app.office_pool import DOCX_TO_PDF, OfficePool
+from app.progress import FfmpegProgress
+from app.result_cache import ResultCache, result_cache
+from app import table_ops
+from app.table_ops import write_xlsx_from_csv
 
 client = TestClient(app)
 
@@ -101,6 +141,228 @@ def test_pdf_merge_split_rotate():
     assert rotate.content.startswith(b"%PDF")
 
 
+def test_pdf_merge_dedupes_shared_resources():
+    scan = io.BytesIO()
+    Image.effect_noise((200, 200), 64).save(scan, format="PDF")
+    files = [
+        ("files", (f"scan-{index}.pdf", scan.getvalue(), "application/pdf"))
+        for index in range(3)
+    ]
+    deduped = client.post("/api/pdf/merge", files=files)
+    plain = client.post("/api/pdf/merge", files=files, data={"dedupe": "false"})
+    assert deduped.status_code == 200
+    assert plain.status_code == 200
+    assert len(deduped.content) < len(plain.content) / 2
+    assert len(PdfReader(io.BytesIO(deduped.content)).pages) == 3
+
+
+def test_pdf_rotate_appends_incremental_update():
+    original = make_pdf_bytes(3)
+    response = client.post(
+        "/api/pdf/rotate",
+        files={"file": ("d.pdf", original, "application/pdf")},
+        data={"angle": "90", "pages": "2"},
+    )
+    assert response.status_code == 200
+    assert response.content.startswith(original)
+    reader = PdfReader(io.BytesIO(response.content))
+    assert [page.rotation for page in reader.pages] == [0, 90, 0]
+
+    rewritten = client.post(
+        "/api/pdf/rotate",
+        files={"file": ("d.pdf", original, "application/pdf")},
+        data={"angle": "270", "pages": "1", "incremental": "false"},
+    )
+    assert rewritten.status_code == 200
+    assert not rewritten.content.startswith(original)
+    reader = PdfReader(io.BytesIO(rewritten.content))
+    assert [page.rotation for page in reader.pages] == [270, 0, 0]
+
+
+def test_pdf_rotate_incremental_walks_nested_page_trees():
+    writer = PdfWriter()
+    for width in (100, 200, 300):
+        writer.add_blank_page(width=width, height=200)
+    root = writer._root_object["/Pages"].get_object()
+    first, second, third = list(root["/Kids"])
+    # A legal but unusual tree: an empty /Pages node, a two-page node, a leaf.
+    empty = writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Pages"),
+                NameObject("/Kids"): ArrayObject(),
+                NameObject("/Count"): NumberObject(0),
+                NameObject("/Parent"): writer._root_object.raw_get("/Pages"),
+            }
+        )
+    )
+    middle = writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Pages"),
+                NameObject("/Kids"): ArrayObject([first, second]),
+                NameObject("/Count"): NumberObject(2),
+                NameObject("/Parent"): writer._root_object.raw_get("/Pages"),
+            }
+        )
+    )
+    for page in (first, second):
+        page.get_object()[NameObject("/Parent")] = middle
+    root[NameObject("/Kids")] = ArrayObject([empty, middle, third])
+    output = io.BytesIO()
+    writer.write(output)
+
+    response = client.post(
+        "/api/pdf/rotate",
+        files={"file": ("d.pdf", output.getvalue(), "application/pdf")},
+        data={"angle": "90", "pages": "2"},
+    )
+    assert response.status_code == 200
+    assert response.content.startswith(output.getvalue())
+    reader = PdfReader(io.BytesIO(response.content))
+    rotations = [(page.mediabox.width, page.rotation) for page in reader.pages]
+    assert rotations == [(100, 0), (200, 90), (300, 0)]
+
+
+def make_text_pdf_bytes(lines: list[str]) -> bytes:
+    writer = PdfWriter()
+    font = writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            }
+        )
+    )
+    for line in lines:
+        page = writer.add_blank_page(width=200, height=200)
+        content = StreamObject()
+        content.set_data(f"BT /F1 12 Tf 20 100 Td ({line}) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+    writer.add_outline_item("Second", 1)
+    writer.add_metadata({"/Title": "Extract me"})
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def test_pdf_extract_streams_ndjson_pages():
+    pdf = make_text_pdf_bytes([f"Page {number}" for number in range(1, 21)])
+    responses = [
+        client.post(
+            "/api/pdf/extract",
+            files={"file": ("text.pdf", pdf, "application/pdf")},
+        )
+        for _ in range(2)
+    ]
+    for response in responses:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert responses[0].content == responses[1].content
+
+    records = [json.loads(line) for line in responses[0].text.splitlines()]
+    assert records[0]["type"] == "document"
+    assert records[0]["page_count"] == 20
+    assert records[0]["metadata"]["Title"] == "Extract me"
+    pages = [record for record in records if record["type"] == "page"]
+    assert [record["page"] for record in pages] == list(range(1, 21))
+    assert pages[14]["text"].strip() == "Page 15"
+    assert records[-1] == {
+        "type": "outline",
+        "outline": [{"title": "Second", "page": 2, "children": []}],
+    }
+
+
+def test_pdf_split_strides_and_every_n():
+    pdf = make_pdf_bytes(10)
+    response = client.post(
+        "/api/pdf/split",
+        files={"file": ("long.pdf", pdf, "application/pdf")},
+        data={"ranges": "every 3, 1-9/2"},
+    )
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == [f"split-{i}.pdf" for i in range(1, 6)]
+        assert all(
+            info.compress_type == zipfile.ZIP_STORED for info in archive.infolist()
+        )
+        sizes = [
+            len(PdfReader(io.BytesIO(archive.read(f"split-{i}.pdf"))).pages)
+            for i in range(1, 6)
+        ]
+    assert sizes == [3, 3, 3, 1, 5]
+
+    invalid = client.post(
+        "/api/pdf/split",
+        files={"file": ("long.pdf", pdf, "application/pdf")},
+        data={"ranges": "odd"},
+    )
+    assert invalid.status_code == 400
+
+
+def test_file_responses_support_ranges_and_clean_up():
+    tmp_root = Path(tempfile.gettempdir())
+    before = set(tmp_root.glob("localforge-*"))
+    response = client.post(
+        "/api/pdf/rotate",
+        files={"file": ("d.pdf", make_pdf_bytes(1), "application/pdf")},
+        data={"angle": "90"},
+        headers={"Range": "bytes=0-3"},
+    )
+    assert response.status_code == 206
+    assert response.content == b"%PDF"
+    assert "attachment" in response.headers["content-disposition"]
+    assert set(tmp_root.glob("localforge-*")) == before
+
+
+def test_streaming_responses_clean_up_when_the_client_is_gone(tmp_path):
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    async def chunks():
+        yield b"first"
+        yield b"second"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            raise OSError("connection reset")
+
+    response = main_module._WorkDirStreamingResponse(chunks(), str(work_dir))
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(Exception):
+        asyncio.run(response(scope, receive, send))
+    assert not work_dir.exists()
+
+
+def test_chunked_upload_over_limit_is_rejected():
+    boundary = "localforge-boundary"
+
+    def body():
+        yield (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="file"; filename="big.pdf"\r\n'
+            "Content-Type: application/pdf\r\n\r\n"
+        ).encode()
+        chunk = b"0" * (1024 * 1024)
+        for _ in range(51):
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post(
+        "/api/pdf/split",
+        content=body(),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    assert response.status_code == 413
+
+
 def test_pdf_optimize_requires_ghostscript():
     response = client.post(
         "/api/pdf/optimize",
@@ -113,6 +375,62 @@ def test_pdf_optimize_requires_ghostscript():
     else:
         assert response.status_code == 501
 
+    sharded = client.post(
+        "/api/pdf/optimize",
+        files={"file": ("e.pdf", make_pdf_bytes(5), "application/pdf")},
+        data={"level": "ebook", "shards": "2"},
+    )
+    if shutil.which("gs"):
+        assert sharded.status_code == 200
+        assert len(PdfReader(io.BytesIO(sharded.content)).pages) == 5
+        assert sharded.headers["X-Original-Size"].isdigit()
+        assert sharded.headers["X-Shard-Timings"].startswith("1-3=")
+    else:
+        assert sharded.status_code == 501
+
+    invalid = client.post(
+        "/api/pdf/optimize",
+        files={"file": ("e.pdf", make_pdf_bytes(1), "application/pdf")},
+        data={"level": "screen", "shards": "0"},
+    )
+    assert invalid.status_code == 400
+
+
+def test_pdf_thumbnails_render_selected_pages():
+    pdf = make_pdf_bytes(4)
+    response = client.post(
+        "/api/pdf/thumbnails",
+        files={"file": ("t.pdf", pdf, "application/pdf")},
+        data={"pages": "2-4", "dpi": "36", "format": "webp"},
+    )
+    if shutil.which("gs"):
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert sorted(archive.namelist()) == [
+                "page-2.webp",
+                "page-3.webp",
+                "page-4.webp",
+            ]
+            with Image.open(io.BytesIO(archive.read("page-2.webp"))) as image:
+                assert image.format == "WEBP"
+                assert image.size == (100, 100)
+        single = client.post(
+            "/api/pdf/thumbnails",
+            files={"file": ("t.pdf", pdf, "application/pdf")},
+            data={"pages": "3", "dpi": "36"},
+        )
+        assert single.status_code == 200
+        assert single.headers["content-type"] == "image/png"
+    else:
+        assert response.status_code == 501
+
+    invalid = client.post(
+        "/api/pdf/thumbnails",
+        files={"file": ("t.pdf", pdf, "application/pdf")},
+        data={"format": "gif"},
+    )
+    assert invalid.status_code == 400
+
 
 def test_docx_and_pdf_conversion():
     libreoffice_available = shutil.which("soffice") or shutil.which("libreoffice")
@@ -159,6 +477,65 @@ def test_docx_and_pdf_conversion():
         assert response.status_code == 501
 
 
+def test_office_pool_metrics():
+    response = client.get("/api/convert/office-pool")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["mode"] in {"listener", "one_shot", "uno"}
+    assert data["queue_depth"] == 0
+    assert {"p50", "p95", "max"}.issubset(data["latency_ms"])
+
+
+def test_office_pool_holds_worker_until_cancelled_conversion_ends(tmp_path):
+    pool = OfficePool(size=1, profile_root=tmp_path / "profiles")
+    finish = threading.Event()
+
+    def slow_run(worker, input_path, output_dir, spec):
+        finish.wait(5)
+        return False, output_dir / "input.pdf"
+
+    pool._run = slow_run
+
+    async def scenario():
+        request = asyncio.create_task(
+            pool.convert("soffice", tmp_path / "input.docx", tmp_path, DOCX_TO_PDF)
+        )
+        await asyncio.sleep(0.05)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        # The thread is still converting: the worker must not be handed out.
+        assert pool.metrics()["busy"] == 1
+        finish.set()
+        return await asyncio.wait_for(
+            pool.convert("soffice", tmp_path / "input.docx", tmp_path, DOCX_TO_PDF),
+            timeout=5,
+        )
+
+    assert asyncio.run(scenario()) == tmp_path / "input.pdf"
+    assert pool.metrics()["busy"] == 0
+
+
+def test_office_pool_reports_worker_start_failures_as_unavailable(tmp_path):
+    pool = OfficePool(size=1, profile_root=tmp_path / "profiles")
+
+    async def scenario():
+        pool._ensure_workers("soffice")
+        worker = pool._workers[0]
+
+        def fail_start(max_conversions):
+            raise RuntimeError("LibreOffice listener did not start.")
+
+        worker.ensure_ready = fail_start
+        await pool.convert("soffice", tmp_path / "input.docx", tmp_path, DOCX_TO_PDF)
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+    assert excinfo.value.status_code == 503
+    assert pool.metrics()["failed"] == 1
+    assert pool.metrics()["busy"] == 0
+
+
 def test_csv_xlsx_conversion():
     csv_data = b"name,age\nAlice,30\nBob,25\n"
     response = client.post(
@@ -179,6 +556,203 @@ def test_csv_xlsx_conversion():
     assert b"name,age" in response.content
 
 
+def test_csv_to_xlsx_streams_typed_rows_across_sheets(tmp_path, monkeypatch):
+    from openpyxl import load_workbook
+
+    # Types come from the first two rows; later misfits stay text.
+    monkeypatch.setattr(table_ops, "TYPE_SAMPLE_ROWS", 2)
+    csv_path = tmp_path / "input.csv"
+    csv_path.write_text(
+        "name,count,active\nAlice,3,true\nBob,,False\nCara,x1,maybe\nDan,4.5,TRUE\n"
+    )
+    output_path = tmp_path / "output.xlsx"
+    write_xlsx_from_csv(csv_path, output_path, sheet_rows=3)
+
+    workbook = load_workbook(output_path, read_only=True)
+    assert workbook.sheetnames == ["Sheet1", "Sheet2"]
+    rows = [list(sheet.values) for sheet in workbook.worksheets]
+    assert rows[0] == [
+        ("name", "count", "active"),
+        ("Alice", 3, True),
+        ("Bob", None, False),
+    ]
+    assert rows[1] == [
+        ("name", "count", "active"),
+        ("Cara", "x1", "maybe"),
+        ("Dan", 4.5, True),
+    ]
+    workbook.close()
+
+
+def test_xlsx_to_csv_exports_all_sheets():
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        pd.DataFrame({"name": ["Alice"], "age": [30]}).to_excel(
+            writer, sheet_name="People", index=False
+        )
+        pd.DataFrame({"item": ["pen", "ink"], "price": [1.5, 2]}).to_excel(
+            writer, sheet_name="Prices", index=False
+        )
+    workbook = buffer.getvalue()
+
+    first = client.post(
+        "/api/convert/xlsx-to-csv",
+        files={"file": ("book.xlsx", workbook, "application/octet-stream")},
+    )
+    assert first.status_code == 200
+    assert first.text == "name,age\nAlice,30\n"
+
+    response = client.post(
+        "/api/convert/xlsx-to-csv",
+        files={"file": ("book.xlsx", workbook, "application/octet-stream")},
+        data={"all_sheets": "true"},
+    )
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == ["People.csv", "Prices.csv"]
+        assert archive.read("Prices.csv") == b"item,price\npen,1.5\nink,2\n"
+
+    invalid = client.post(
+        "/api/convert/xlsx-to-csv",
+        files={"file": ("book.xlsx", b"not a workbook", "application/octet-stream")},
+    )
+    assert invalid.status_code == 400
+
+
+def test_table_conversion_round_trips_through_parquet():
+    pq = pytest.importorskip("pyarrow.parquet")
+    csv_data = b"name,age,score\nAlice,30,1.5\nBob,25,\n"
+    response = client.post(
+        "/api/convert/table",
+        files={"file": ("people.csv", csv_data, "text/csv")},
+        data={"target_format": "parquet"},
+    )
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 2
+    assert table.column("age").to_pylist() == [30, 25]
+    assert table.column("score").to_pylist() == [1.5, None]
+
+    jsonl = client.post(
+        "/api/convert/table",
+        files={
+            "file": ("people.parquet", response.content, "application/octet-stream")
+        },
+        data={"target_format": "jsonl"},
+    )
+    assert jsonl.status_code == 200
+    assert [json.loads(line) for line in jsonl.text.splitlines()] == [
+        {"name": "Alice", "age": 30, "score": 1.5},
+        {"name": "Bob", "age": 25, "score": None},
+    ]
+
+    xlsx = client.post(
+        "/api/convert/table",
+        files={"file": ("people.jsonl", jsonl.content, "application/x-ndjson")},
+        data={"target_format": "xlsx"},
+    )
+    assert xlsx.status_code == 200
+    assert pd.read_excel(io.BytesIO(xlsx.content))["name"].tolist() == [
+        "Alice",
+        "Bob",
+    ]
+
+    arrow = client.post(
+        "/api/convert/table",
+        files={"file": ("people.xlsx", xlsx.content, "application/octet-stream")},
+        data={"target_format": "arrow"},
+    )
+    assert arrow.status_code == 200
+    assert arrow.content.startswith(b"ARROW1")
+
+    invalid = client.post(
+        "/api/convert/table",
+        files={"file": ("people.txt", csv_data, "text/plain")},
+        data={"target_format": "parquet"},
+    )
+    assert invalid.status_code == 400
+
+
+def test_background_job_lifecycle(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_manager, "data_dir", tmp_path)
+    monkeypatch.setattr(job_manager, "store", JobStore(tmp_path / "jobs.sqlite3"))
+    with TestClient(app) as job_client:
+        response = job_client.post(
+            "/api/convert/csv-to-xlsx",
+            files={"file": ("sample.csv", b"name,age\nAlice,30\n", "text/csv")},
+            data={"background": "true"},
+        )
+        assert response.status_code == 202
+        job = response.json()
+        assert response.headers["location"] == f"/api/jobs/{job['id']}"
+
+        deadline = time.monotonic() + 10
+        while job["status"] in {"queued", "running"} and time.monotonic() < deadline:
+            time.sleep(0.05)
+            job = job_client.get(f"/api/jobs/{job['id']}").json()
+        assert job["status"] == "succeeded"
+
+        result = job_client.get(job["result_url"])
+        assert result.status_code == 200
+        assert result.content.startswith(b"PK")
+
+        cancel = job_client.delete(f"/api/jobs/{job['id']}")
+        assert cancel.json()["status"] == "succeeded"
+
+    assert client.get("/api/jobs/" + "0" * 32).status_code == 404
+
+
+def test_job_store_leases_are_exclusive(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.create("a" * 32, "convert.csv_to_xlsx", {}, tmp_path, tmp_path / "in.csv")
+    assert store.claim("first", lease=0.0)["worker_id"] == "first"
+    time.sleep(0.01)
+    # The first worker's lease lapsed and the job was claimed again.
+    assert store.claim("second", lease=30.0)["worker_id"] == "second"
+    assert store.heartbeat("a" * 32, "first", 30.0) == (False, False)
+    assert not store.update("a" * 32, "first", status="succeeded")
+    assert store.heartbeat("a" * 32, "second", 30.0) == (True, False)
+    assert store.update("a" * 32, "second", status="succeeded")
+    assert store.get("a" * 32)["status"] == "succeeded"
+
+
+def test_job_store_fails_jobs_that_keep_losing_their_worker(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.create("b" * 32, "convert.csv_to_xlsx", {}, tmp_path, tmp_path / "in.csv")
+    store.claim("worker", lease=30.0)
+    # A clean shutdown hands the job back without using up an attempt.
+    store.release("b" * 32, "worker")
+    for _ in range(2):
+        assert store.claim("worker", lease=0.0) is not None
+        time.sleep(0.01)
+    assert store.get("b" * 32)["attempts"] == 2
+    assert store.claim("worker", lease=0.0, max_attempts=2) is None
+    job = store.get("b" * 32)
+    assert (job["status"], job["attempts"]) == ("failed", 2)
+    assert job["error"]
+
+
+def test_job_submit_removes_upload_when_the_insert_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_manager, "data_dir", tmp_path / "jobs")
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(job_manager, "store", store)
+
+    def busy(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "create", busy)
+    work_dir = tmp_path / "upload"
+    work_dir.mkdir()
+    (work_dir / "input.csv").write_bytes(b"a\n1\n")
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(
+            job_manager.submit(
+                "convert.csv_to_xlsx", work_dir, work_dir / "input.csv", {}
+            )
+        )
+    assert list((tmp_path / "jobs").iterdir()) == []
+
+
 def test_markdown_to_pdf_dependency_check():
     response = client.post(
         "/api/convert/markdown-to-pdf",
@@ -236,6 +810,159 @@ def test_image_toolkit_endpoints():
     assert strip_exif.status_code == 200
 
 
+def test_image_batch_pipeline():
+    image_data = make_image_bytes()
+    operations = '[{"op": "resize", "width": 8}, {"op": "convert", "format": "jpeg"}]'
+    response = client.post(
+        "/api/image/batch",
+        files=[
+            ("files", ("a.png", image_data, "image/png")),
+            ("files", ("a.png", image_data, "image/png")),
+            ("files", ("broken.png", b"not an image", "image/png")),
+        ],
+        data={"operations": operations},
+    )
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == ["a-1.jpeg", "a.jpeg", "errors.json"]
+        with Image.open(io.BytesIO(archive.read("a.jpeg"))) as image:
+            assert image.size == (8, 8)
+            assert image.format == "JPEG"
+
+    bundle = io.BytesIO()
+    with zipfile.ZipFile(bundle, "w") as archive:
+        archive.writestr("photos/one.png", image_data)
+        archive.writestr("notes.txt", b"skip me")
+    response = client.post(
+        "/api/image/batch",
+        files={"files": ("photos.zip", bundle.getvalue(), "application/zip")},
+    )
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["one.png"]
+
+    invalid = client.post(
+        "/api/image/batch",
+        files={"files": ("a.png", image_data, "image/png")},
+        data={"operations": '[{"op": "rotate"}]'},
+    )
+    assert invalid.status_code == 400
+
+
+def test_image_batch_bounds_images_in_flight(monkeypatch):
+    submitted = []
+
+    def fake_run(func, data, operations, format_key):
+        submitted.append(data)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(data)
+        return future
+
+    async def scenario():
+        inputs = [(f"{index}.png", bytes([index])) for index in range(7)]
+        names = []
+        async for name, _ in main_module._batch_results(inputs, []):
+            names.append(name)
+            # Submitted but not yet yielded: at most two per pool slot.
+            assert len(submitted) - len(names) <= 2
+        return names
+
+    monkeypatch.setattr(main_module, "pool_size", lambda: 1)
+    monkeypatch.setattr(main_module, "run_in_process", fake_run)
+    names = asyncio.run(scenario())
+    assert sorted(names) == sorted(f"{index}.png" for index in range(7))
+
+
+def test_image_pipeline_single_encode():
+    image = Image.new("RGBA", (40, 20), (0, 128, 255, 255))
+    source = io.BytesIO()
+    image.save(source, format="PNG")
+    operations = (
+        '[{"op": "crop", "x": 0, "y": 0, "width": 20, "height": 20},'
+        ' {"op": "resize", "width": 10}, {"op": "watermark", "text": "x"},'
+        ' {"op": "convert", "format": "jpg"}]'
+    )
+    response = client.post(
+        "/api/image/pipeline",
+        files={"file": ("photo.png", source.getvalue(), "image/png")},
+        data={"operations": operations},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "photo-edited.jpg" in response.headers["content-disposition"]
+    with Image.open(io.BytesIO(response.content)) as result:
+        assert result.size == (10, 10)
+        assert result.mode == "RGB"
+
+
+def test_strip_exif_removes_metadata_without_reencoding():
+    exif = Image.Exif()
+    exif[0x010F] = "Camera"
+    photo = Image.new("RGB", (32, 32), (10, 200, 30))
+    source = io.BytesIO()
+    photo.save(source, format="JPEG", exif=exif, icc_profile=b"\0" * 128)
+    jpeg = source.getvalue()
+    response = client.post(
+        "/api/image/strip-exif",
+        files={"file": ("photo.jpg", jpeg, "image/jpeg")},
+    )
+    assert response.status_code == 200
+    assert response.headers["x-metadata-removed"] == "exif,icc"
+    scan = jpeg.index(b"\xff\xda")
+    assert response.content.endswith(jpeg[scan:])
+    with Image.open(io.BytesIO(response.content)) as clean:
+        assert not clean.getexif()
+        assert "icc_profile" not in clean.info
+
+    webp = io.BytesIO()
+    photo.save(webp, format="WEBP", exif=exif)
+    response = client.post(
+        "/api/image/strip-exif",
+        files={"file": ("photo.webp", webp.getvalue(), "image/webp")},
+    )
+    assert response.headers["x-metadata-removed"] == "exif"
+    with Image.open(io.BytesIO(response.content)) as clean:
+        assert "exif" not in clean.info
+        clean.load()
+
+    response = client.post(
+        "/api/image/strip-exif",
+        files={"file": ("photo.jpg", jpeg, "image/jpeg")},
+        data={"target_format": "png"},
+    )
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["x-metadata-removed"] == "exif,icc"
+
+
+def test_resize_thumbnail_and_filters():
+    photo = Image.new("RGB", (400, 200), (200, 100, 50))
+    source = io.BytesIO()
+    photo.save(source, format="JPEG")
+    response = client.post(
+        "/api/image/resize",
+        files={"file": ("photo.jpg", source.getvalue(), "image/jpeg")},
+        data={"width": "50", "height": "50", "mode": "thumbnail"},
+    )
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.content)) as thumb:
+        assert thumb.size == (50, 25)
+
+    response = client.post(
+        "/api/image/resize",
+        files={"file": ("photo.jpg", source.getvalue(), "image/jpeg")},
+        data={"width": "100", "resample": "lanczos"},
+    )
+    with Image.open(io.BytesIO(response.content)) as resized:
+        assert resized.size == (100, 50)
+
+    invalid = client.post(
+        "/api/image/resize",
+        files={"file": ("photo.jpg", source.getvalue(), "image/jpeg")},
+        data={"width": "100", "resample": "sinc"},
+    )
+    assert invalid.status_code == 400
+
+
 def test_media_endpoints():
     audio_data = make_wav_bytes()
     responses = [
@@ -267,6 +994,405 @@ def test_media_endpoints():
         assert all(response.status_code == 501 for response in responses)
 
 
+def test_trim_picks_remux_smart_cut_or_transcode():
+    layout = MediaLayout(
+        "mov,mp4,m4a,3gp,3g2,mj2",
+        20.0,
+        "h264",
+        "aac",
+        "yuv420p",
+        width=1280,
+        height=720,
+        profile="Main",
+        level=31,
+    )
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0]
+    assert plan_trim(layout, keyframes, 4.0, 9.0, "mp4", False).path == "remux"
+    smart = plan_trim(layout, keyframes, 3.3, 9.1, "mp4", False)
+    assert (smart.path, smart.keyframe) == ("smart_cut", 4.0)
+    assert plan_trim(layout, keyframes, 3.3, 3.9, "mp4", False).path == "transcode"
+    assert plan_trim(layout, keyframes, 3.3, 9.1, "webm", False).path == "transcode"
+    assert plan_trim(layout, keyframes, 3.3, 9.1, "m4a", True).path == "remux"
+    # libx264 can't write a head whose parameter sets match these sources.
+    for mismatch in (
+        {"profile": "High 4:4:4 Predictive", "pix_fmt": "yuv444p"},
+        {"profile": "Baseline"},
+        {"level": None},
+    ):
+        unmatched = replace(layout, **mismatch)
+        assert plan_trim(unmatched, keyframes, 3.3, 9.1, "mp4", False).path == (
+            "transcode"
+        )
+    assert smart_cut_head_args(layout) == [
+        "-profile:v",
+        "main",
+        "-level:v",
+        "3.1",
+        "-pix_fmt",
+        "yuv420p",
+    ]
+
+    response = client.post(
+        "/api/media/trim",
+        files={"file": ("audio.wav", make_wav_bytes(), "audio/wav")},
+        data={"start": "0", "end": "0.05", "target_format": "wav"},
+    )
+    if shutil.which("ffmpeg"):
+        assert response.status_code == 200
+        assert response.headers["x-trim-path"] == "remux"
+    else:
+        assert response.status_code == 501
+
+
+def test_smart_cut_matches_source_stream_format(tmp_path):
+    ffmpeg = shutil.which("ffmpeg")
+    ffprobe = shutil.which("ffprobe")
+    if not ffmpeg or not ffprobe:
+        pytest.skip("ffmpeg and ffprobe not available")
+    # Baseline, CAVLC, one reference frame: nothing like the head encoder's
+    # defaults, so a head written with them would describe the wrong stream.
+    source = tmp_path / "source.mp4"
+    created = asyncio.run(
+        run_command(
+            [
+                ffmpeg,
+                "-v",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                "testsrc2=size=480x270:rate=25:duration=6",
+                "-f",
+                "lavfi",
+                "-i",
+                "sine=frequency=440:duration=6",
+                "-c:v",
+                "libx264",
+                "-preset",
+                "ultrafast",
+                "-profile:v",
+                "baseline",
+                "-level:v",
+                "2.1",
+                "-g",
+                "25",
+                "-c:a",
+                "aac",
+                str(source),
+            ]
+        )
+    )
+    assert created.returncode == 0, created.stderr
+
+    response = client.post(
+        "/api/media/trim",
+        files={"file": ("source.mp4", source.read_bytes(), "video/mp4")},
+        data={"start": "1.3", "end": "4.1", "target_format": "mp4"},
+    )
+    assert response.status_code == 200
+    assert response.headers["x-trim-path"] == "smart_cut"
+    output = tmp_path / "trimmed.mp4"
+    output.write_bytes(response.content)
+
+    probed = asyncio.run(
+        run_command(
+            [
+                ffprobe,
+                "-v",
+                "error",
+                "-print_format",
+                "json",
+                "-show_format",
+                "-show_streams",
+                str(output),
+            ]
+        )
+    )
+    layout = parse_layout(json.loads(probed.stdout))
+    assert (layout.profile, layout.level) == ("Constrained Baseline", 21)
+    assert (layout.width, layout.height, layout.audio_codec) == (480, 270, "aac")
+
+    def frame_hashes(path: Path) -> list[str]:
+        result = asyncio.run(
+            run_command(
+                [ffmpeg, "-v", "error", "-i", str(path), "-map", "0:v:0"]
+                + ["-fps_mode", "passthrough", "-f", "framemd5", "-"]
+            )
+        )
+        assert result.returncode == 0 and not result.stderr, result.stderr
+        lines = result.stdout.splitlines()
+        return [line.rsplit(",", 1)[1].strip() for line in lines if line[:1] != "#"]
+
+    # Decodes cleanly: 17 re-encoded frames from 1.32s, then the copied GOPs
+    # from the keyframe at 2.0s (frame 50), identical to the source's.
+    trimmed = frame_hashes(output)
+    assert len(trimmed) == 69
+    assert trimmed[17:] == frame_hashes(source)[50:102]
+
+
+def test_media_probe_reports_layout_and_copyable_streams():
+    report = {
+        "format": {
+            "format_name": "matroska,webm",
+            "duration": "12.5",
+            "bit_rate": "900000",
+        },
+        "streams": [
+            {
+                "codec_type": "video",
+                "codec_name": "mpeg2video",
+                "width": 640,
+                "height": 360,
+                "avg_frame_rate": "30000/1001",
+            },
+            {
+                "codec_type": "audio",
+                "codec_name": "aac",
+                "bit_rate": "96000",
+                "channels": 2,
+            },
+        ],
+    }
+    summary = probe_summary(report, [0.0, 2.0, 4.0, 6.5])
+    assert summary["video"]["frame_rate"] == 29.97
+    assert summary["audio"]["codec"] == "aac"
+    assert summary["keyframe_interval"] == 2.0
+    layout = parse_layout(report)
+    assert copy_streams(layout, "mp4", False) == ["audio"]
+    assert copy_streams(layout, "m4a", True) == ["audio"]
+
+    response = client.post(
+        "/api/media/probe",
+        files={"file": ("audio.wav", make_wav_bytes(), "audio/wav")},
+    )
+    if not shutil.which("ffprobe"):
+        assert response.status_code == 501
+        return
+    assert response.status_code == 200
+    body = response.json()
+    assert body["video"] is None
+    assert body["audio"]["codec"] == "pcm_s16le"
+    assert body["remux_targets"] == ["wav"]
+
+
+def test_compress_to_target_size_uses_two_pass_bitrate():
+    total = size_bit_rate(10 * 1024 * 1024, 60.0)
+    assert total == int(10 * 1024 * 1024 * 8 * 0.98 / 60.0)
+    assert video_bit_rate(total, 128_000) == total - 128_000
+    with pytest.raises(ValueError):
+        video_bit_rate(100_000, 96_000)
+    fast = COMPRESS_PROFILES["fast"]
+    assert video_codec_args("mp4", fast)[-4:] == ["-preset", "veryfast", "-crf", "28"]
+    assert video_codec_args("webm", fast, 500_000)[-2:] == ["-b:v", "500000"]
+
+    audio_data = make_wav_bytes(duration=1.0)
+    both = client.post(
+        "/api/media/compress",
+        files={"file": ("audio.wav", audio_data, "audio/wav")},
+        data={"target_format": "mp3", "target_size_mb": "1", "bit_rate_kbps": "64"},
+    )
+    assert both.status_code == 400
+    unknown = client.post(
+        "/api/media/compress",
+        files={"file": ("audio.wav", audio_data, "audio/wav")},
+        data={"target_format": "mp3", "profile": "ultra"},
+    )
+    assert unknown.status_code == 400
+
+    response = client.post(
+        "/api/media/compress",
+        files={"file": ("audio.wav", audio_data, "audio/wav")},
+        data={"target_format": "mp3", "bit_rate_kbps": "64", "threads": "1"},
+    )
+    if shutil.which("ffmpeg"):
+        assert response.status_code == 200
+        assert response.headers["x-compress-mode"] == "bitrate"
+        assert response.headers["x-target-bit-rate"] == "64000"
+    else:
+        assert response.status_code == 501
+
+
+def test_segmented_transcode_splits_and_validates():
+    assert segment_times(30.0, 4) == [7.5, 15.0, 22.5]
+    listing = "piece-000.mkv,0.000000,8.000000\npiece-001.mkv,8.000000,30.000000\n"
+    assert parse_segment_list(listing) == [
+        ("piece-000.mkv", 0.0, 8.0),
+        ("piece-001.mkv", 8.0, 30.0),
+    ]
+
+    audio_data = make_wav_bytes()
+    for data in ({"segments": "0"}, {"segments": "4", "concurrency": "0"}):
+        invalid = client.post(
+            "/api/media/convert",
+            files={"file": ("audio.wav", audio_data, "audio/wav")},
+            data={"target_format": "mp4", **data},
+        )
+        assert invalid.status_code == 400
+
+    # Nothing to split without a video stream; the plain conversion runs.
+    response = client.post(
+        "/api/media/convert",
+        files={"file": ("audio.wav", audio_data, "audio/wav")},
+        data={"target_format": "mp3", "segments": "4"},
+    )
+    if shutil.which("ffmpeg"):
+        assert response.status_code == 200
+        assert "x-segment-timings" not in response.headers
+    else:
+        assert response.status_code == 501
+
+
+def test_media_package_renditions_and_expiring_store(tmp_path, monkeypatch):
+    layout = MediaLayout("mov,mp4", 30.0, "h264", "mp3", "yuv420p", None, 1280, 720)
+    renditions = plan_renditions(layout, [1080, 480, 240])
+    assert [rendition["height"] for rendition in renditions] == [480, 240]
+    args = package_args("ffmpeg", "in.mp4", "out", "dash", layout, renditions, False)
+    assert args[args.index("-filter_complex") + 1].startswith("[0:V:0]split=2")
+    assert args[args.index("-c:a") + 1] == "aac"
+    assert args[-1] == "out/manifest.mpd"
+    hls = package_args("ffmpeg", "in.mp4", "out", "hls", layout, renditions, False)
+    assert hls[hls.index("-var_stream_map") + 1] == (
+        "a:0,agroup:audio v:0,agroup:audio v:1,agroup:audio"
+    )
+
+    sizeless = MediaLayout("mpegts", 30.0, "h264", None)
+    with pytest.raises(ValueError):
+        plan_renditions(sizeless, [])
+
+    async def probe_without_size(context):
+        return sizeless
+
+    context = JobContext(
+        tmp_path / "in.ts", tmp_path, {"format": "hls", "renditions": []}
+    )
+    with monkeypatch.context() as patched, pytest.raises(HTTPException) as rejected:
+        patched.setattr(main_module, "_context_layout", probe_without_size)
+        asyncio.run(job_manager.operations["media.package"](context))
+    assert rejected.value.status_code == 400
+
+    store = PackageStore(tmp_path / "packages", ttl=60)
+    package_id, directory = store.create()
+    (directory / "master.m3u8").write_text("#EXTM3U\n")
+    assert store.file(package_id, "master.m3u8") is None
+    store.publish(directory, {"id": package_id})
+    assert (
+        store.file(package_id, "master.m3u8") == (directory / "master.m3u8").resolve()
+    )
+    assert store.file(package_id, "../" + package_id + "/package.json") is None
+    assert store.file("not-an-id", "master.m3u8") is None
+    store.ttl = 0
+    assert store.file(package_id, "master.m3u8") is None
+    assert not directory.exists()
+
+    invalid = client.post(
+        "/api/media/package",
+        files={"file": ("audio.wav", make_wav_bytes(), "audio/wav")},
+        data={"package_format": "smooth"},
+    )
+    assert invalid.status_code == 400
+    response = client.post(
+        "/api/media/package",
+        files={"file": ("audio.wav", make_wav_bytes(), "audio/wav")},
+        data={"package_format": "hls"},
+    )
+    if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+        assert response.status_code == 400
+        assert response.json()["detail"] == "No video stream to package."
+    else:
+        assert response.status_code == 501
+
+
+def test_ffmpeg_progress_is_streamed_as_events():
+    snapshots = []
+    progress = FfmpegProgress(snapshots.append)
+    progress.feed_stderr("  Duration: 00:00:10.00, start: 0.000000, bitrate: 1411 kb/s")
+    for line in ["frame=12", "out_time_us=2500000", "speed=2.5x", "progress=continue"]:
+        progress.feed_stdout(line)
+    assert snapshots[-1]["percent"] == 25.0
+    assert snapshots[-1]["eta_seconds"] == 3.0
+
+    audio_data = make_wav_bytes()
+    invalid = client.post(
+        "/api/media/trim",
+        files={"file": ("audio.wav", audio_data, "audio/wav")},
+        data={"start": "0", "end": "1", "progress_id": "../bad"},
+    )
+    assert invalid.status_code in (400, 501)
+
+    if not shutil.which("ffmpeg"):
+        return
+    response = client.post(
+        "/api/media/trim",
+        files={"file": ("audio.wav", audio_data, "audio/wav")},
+        data={
+            "start": "0",
+            "end": "0.05",
+            "target_format": "mp3",
+            "progress_id": "trim-progress-test",
+        },
+    )
+    assert response.status_code == 200
+    events = client.get("/api/progress/trim-progress-test")
+    assert events.headers["content-type"].startswith("text/event-stream")
+    last = [line for line in events.text.splitlines() if line.startswith("data: ")][-1]
+    assert '"status": "succeeded"' in last
+    assert '"done": true' in last
+
+
+def test_result_cache_serves_repeat_conversions(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "root", tmp_path / "cache")
+    monkeypatch.setattr(result_cache, "_size", None)
+    image_data = make_image_bytes()
+    first = client.post(
+        "/api/image/convert",
+        files={"file": ("sample.png", image_data, "image/png")},
+        data={"target_format": "webp"},
+    )
+    second = client.post(
+        "/api/image/convert",
+        files={"file": ("other.png", image_data, "image/png")},
+        data={"target_format": "webp"},
+    )
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert second.content == first.content
+    assert "other.webp" in second.headers["content-disposition"]
+
+    cache = ResultCache(tmp_path / "small", max_bytes=100, ttl=60)
+    for index in range(3):
+        cache.put_bytes(f"{index:02d}" * 32, b"x" * 40, "text/plain", "a.txt")
+        time.sleep(0.01)
+    assert cache.get("00" * 32) is None
+    assert cache.get("02" * 32) is not None
+
+    served = tmp_path / "served"
+    served.mkdir()
+    entry = cache.get("02" * 32, copy_to=served)
+    cache.max_bytes = 1
+    cache._evict()
+    assert cache.get("02" * 32) is None
+    assert entry.path.parent == served
+    assert entry.path.read_bytes() == b"x" * 40
+
+    cache.max_bytes = 100
+    for _ in range(3):
+        cache.put_bytes("03" * 32, b"y" * 30, "text/plain", "a.txt")
+    assert cache._size == cache._disk_size() == 30
+    assert list(cache.root.glob("*/*.tmp")) == []
+
+
+def test_run_command_times_out_and_kills_process():
+    sleep_bin = shutil.which("sleep")
+    if not sleep_bin:
+        pytest.skip("sleep binary not available")
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(run_command([sleep_bin, "5"], timeout=0.1))
+    assert excinfo.value.status_code == 504
+
+    result = asyncio.run(run_command([sleep_bin, "0"]))
+    assert result.returncode == 0
+
+
 def test_network_helpers_validation():
     response = client.get("/api/network/ip")
     assert response.status_code == 200